@@ -43,6 +43,10 @@ def create_app(config_class=Config):
     
     app.jinja_env.filters['b64encode'] = b64encode_filter
 
+    # 注册海报地址函数，模板中用 poster_src(movie) 生成带版本参数的海报 URL
+    from app.poster_store import poster_src
+    app.jinja_env.globals['poster_src'] = poster_src
+
     # 注册蓝图
     from app.routes.movie import movie_bp
     from app.routes.auth import auth_bp
@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import shutil
+import logging
+from datetime import datetime
+import numpy as np
+from scipy.sparse import csr_matrix
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# 每种模型保留的历史版本数，旧版本可能仍被其他进程映射，不立即删除
+ARTIFACT_KEEP_VERSIONS = 3
+# 检查 CURRENT 指针是否变化的最小间隔（秒）
+ARTIFACT_CHECK_INTERVAL = 30
+
+
+def csr_arrays(prefix, matrix):
+    """把 CSR 矩阵拆成三个数组，索引保持 scipy 使用的类型，加载时不会被复制"""
+    return {
+        f'{prefix}_data': matrix.data,
+        f'{prefix}_indices': matrix.indices,
+        f'{prefix}_indptr': matrix.indptr
+    }
+
+
+def csr_from_arrays(arrays, prefix, shape):
+    """由内存映射的三个数组重建 CSR 矩阵，不复制数据"""
+    return csr_matrix(
+        (arrays[f'{prefix}_data'], arrays[f'{prefix}_indices'], arrays[f'{prefix}_indptr']),
+        shape=tuple(shape)
+    )
+
+
+class ArtifactStore:
+    """推荐模型文件库
+
+    每个模型保存为 <root>/<name>/<version>/ 目录，每个数组是一个 .npy 文件，
+    其余信息写入 meta.json。读取时用 numpy 内存映射打开，多个 Web 进程共享同一份页缓存，
+    进程启动时也无需重新计算。<root>/<name>/CURRENT 记录当前版本，发布新版本时
+    先写好整个版本目录，再用 os.replace 原子替换 CURRENT，读进程不会看到写了一半的文件。
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _model_dir(self, name):
+        return os.path.join(self.root, name)
+
+    def publish(self, name, arrays, meta=None):
+        """写入新版本并切换为当前版本，返回版本号
+
+        Args:
+            name: 模型名称，如 'features'、'cf'、'als'
+            arrays: {数组名: numpy 数组}，不能包含 object 类型
+            meta: 可 JSON 序列化的附加信息
+        """
+        model_dir = self._model_dir(name)
+        os.makedirs(model_dir, exist_ok=True)
+        version = datetime.utcnow().strftime('%Y%m%d%H%M%S%f')
+
+        staging = os.path.join(model_dir, f'.{version}.tmp')
+        os.makedirs(staging)
+        for key, array in arrays.items():
+            np.save(os.path.join(staging, f'{key}.npy'), np.ascontiguousarray(array), allow_pickle=False)
+        with open(os.path.join(staging, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(dict(meta or {}, version=version, arrays=sorted(arrays)), f, ensure_ascii=False)
+        os.rename(staging, os.path.join(model_dir, version))
+
+        pointer = os.path.join(model_dir, f'.CURRENT.{version}')
+        with open(pointer, 'w') as f:
+            f.write(version)
+        os.replace(pointer, os.path.join(model_dir, 'CURRENT'))
+        logger.info(f"模型 {name} 已发布新版本 {version}")
+
+        self._prune(name)
+        return version
+
+    def _prune(self, name):
+        """删除较旧的版本，已映射这些文件的进程仍可继续读取直到重新加载"""
+        model_dir = self._model_dir(name)
+        versions = sorted(v for v in os.listdir(model_dir) if not v.startswith('.') and v != 'CURRENT')
+        for version in versions[:-ARTIFACT_KEEP_VERSIONS]:
+            shutil.rmtree(os.path.join(model_dir, version), ignore_errors=True)
+
+    def current_version(self, name):
+        """当前版本号，尚未发布过时返回 None"""
+        try:
+            with open(os.path.join(self._model_dir(name), 'CURRENT')) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def load(self, name, version=None):
+        """以内存映射方式打开指定版本（默认当前版本），返回 (数组字典, meta)；没有时返回 None"""
+        version = version or self.current_version(name)
+        if version is None:
+            return None
+        version_dir = os.path.join(self._model_dir(name), version)
+        with open(os.path.join(version_dir, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        arrays = {
+            key: np.load(os.path.join(version_dir, f'{key}.npy'), mmap_mode='r', allow_pickle=False)
+            for key in meta['arrays']
+        }
+        return arrays, meta
+
+
+class ArtifactReader:
+    """跟踪某个模型的当前版本，CURRENT 变化后自动加载新版本
+
+    Args:
+        store: ArtifactStore
+        name: 模型名称
+        factory: 由 (arrays, meta) 构造模型对象的函数
+    """
+
+    def __init__(self, store, name, factory, check_interval=ARTIFACT_CHECK_INTERVAL):
+        self.store = store
+        self.name = name
+        self.factory = factory
+        self.check_interval = check_interval
+        self.version = None
+        self.value = None
+        self.checked_at = 0
+
+    def get(self):
+        """返回当前版本的模型对象，尚未发布过时返回 None"""
+        now = time.time()
+        if now - self.checked_at < self.check_interval:
+            return self.value
+        self.checked_at = now
+
+        version = self.store.current_version(self.name)
+        if version is None or version == self.version:
+            return self.value
+        try:
+            loaded = self.store.load(self.name, version)
+            self.value = self.factory(*loaded)
+            self.version = version
+            logger.info(f"已加载模型 {self.name} 版本 {version}")
+        except Exception as e:
+            # 加载失败时继续使用旧版本
+            logger.error(f"加载模型 {self.name} 版本 {version} 失败: {str(e)}")
+        return self.value
+
+
+def get_artifact_store():
+    """应用配置的模型文件库，默认位于 instance/artifacts"""
+    root = current_app.config.get('ARTIFACT_DIR', os.path.join(current_app.instance_path, 'artifacts'))
+    return ArtifactStore(root)
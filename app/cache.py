@@ -0,0 +1,209 @@
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from flask import current_app
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# 推荐结果的默认缓存条数和有效期（秒）
+CACHE_MAX_ENTRIES = 10000
+CACHE_TTL = 600
+
+# 缓存的推荐类型；similar 按电影缓存，其余按用户缓存，用户评分或收藏变化时失效
+SIMILAR = 'similar'
+FAVORITE_TYPE = 'favorite_type'
+PERSONALIZED = 'personalized'
+USER_KINDS = (FAVORITE_TYPE, PERSONALIZED)
+
+
+class MemoryBackend:
+    """进程内缓存，按最近使用顺序淘汰，条目超过有效期后失效"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self.entries[key]
+                self.expirations += 1
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, keys):
+        with self.lock:
+            return sum(self.entries.pop(key, None) is not None for key in keys)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        return {
+            'backend': 'memory',
+            'size': len(self.entries),
+            'max_entries': self.max_entries,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+
+class RedisBackend:
+    """Redis 缓存，多个进程共享；兼容 Redis 协议的服务（如 KeyDB、本地 fakeredis）均可使用
+
+    容量由服务端的 maxmemory 和淘汰策略控制，淘汰次数读取 INFO 中的 evicted_keys。
+    """
+
+    def __init__(self, client, ttl=CACHE_TTL, prefix='rec:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url, ttl=CACHE_TTL):
+        if redis is None:
+            raise RuntimeError('使用 Redis 缓存需要安装 redis 包')
+        return cls(redis.Redis.from_url(url), ttl=ttl)
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value):
+        self.client.setex(self.prefix + key, self.ttl, json.dumps(value, ensure_ascii=False))
+
+    def delete(self, keys):
+        keys = [self.prefix + key for key in keys]
+        return self.client.delete(*keys) if keys else 0
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self):
+        stats = {'backend': 'redis', 'ttl': self.ttl}
+        try:
+            info = self.client.info()
+            stats['evictions'] = info.get('evicted_keys', 0)
+            stats['expirations'] = info.get('expired_keys', 0)
+        except Exception as e:
+            logger.warning(f"读取 Redis 统计信息失败: {str(e)}")
+        return stats
+
+
+class RecommendationCache:
+    """推荐结果缓存
+
+    键为 推荐类型 + 用户ID（或电影ID），值为可 JSON 序列化的推荐结果。
+    缓存后端出错时不影响推荐，直接重新计算。
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _key(kind, subject_id):
+        return f'{kind}:{subject_id}'
+
+    def get_or_compute(self, kind, subject_id, compute):
+        """读取缓存，未命中时调用 compute() 计算并写入缓存"""
+        key = self._key(kind, subject_id)
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"读取推荐缓存失败: {str(e)}")
+            value = None
+
+        with self.lock:
+            if value is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if value is not None:
+            return value
+
+        value = compute()
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            logger.warning(f"写入推荐缓存失败: {str(e)}")
+        return value
+
+    def invalidate_user(self, user_id):
+        """用户的评分或收藏发生变化后，清除该用户的全部推荐结果"""
+        try:
+            removed = self.backend.delete([self._key(kind, user_id) for kind in USER_KINDS])
+        except Exception as e:
+            logger.warning(f"清除用户 {user_id} 的推荐缓存失败: {str(e)}")
+            return 0
+        with self.lock:
+            self.invalidations += 1
+        return removed
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return dict(
+            self.backend.stats(),
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=round(self.hits / lookups, 4) if lookups else 0,
+            invalidations=self.invalidations
+        )
+
+
+def create_recommendation_cache(config):
+    """根据配置创建推荐缓存
+
+    RECOMMENDATION_CACHE_BACKEND: 'memory'（默认）或 'redis'
+    RECOMMENDATION_CACHE_URL: Redis 地址，如 redis://localhost:6379/0
+    RECOMMENDATION_CACHE_SIZE / RECOMMENDATION_CACHE_TTL: 进程内缓存条数和有效期（秒）
+    """
+    ttl = config.get('RECOMMENDATION_CACHE_TTL', CACHE_TTL)
+    if config.get('RECOMMENDATION_CACHE_BACKEND', 'memory') == 'redis':
+        try:
+            return RecommendationCache(RedisBackend.from_url(
+                config.get('RECOMMENDATION_CACHE_URL', 'redis://localhost:6379/0'), ttl=ttl))
+        except Exception as e:
+            logger.error(f"创建 Redis 推荐缓存失败，改用进程内缓存: {str(e)}")
+    return RecommendationCache(MemoryBackend(
+        max_entries=config.get('RECOMMENDATION_CACHE_SIZE', CACHE_MAX_ENTRIES), ttl=ttl))
+
+
+def get_recommendation_cache():
+    """获取当前应用的推荐缓存实例"""
+    if not hasattr(current_app, 'recommendation_cache'):
+        current_app.recommendation_cache = create_recommendation_cache(current_app.config)
+    return current_app.recommendation_cache
@@ -0,0 +1,168 @@
+import time
+import logging
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+from sqlalchemy import func
+from app.models import Rating, Favorite, db
+from app.artifacts import csr_arrays, csr_from_arrays
+
+logger = logging.getLogger(__name__)
+
+# 每部电影保留的相似电影数量
+CF_NEIGHBORS = 50
+# 收藏作为隐式反馈的权重，与评分累加
+FAVORITE_WEIGHT = 3.0
+
+
+def load_interactions(before=None, include_favorites=True):
+    """从数据库读取 (用户, 电影, 权重) 三元组
+
+    Args:
+        before: 只读取该时间之前的评分和收藏，用于离线评估
+        include_favorites: 是否包含收藏记录，为 False 时只读取评分
+
+    Returns:
+        (user_ids, movie_ids, values) 三个等长数组，同一用户对同一电影的评分和收藏已合并
+    """
+    rating_query = db.session.query(Rating.user_id, Rating.movie_id, Rating.rating)
+    favorite_query = db.session.query(Favorite.user_id, Favorite.movie_id)
+    if before is not None:
+        rating_query = rating_query.filter(Rating.created_at < before)
+        favorite_query = favorite_query.filter(Favorite.created_at < before)
+
+    ratings = np.array(rating_query.all(), dtype=np.float64).reshape(-1, 3)
+    favorites = np.array(favorite_query.all() if include_favorites else [], dtype=np.float64).reshape(-1, 2)
+    user_ids = np.concatenate([ratings[:, 0], favorites[:, 0]]).astype(np.int64)
+    movie_ids = np.concatenate([ratings[:, 1], favorites[:, 1]]).astype(np.int64)
+    values = np.concatenate([ratings[:, 2], np.full(len(favorites), FAVORITE_WEIGHT)])
+    return user_ids, movie_ids, values
+
+
+def interactions_version():
+    """评分和收藏数据的版本标识，用于判断模型是否需要重新训练"""
+    rating_version = db.session.query(func.count(Rating.id), func.max(Rating.id)).one()
+    favorite_version = db.session.query(func.count(Favorite.id), func.max(Favorite.id)).one()
+    return tuple(rating_version) + tuple(favorite_version)
+
+
+class ItemBasedCF:
+    """基于物品的协同过滤
+
+    用户×电影 的评分矩阵以 CSR 稀疏矩阵保存，电影之间的余弦相似度分块计算，
+    每部电影只保留最相似的 neighbors 部，推荐时只需一次稀疏矩阵与向量的乘法。
+    """
+
+    def __init__(self, neighbors=CF_NEIGHBORS):
+        self.neighbors = neighbors
+        self.movie_ids = np.empty(0, dtype=np.int64)
+        self.movie_index = {}
+        self.similarity = csr_matrix((0, 0), dtype=np.float32)
+        self.version = None
+        self.trained_at = None
+
+    @classmethod
+    def from_database(cls, neighbors=CF_NEIGHBORS):
+        model = cls(neighbors=neighbors)
+        model.version = interactions_version()
+        model.fit(*load_interactions())
+        return model
+
+    def to_artifact(self):
+        """转换为 (数组字典, meta)，用于 ArtifactStore.publish"""
+        arrays = dict(movie_ids=self.movie_ids, **csr_arrays('similarity', self.similarity))
+        meta = {'neighbors': self.neighbors, 'data_version': list(self.version or ()), 'trained_at': self.trained_at}
+        return arrays, meta
+
+    @classmethod
+    def from_artifact(cls, arrays, meta):
+        """由内存映射的数组构建模型，相似度矩阵不复制，多个进程共享"""
+        model = cls(neighbors=meta['neighbors'])
+        model.movie_ids = arrays['movie_ids']
+        model.movie_index = {int(movie_id): i for i, movie_id in enumerate(model.movie_ids)}
+        model.similarity = csr_from_arrays(arrays, 'similarity', (len(model.movie_ids), len(model.movie_ids)))
+        model.version = tuple(meta['data_version'])
+        model.trained_at = meta['trained_at']
+        return model
+
+    def fit(self, user_ids, movie_ids, values, block_size=256):
+        """训练模型
+
+        Args:
+            user_ids, movie_ids, values: 等长数组，同一 (用户, 电影) 出现多次时权重相加
+        """
+        start = time.perf_counter()
+        users, user_positions = np.unique(user_ids, return_inverse=True)
+        self.movie_ids, movie_positions = np.unique(movie_ids, return_inverse=True)
+        self.movie_index = {int(movie_id): i for i, movie_id in enumerate(self.movie_ids)}
+
+        # 用户×电影 矩阵，按列归一化后电影之间的内积即为余弦相似度
+        matrix = csr_matrix(
+            (np.asarray(values, dtype=np.float32), (user_positions, movie_positions)),
+            shape=(len(users), len(self.movie_ids))
+        )
+        item_matrix = normalize(matrix.T.tocsr(), norm='l2', axis=1)
+        user_matrix = item_matrix.T.tocsr()
+
+        data, indices, indptr = [], [], [0]
+        for block_start in range(0, len(self.movie_ids), block_size):
+            block_end = min(block_start + block_size, len(self.movie_ids))
+            block = (item_matrix[block_start:block_end] @ user_matrix).tocsr()
+            for offset in range(block_end - block_start):
+                row_start, row_end = block.indptr[offset], block.indptr[offset + 1]
+                row_indices = block.indices[row_start:row_end]
+                row_data = block.data[row_start:row_end]
+                keep = (row_indices != block_start + offset) & (row_data > 0)
+                row_indices, row_data = row_indices[keep], row_data[keep]
+                if len(row_data) > self.neighbors:
+                    top = np.argpartition(-row_data, self.neighbors - 1)[:self.neighbors]
+                    row_indices, row_data = row_indices[top], row_data[top]
+                indices.append(row_indices)
+                data.append(row_data)
+                indptr.append(indptr[-1] + len(row_data))
+
+        self.similarity = csr_matrix(
+            (
+                np.concatenate(data).astype(np.float32) if data else np.empty(0, dtype=np.float32),
+                np.concatenate(indices).astype(np.int32) if indices else np.empty(0, dtype=np.int32),
+                np.asarray(indptr, dtype=np.int64)
+            ),
+            shape=(len(self.movie_ids), len(self.movie_ids))
+        )
+        self.trained_at = time.time()
+        logger.info(
+            f"协同过滤模型训练完成: {len(users)} 个用户, {len(self.movie_ids)} 部电影, "
+            f"{matrix.nnz} 条记录, 耗时 {time.perf_counter() - start:.1f}s"
+        )
+        return self
+
+    def recommend(self, movie_ids, values, limit=12, exclude=()):
+        """推荐得分最高的 limit 部电影，返回 [(电影ID, 得分), ...]
+
+        得分只在用户交互过的电影的相似列表中产生，结果保持稀疏，不扫描全部电影。
+        """
+        positions, weights = [], []
+        for movie_id, value in zip(movie_ids, values):
+            position = self.movie_index.get(int(movie_id))
+            if position is not None:
+                positions.append(position)
+                weights.append(value)
+        if not positions:
+            return []
+
+        user_vector = csr_matrix(
+            (np.asarray(weights, dtype=np.float32), (np.zeros(len(positions), dtype=np.int32), positions)),
+            shape=(1, len(self.movie_ids))
+        )
+        result = (user_vector @ self.similarity).tocsr()
+        result.sort_indices()
+        candidates, scores = result.indices, result.data
+
+        excluded = [self.movie_index[m] for m in set(movie_ids) | set(exclude) if m in self.movie_index]
+        keep = (scores > 0) & ~np.isin(candidates, excluded)
+        candidates, scores = candidates[keep], scores[keep]
+        if len(candidates) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            candidates, scores = candidates[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+        return [(int(self.movie_ids[i]), float(score)) for i, score in zip(candidates[order], scores[order])]
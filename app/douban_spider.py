@@ -10,6 +10,12 @@ import time
 import random
 from fake_useragent import UserAgent
 from app.models import Movie, MovieType, db
+from app.neighbor_index import MovieNeighborIndex
+from app.poster_store import store_poster
+from app.reference_data import get_movie_type_catalog
+from app.search_index import get_movie_search
+from app.typeahead import get_movie_typeahead
+from app.people import parse_credits, set_movie_people
 import json
 import logging
 import re
@@ -116,6 +122,9 @@ class DoubanSpider:
         
         # 初始化计数器
         self.total_movies = 0
+
+        # 相似电影索引，首次保存新电影时创建
+        self.neighbor_index = None
         
         # 代理池配置
         self.proxy_pool = []
@@ -588,12 +597,8 @@ class DoubanSpider:
                         continue
                         
                     # 确保MovieType存在
-                    movie_type = MovieType.query.filter_by(name=type_info['name']).first()
-                    if not movie_type:
-                        movie_type = MovieType(name=type_info['name'])
-                        db.session.add(movie_type)
-                        db.session.commit()
-                        logger.info(f"创建新的电影类型: {type_info['name']}")
+                    movie_type = get_movie_type_catalog().instance(type_info['name'])
+                    db.session.commit()
 
                     for movie_data in movies:
                         try:
@@ -626,10 +631,10 @@ class DoubanSpider:
                                 rating_count=movie_detail.get('rating_count'),
                                 summary=movie_detail.get('summary', ''),
                                 poster_url=movie_detail.get('poster_url'),
-                                poster_data=movie_detail.get('poster_data'),
-                                poster_mimetype=movie_detail.get('poster_mimetype'),
                                 tags=movie_detail.get('tags', '')
                             )
+                            store_poster(new_movie, movie_detail.get('poster_data'), movie_detail.get('poster_mimetype'))
+                            set_movie_people(new_movie, parse_credits(movie_detail))
                             
                             # 关联电影类型
                             new_movie.types.append(movie_type)
@@ -639,6 +644,7 @@ class DoubanSpider:
                             db.session.commit()
                             total_movies += 1
                             logger.info(f"成功添加电影: {new_movie.title}")
+                            self._index_movie(new_movie.id)
                             
                         except Exception as e:
                             logger.error(f"保存电影 {movie_data.get('title', 'Unknown')} 时出错: {str(e)}")
@@ -828,15 +834,16 @@ class DoubanSpider:
                         rating_count=movie_detail.get('rating_count'),
                         summary=movie_detail.get('summary', ''),
                         poster_url=movie_detail.get('poster_url'),
-                        poster_data=movie_detail.get('poster_data'),
-                        poster_mimetype=movie_detail.get('poster_mimetype'),
                         tags=movie_detail.get('tags', '')
                     )
+                    store_poster(new_movie, movie_detail.get('poster_data'), movie_detail.get('poster_mimetype'))
+                    set_movie_people(new_movie, parse_credits(movie_detail))
 
                     db.session.add(new_movie)
                     db.session.commit()
                     saved_count += 1
                     logger.info(f"Successfully saved movie: {movie_detail['title']}")
+                    self._index_movie(new_movie.id)
 
                 except Exception as e:
                     logger.error(f"Error saving movie: {str(e)}")
@@ -905,15 +912,16 @@ class DoubanSpider:
                                 rating_count=movie_detail.get('rating_count'),
                                 summary=movie_detail.get('summary', ''),
                                 poster_url=movie_detail.get('poster_url'),
-                                poster_data=movie_detail.get('poster_data'),
-                                poster_mimetype=movie_detail.get('poster_mimetype'),
                                 tags=movie_detail.get('tags', '')
                             )
+                            store_poster(new_movie, movie_detail.get('poster_data'), movie_detail.get('poster_mimetype'))
+                            set_movie_people(new_movie, parse_credits(movie_detail))
                             
                             db.session.add(new_movie)
                             db.session.commit()
                             total_movies += 1
                             logger.info(f"Successfully added movie: {movie_detail['title']}")
+                            self._index_movie(new_movie.id)
                             
                         except Exception as e:
                             logger.error(f"Error saving movie {movie_id} to database: {str(e)}")
@@ -1104,30 +1112,27 @@ class DoubanSpider:
                 poster_url=movie_data.get('poster_url')
             )
 
-            # 处理海报数据
-            if movie_data.get('poster_data'):
-                movie.poster_data = movie_data['poster_data']
+            # 处理海报数据，写入海报文件库
+            store_poster(movie, movie_data.get('poster_data'), movie_data.get('poster_mimetype'))
+            # 导演、编剧、演员写入人物表
+            set_movie_people(movie, parse_credits(movie_data))
 
             # 处理电影类型
             if movie_data.get('types'):
                 for type_name in movie_data['types']:
-                    movie_type = MovieType.query.filter_by(name=type_name).first()
-                    if not movie_type:
-                        logger.info(f"创建新的电影类型: {type_name}")
-                        movie_type = MovieType(name=type_name)
-                        db.session.add(movie_type)
-                        try:
-                            db.session.flush()
-                        except SQLAlchemyError as e:
-                            logger.error(f"创建电影类型时出错: {str(e)}")
-                            db.session.rollback()
-                            continue
+                    try:
+                        movie_type = get_movie_type_catalog().instance(type_name)
+                    except SQLAlchemyError as e:
+                        logger.error(f"创建电影类型时出错: {str(e)}")
+                        continue
                     movie.types.append(movie_type)
 
             # 保存电影
             db.session.add(movie)
             db.session.commit()
             logger.info(f"成功保存电影: {movie.title}")
+
+            self._index_movie(movie.id)
             return movie
 
         except SQLAlchemyError as e:
@@ -1135,6 +1140,30 @@ class DoubanSpider:
             db.session.rollback()
             return None
 
+    def _index_movie(self, movie_id):
+        """新电影提交后更新相似电影索引和搜索索引，每个保存电影的入口都要调用"""
+        self._update_neighbor_index(movie_id)
+        self._update_search_index(movie_id)
+
+    def _update_neighbor_index(self, movie_id):
+        """新电影入库后增量更新相似电影索引，失败不影响爬取"""
+        try:
+            if self.neighbor_index is None:
+                self.neighbor_index = MovieNeighborIndex()
+            self.neighbor_index.add_movie(movie_id)
+        except Exception as e:
+            logger.warning(f"更新相似电影索引时出错: {str(e)}")
+            db.session.rollback()
+
+    def _update_search_index(self, movie_id):
+        """新电影入库后加入本进程的搜索和自动补全索引，其他进程在下次检查时追加"""
+        try:
+            get_movie_search().movie_saved(movie_id)
+            get_movie_typeahead().movie_saved(movie_id)
+        except Exception as e:
+            logger.warning(f"更新搜索索引时出错: {str(e)}")
+            db.session.rollback()
+
     def crawl_single_type(self, type_name):
         """爬取指定类型的电影"""
         if type_name not in MOVIE_TYPES:
@@ -1146,11 +1175,8 @@ class DoubanSpider:
         
         try:
             # 获取或创建电影类型对象
-            movie_type = MovieType.query.filter_by(name=type_name).first()
-            if not movie_type:
-                movie_type = MovieType(name=type_name)
-                db.session.add(movie_type)
-                db.session.commit()
+            movie_type = get_movie_type_catalog().instance(type_name)
+            db.session.commit()
 
             # 访问页面
             logger.info(f"正在访问页面: {url}")
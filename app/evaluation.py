@@ -0,0 +1,245 @@
+import time
+import math
+import logging
+import tracemalloc
+from collections import defaultdict
+import numpy as np
+from app.models import Movie, Rating, Favorite, db
+from app.recommender import MovieRecommender
+from app.collaborative import ItemBasedCF, FAVORITE_WEIGHT
+from app.als import ALSModel
+from app.hybrid import GenrePopularity
+
+logger = logging.getLogger(__name__)
+
+# 评估时的默认参数
+EVAL_K = 10
+EVAL_TEST_FRACTION = 0.2
+EVAL_MAX_USERS = 500
+# 测试集中评分不低于该值（或收藏）的电影视为用户喜欢的电影
+EVAL_RELEVANT_RATING = 4
+# 统计推荐阶段峰值内存时使用的用户数，tracemalloc 会拖慢运行，不参与延迟统计
+EVAL_MEMORY_USERS = 50
+
+
+class EvaluationRecommender(MovieRecommender):
+    """只使用训练集数据的推荐器
+
+    用户画像、收藏和协同过滤/ALS 模型都由切分时间之前的评分和收藏构建，
+    电影特征和相似电影索引只依赖电影本身的信息，继续从数据库读取。
+    """
+
+    def __init__(self, split):
+        super().__init__()
+        self.split = split
+        self.eval_als_model = None
+
+    def get_user_profile(self, user_id):
+        return self.split.profiles.get(user_id, ([], []))
+
+    def get_user_favorites(self, user_id):
+        return self.split.favorites.get(user_id, [])
+
+    def get_cf_model(self):
+        if self.cf_model is None:
+            self.cf_model = ItemBasedCF().fit(*self.split.interactions)
+        return self.cf_model
+
+    def get_als_model(self):
+        if self.eval_als_model is None:
+            self.eval_als_model = ALSModel().fit(*self.split.interactions)
+        return self.eval_als_model
+
+
+class TemporalSplit:
+    """按评分时间切分训练集和测试集
+
+    Rating.created_at 最晚的 test_fraction 比例的评分作为测试集，其余评分和
+    切分时间之前的收藏作为训练集。只评估训练集和测试集中都有记录的用户。
+    """
+
+    def __init__(self, test_fraction=EVAL_TEST_FRACTION, relevant_rating=EVAL_RELEVANT_RATING):
+        total = db.session.query(Rating.id).count()
+        if total == 0:
+            raise ValueError('没有评分记录，无法评估')
+        self.cutoff = db.session.query(Rating.created_at).order_by(
+            Rating.created_at, Rating.id
+        ).offset(int(total * (1 - test_fraction))).limit(1).scalar()
+        if self.cutoff is None:
+            raise ValueError('测试集为空，请调大 test_fraction')
+
+        self.profiles = defaultdict(lambda: ([], []))
+        self.favorites = defaultdict(list)
+        user_ids, movie_ids, values = [], [], []
+        for user_id, movie_id, rating in db.session.query(
+                Rating.user_id, Rating.movie_id, Rating.rating).filter(Rating.created_at < self.cutoff):
+            self.profiles[user_id][0].append(movie_id)
+            self.profiles[user_id][1].append(rating)
+            user_ids.append(user_id)
+            movie_ids.append(movie_id)
+            values.append(rating)
+        for user_id, movie_id in db.session.query(
+                Favorite.user_id, Favorite.movie_id).filter(Favorite.created_at < self.cutoff).order_by(Favorite.id):
+            self.profiles[user_id][0].append(movie_id)
+            self.profiles[user_id][1].append(FAVORITE_WEIGHT)
+            self.favorites[user_id].append(movie_id)
+            user_ids.append(user_id)
+            movie_ids.append(movie_id)
+            values.append(FAVORITE_WEIGHT)
+        self.interactions = (
+            np.asarray(user_ids, dtype=np.int64),
+            np.asarray(movie_ids, dtype=np.int64),
+            np.asarray(values, dtype=np.float64)
+        )
+
+        self.relevant = defaultdict(set)
+        for user_id, movie_id in db.session.query(Rating.user_id, Rating.movie_id).filter(
+                Rating.created_at >= self.cutoff, Rating.rating >= relevant_rating):
+            self.relevant[user_id].add(movie_id)
+        for user_id, movie_id in db.session.query(Favorite.user_id, Favorite.movie_id).filter(
+                Favorite.created_at >= self.cutoff):
+            self.relevant[user_id].add(movie_id)
+        # 测试集中出现但训练集中已交互过的电影不可能被推荐，不计入
+        for user_id, movies in self.relevant.items():
+            movies.difference_update(self.profiles[user_id][0] if user_id in self.profiles else ())
+
+        self.users = sorted(
+            user_id for user_id, movies in self.relevant.items() if movies and user_id in self.profiles
+        )
+
+
+def _content_strategy(recommender, user_id, k):
+    movie_ids, _ = recommender.get_user_profile(user_id)
+    store = recommender.get_feature_store()
+    profile = [store.index[movie_id] for movie_id in movie_ids if movie_id in store.index]
+    if not profile:
+        return []
+    candidates, _, _ = recommender.rank_by_profile(store, sorted(set(profile)), k)
+    return [int(store.movie_ids[i]) for i in candidates]
+
+
+def _favorite_type_strategy(recommender, user_id, k):
+    return [rec['movie'].id for rec in recommender.get_favorite_type_recommendations(user_id, limit=k)]
+
+
+def _cf_strategy(recommender, user_id, k):
+    return [movie['id'] for movie in recommender.get_personalized_recommendations(user_id, limit=k)]
+
+
+def _als_strategy(recommender, user_id, k):
+    return [movie['id'] for movie in recommender.get_als_recommendations(user_id, limit=k)]
+
+
+def _hybrid_strategy(recommender, user_id, k):
+    return [movie['id'] for movie in recommender.get_hybrid_recommendations(user_id, limit=k)]
+
+
+def _prepare_hybrid(recommender):
+    # 离线评估时没有发布的类型热门榜就在这里构建
+    if recommender.get_genre_popularity() is None:
+        recommender.genre_popularity = GenrePopularity.build()
+    return recommender.get_cf_model(), recommender.get_genre_popularity()
+
+
+# 策略名称 -> (推荐函数, 预先构建模型的函数)
+STRATEGIES = {
+    'content': (_content_strategy, lambda r: r.get_feature_store()),
+    'favorite_type': (_favorite_type_strategy, lambda r: r.get_feature_store()),
+    'cf': (_cf_strategy, lambda r: r.get_cf_model()),
+    'als': (_als_strategy, lambda r: r.get_als_model()),
+    'hybrid': (_hybrid_strategy, _prepare_hybrid)
+}
+
+
+def ranking_metrics(recommended, relevant, k):
+    """单个用户的 precision@K、recall@K 和 NDCG@K"""
+    recommended = recommended[:k]
+    hits = [1 if movie_id in relevant else 0 for movie_id in recommended]
+    dcg = sum(hit / math.log2(rank + 2) for rank, hit in enumerate(hits))
+    ideal = sum(1 / math.log2(rank + 2) for rank in range(min(len(relevant), k)))
+    return {
+        'precision': sum(hits) / k,
+        'recall': sum(hits) / len(relevant) if relevant else 0,
+        'ndcg': dcg / ideal if ideal else 0
+    }
+
+
+def _measure(func):
+    """执行 func，返回 (结果, 耗时秒数, tracemalloc 峰值 MB)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = func()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+
+def evaluate_strategy(name, split, k=EVAL_K, users=None, memory_users=EVAL_MEMORY_USERS):
+    """评估单个推荐策略，返回指标字典"""
+    recommend, prepare = STRATEGIES[name]
+    users = split.users if users is None else users
+    recommender = EvaluationRecommender(split)
+
+    _, fit_seconds, fit_peak = _measure(lambda: prepare(recommender))
+
+    totals = defaultdict(float)
+    latencies = []
+    recommended_movies = set()
+    for user_id in users:
+        start = time.perf_counter()
+        try:
+            recommended = recommend(recommender, user_id, k)
+        except Exception as e:
+            logger.error(f"策略 {name} 为用户 {user_id} 推荐失败: {str(e)}")
+            recommended = []
+        latencies.append((time.perf_counter() - start) * 1000)
+        recommended_movies.update(recommended)
+        for metric, value in ranking_metrics(recommended, split.relevant[user_id], k).items():
+            totals[metric] += value
+
+    _, _, serve_peak = _measure(lambda: [recommend(recommender, user_id, k) for user_id in users[:memory_users]])
+
+    catalog_size = db.session.query(Movie.id).count()
+    count = len(users) or 1
+    return {
+        'strategy': name,
+        'users': len(users),
+        f'precision@{k}': round(totals['precision'] / count, 4),
+        f'recall@{k}': round(totals['recall'] / count, 4),
+        f'ndcg@{k}': round(totals['ndcg'] / count, 4),
+        'coverage': round(len(recommended_movies) / catalog_size, 4) if catalog_size else 0,
+        'p50_ms': round(float(np.percentile(latencies, 50)), 2) if latencies else 0,
+        'p95_ms': round(float(np.percentile(latencies, 95)), 2) if latencies else 0,
+        'fit_seconds': round(fit_seconds, 2),
+        'fit_peak_mb': round(fit_peak, 1),
+        'serve_peak_mb': round(serve_peak, 1)
+    }
+
+
+def evaluate(strategies=None, k=EVAL_K, test_fraction=EVAL_TEST_FRACTION, max_users=EVAL_MAX_USERS,
+             relevant_rating=EVAL_RELEVANT_RATING, seed=0):
+    """按时间切分数据集并依次评估各推荐策略
+
+    Returns:
+        (切分信息, [各策略的指标字典])
+    """
+    split = TemporalSplit(test_fraction=test_fraction, relevant_rating=relevant_rating)
+    users = split.users
+    if max_users and len(users) > max_users:
+        users = sorted(np.random.default_rng(seed).choice(users, max_users, replace=False).tolist())
+    info = {
+        'cutoff': split.cutoff.isoformat(),
+        'train_interactions': len(split.interactions[0]),
+        'eligible_users': len(split.users),
+        'evaluated_users': len(users)
+    }
+    logger.info(f"评估数据集: {info}")
+
+    results = []
+    for name in strategies or STRATEGIES:
+        logger.info(f"正在评估策略 {name}")
+        results.append(evaluate_strategy(name, split, k=k, users=users))
+    return info, results
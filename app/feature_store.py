@@ -0,0 +1,342 @@
+import time
+import logging
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+from sqlalchemy import func
+from app.models import Movie, MovieType, movie_type_association, db
+from app.artifacts import csr_arrays, csr_from_arrays
+
+logger = logging.getLogger(__name__)
+
+# 各维度权重，与 MovieRecommender.calculate_similarity 保持一致
+SIMILARITY_WEIGHTS = {
+    'type': 0.35,
+    'year': 0.20,
+    'rating': 0.20,
+    'duration': 0.15,
+    'language': 0.10
+}
+
+# 数值特征差距达到该值时相似度为0
+YEAR_SCALE = 50
+RATING_SCALE = 10
+DURATION_SCALE = 180
+
+
+def load_movie_summaries(movie_ids):
+    """批量读取电影的基本信息和类型，返回 {电影ID: 信息字典}，格式与 movie_summary 相同"""
+    summaries = {
+        row.id: {'id': row.id, 'title': row.title, 'year': row.year, 'rating': row.rating, 'types': []}
+        for row in db.session.query(
+            Movie.id, Movie.title, Movie.year, Movie.rating
+        ).filter(Movie.id.in_(movie_ids))
+    }
+    if summaries:
+        for movie_id, type_name in db.session.query(
+            movie_type_association.c.movie_id, MovieType.name
+        ).join(
+            MovieType, MovieType.id == movie_type_association.c.type_id
+        ).filter(movie_type_association.c.movie_id.in_(list(summaries))):
+            summaries[movie_id]['types'].append(type_name)
+    return summaries
+
+
+def _jaccard(intersection, size_a, size_b):
+    """根据交集大小和集合大小计算 Jaccard 相似度（百分制）"""
+    union = size_a + size_b - intersection
+    valid = (size_a > 0) & (size_b > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = np.where(valid, intersection / np.where(union > 0, union, 1) * 100, 0.0)
+    return score
+
+
+def _closeness(values_a, values_b, scale):
+    """数值特征的接近程度（百分制），任一方缺失时为0"""
+    valid = (values_a > 0) & (values_b > 0)
+    score = np.maximum(0.0, 1 - np.abs(values_a - values_b) / scale) * 100
+    return np.where(valid, score, 0.0)
+
+
+class MovieFeatureStore:
+    """电影特征库
+
+    一次性从数据库读取轻量列，构建类型/语言多热矩阵和年份、评分、时长向量，
+    之后的相似度计算全部是批量的矩阵运算，不再逐部电影加载 ORM 对象。
+    特征库构建完成后不再修改，数据变化时 refresh() 返回新的实例。
+    """
+
+    def __init__(self, movie_ids, titles, years, ratings, runtimes,
+                 type_matrix, type_names, type_positions, language_matrix, language_vocab):
+        self.movie_ids = movie_ids
+        self.titles = titles
+        self.years = years
+        self.ratings = ratings
+        self.runtimes = runtimes
+        self.type_matrix = type_matrix
+        self.type_names = type_names
+        self.type_positions = type_positions
+        self.language_matrix = language_matrix
+        self.language_vocab = language_vocab
+
+        self.index = {int(movie_id): i for i, movie_id in enumerate(movie_ids)}
+        self.type_counts = np.asarray(type_matrix.sum(axis=1)).ravel()
+        self.language_counts = np.asarray(language_matrix.sum(axis=1)).ravel()
+        # 计算时缺失值按0处理，与原逐对计算中"值为空则相似度为0"一致
+        self._year_values = np.nan_to_num(years)
+        self._rating_values = np.nan_to_num(ratings)
+        self._runtime_values = np.nan_to_num(runtimes)
+
+        self.built_at = time.time()
+        self.checked_at = self.built_at
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    @property
+    def max_movie_id(self):
+        return int(self.movie_ids.max()) if len(self.movie_ids) else 0
+
+    @classmethod
+    def load(cls):
+        """从数据库构建特征库"""
+        start = time.perf_counter()
+        type_rows = db.session.query(MovieType.id, MovieType.name).order_by(MovieType.id).all()
+        type_names = [row.name for row in type_rows]
+        type_positions = {row.id: i for i, row in enumerate(type_rows)}
+
+        store = cls._build(cls._query_movies(), cls._query_types(), type_names, type_positions, {})
+        logger.info(f"电影特征库构建完成: {len(store)} 部电影, 耗时 {time.perf_counter() - start:.3f}s")
+        return store
+
+    def to_artifact(self):
+        """转换为 (数组字典, meta)，用于 ArtifactStore.publish"""
+        arrays = dict(
+            movie_ids=self.movie_ids,
+            titles=np.array(self.titles, dtype=str),
+            years=self.years,
+            ratings=self.ratings,
+            runtimes=self.runtimes,
+            **csr_arrays('types', self.type_matrix),
+            **csr_arrays('languages', self.language_matrix)
+        )
+        meta = {
+            'type_names': self.type_names,
+            'type_ids': sorted(self.type_positions, key=self.type_positions.get),
+            'languages': sorted(self.language_vocab, key=self.language_vocab.get)
+        }
+        return arrays, meta
+
+    @classmethod
+    def from_artifact(cls, arrays, meta):
+        """由内存映射的数组构建特征库，矩阵和向量不复制，多个进程共享"""
+        movie_count = len(arrays['movie_ids'])
+        return cls(
+            movie_ids=arrays['movie_ids'],
+            titles=arrays['titles'],
+            years=arrays['years'],
+            ratings=arrays['ratings'],
+            runtimes=arrays['runtimes'],
+            type_matrix=csr_from_arrays(arrays, 'types', (movie_count, len(meta['type_names']))),
+            type_names=meta['type_names'],
+            type_positions={type_id: i for i, type_id in enumerate(meta['type_ids'])},
+            language_matrix=csr_from_arrays(arrays, 'languages', (movie_count, len(meta['languages']))),
+            language_vocab={language: i for i, language in enumerate(meta['languages'])}
+        )
+
+    @staticmethod
+    def _query_movies(min_id=None):
+        query = db.session.query(
+            Movie.id, Movie.title, Movie.year, Movie.rating, Movie.runtime, Movie.languages
+        )
+        if min_id is not None:
+            query = query.filter(Movie.id > min_id)
+        return query.order_by(Movie.id).all()
+
+    @staticmethod
+    def _query_types(min_id=None):
+        query = db.session.query(movie_type_association.c.movie_id, movie_type_association.c.type_id)
+        if min_id is not None:
+            query = query.filter(movie_type_association.c.movie_id > min_id)
+        return query.all()
+
+    @classmethod
+    def _build(cls, movie_rows, type_rows, type_names, type_positions, language_vocab, base=None):
+        """由查询结果构建特征库，传入 base 时在其基础上追加新电影"""
+        offset = len(base) if base is not None else 0
+        new_ids = np.array([row.id for row in movie_rows], dtype=np.int64)
+        positions = {int(movie_id): offset + i for i, movie_id in enumerate(new_ids)}
+
+        # 类型多热矩阵
+        type_row_idx, type_col_idx = [], []
+        for movie_id, type_id in type_rows:
+            if movie_id in positions and type_id in type_positions:
+                type_row_idx.append(positions[movie_id] - offset)
+                type_col_idx.append(type_positions[type_id])
+
+        # 语言多热矩阵，分词方式与 calculate_similarity 相同
+        lang_row_idx, lang_col_idx = [], []
+        for i, row in enumerate(movie_rows):
+            if not row.languages:
+                continue
+            for language in set(row.languages.split(',')):
+                if language not in language_vocab:
+                    language_vocab[language] = len(language_vocab)
+                lang_row_idx.append(i)
+                lang_col_idx.append(language_vocab[language])
+
+        def to_float(values):
+            return np.array([float(v) if v is not None else np.nan for v in values], dtype=np.float64)
+
+        new_type_matrix = csr_matrix(
+            (np.ones(len(type_row_idx)), (type_row_idx, type_col_idx)),
+            shape=(len(new_ids), len(type_names))
+        )
+        new_language_matrix = csr_matrix(
+            (np.ones(len(lang_row_idx)), (lang_row_idx, lang_col_idx)),
+            shape=(len(new_ids), len(language_vocab))
+        )
+        columns = dict(
+            movie_ids=new_ids,
+            titles=[row.title for row in movie_rows],
+            years=to_float(row.year for row in movie_rows),
+            ratings=to_float(row.rating for row in movie_rows),
+            runtimes=to_float(row.runtime for row in movie_rows),
+            type_matrix=new_type_matrix,
+            language_matrix=new_language_matrix
+        )
+
+        if base is not None:
+            columns = cls._concat(base, columns, len(type_names), len(language_vocab))
+
+        return cls(type_names=type_names, type_positions=type_positions,
+                   language_vocab=language_vocab, **columns)
+
+    @staticmethod
+    def _concat(base, columns, type_count, language_count):
+        def widen(matrix, width):
+            matrix = matrix.copy()
+            matrix.resize((matrix.shape[0], width))
+            return matrix
+
+        return dict(
+            movie_ids=np.concatenate([base.movie_ids, columns['movie_ids']]),
+            titles=list(base.titles) + columns['titles'],
+            years=np.concatenate([base.years, columns['years']]),
+            ratings=np.concatenate([base.ratings, columns['ratings']]),
+            runtimes=np.concatenate([base.runtimes, columns['runtimes']]),
+            type_matrix=vstack([widen(base.type_matrix, type_count), columns['type_matrix']]).tocsr(),
+            language_matrix=vstack([widen(base.language_matrix, language_count), columns['language_matrix']]).tocsr()
+        )
+
+    def refresh(self, check_interval=5, max_age=3600):
+        """检查电影表的变化，必要时返回更新后的特征库
+
+        只新增了电影时只读取新增的行并追加；有删除或特征库过旧时完整重建。
+        在 check_interval 秒内重复调用不会访问数据库；max_age 为 None 时不按时间重建。
+        """
+        now = time.time()
+        if now - self.checked_at < check_interval:
+            return self
+        self.checked_at = now
+
+        if max_age is not None and now - self.built_at > max_age:
+            return self.load()
+
+        count, max_id = db.session.query(func.count(Movie.id), func.max(Movie.id)).one()
+        max_id = max_id or 0
+        if count == len(self) and max_id == self.max_movie_id:
+            return self
+        if max_id <= self.max_movie_id:
+            return self.load()
+
+        type_names = list(self.type_names)
+        type_positions = dict(self.type_positions)
+        for row in db.session.query(MovieType.id, MovieType.name).filter(
+                MovieType.id > max(type_positions, default=0)).order_by(MovieType.id):
+            type_positions[row.id] = len(type_names)
+            type_names.append(row.name)
+
+        movie_rows = self._query_movies(min_id=self.max_movie_id)
+        if count != len(self) + len(movie_rows):
+            return self.load()
+
+        store = self._build(
+            movie_rows, self._query_types(min_id=self.max_movie_id), type_names, type_positions,
+            dict(self.language_vocab), base=self
+        )
+        logger.info(f"电影特征库追加 {len(movie_rows)} 部新电影")
+        return store
+
+    def similarity(self, rows, cols=None):
+        """计算 rows × cols 两组电影之间的相似度矩阵
+
+        Args:
+            rows: 特征库中的行号数组
+            cols: 特征库中的行号数组，为 None 时与全部电影比较
+
+        Returns:
+            (total, details): 总相似度矩阵和各维度相似度矩阵，均为百分制
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+
+        def column(values):
+            return values[None, :] if cols is None else values[cols][None, :]
+
+        def intersection(matrix):
+            # 以稀疏矩阵乘稠密矩阵的方式计算交集大小，避免生成转置的稀疏矩阵
+            targets = matrix[rows].toarray().T
+            candidates = matrix if cols is None else matrix[cols]
+            return (candidates @ targets).T
+
+        details = {
+            'type': _jaccard(intersection(self.type_matrix),
+                             self.type_counts[rows][:, None], column(self.type_counts)),
+            'year': _closeness(self._year_values[rows][:, None],
+                               column(self._year_values), YEAR_SCALE),
+            'rating': _closeness(self._rating_values[rows][:, None],
+                                 column(self._rating_values), RATING_SCALE),
+            'duration': _closeness(self._runtime_values[rows][:, None],
+                                   column(self._runtime_values), DURATION_SCALE),
+            'language': _jaccard(intersection(self.language_matrix),
+                                 self.language_counts[rows][:, None], column(self.language_counts))
+        }
+        return self._weighted_total(details), details
+
+    def pair_similarity(self, a, b):
+        """逐对计算 a[i] 与 b[i] 的相似度，返回值形状与 a 相同"""
+        a = np.asarray(a, dtype=np.int64)
+        b = np.asarray(b, dtype=np.int64)
+
+        type_intersection = np.asarray(
+            self.type_matrix[a].multiply(self.type_matrix[b]).sum(axis=1)).ravel()
+        language_intersection = np.asarray(
+            self.language_matrix[a].multiply(self.language_matrix[b]).sum(axis=1)).ravel()
+
+        details = {
+            'type': _jaccard(type_intersection, self.type_counts[a], self.type_counts[b]),
+            'year': _closeness(self._year_values[a], self._year_values[b], YEAR_SCALE),
+            'rating': _closeness(self._rating_values[a], self._rating_values[b], RATING_SCALE),
+            'duration': _closeness(self._runtime_values[a], self._runtime_values[b], DURATION_SCALE),
+            'language': _jaccard(language_intersection, self.language_counts[a], self.language_counts[b])
+        }
+        return self._weighted_total(details), details
+
+    @staticmethod
+    def _weighted_total(details):
+        return sum(SIMILARITY_WEIGHTS[name] * score for name, score in details.items())
+
+    def movie_types(self, i):
+        """获取第 i 行电影的类型名称列表"""
+        start, end = self.type_matrix.indptr[i], self.type_matrix.indptr[i + 1]
+        return [self.type_names[j] for j in self.type_matrix.indices[start:end]]
+
+    def movie_summary(self, i):
+        """获取第 i 行电影的基本信息，用于渲染推荐结果"""
+        year, rating = self.years[i], self.ratings[i]
+        return {
+            'id': int(self.movie_ids[i]),
+            'title': self.titles[i],
+            'year': None if np.isnan(year) else int(year),
+            'rating': None if np.isnan(rating) else float(rating),
+            'types': self.movie_types(i)
+        }
@@ -0,0 +1,237 @@
+import time
+import logging
+from collections import defaultdict
+import numpy as np
+from app.models import Movie, MovieNeighbor, movie_type_association, db
+from app.feature_store import load_movie_summaries
+
+logger = logging.getLogger(__name__)
+
+# 各候选来源在重排序时的默认权重，可通过配置 HYBRID_WEIGHTS 覆盖
+HYBRID_WEIGHTS = {
+    'content': 0.4,
+    'collaborative': 0.4,
+    'popularity': 0.2
+}
+# 每个来源最多提供的候选数量
+HYBRID_CANDIDATES = 100
+# 作为候选来源的用户交互电影数量，按权重从高到低选取
+HYBRID_SEEDS = 20
+# 用户偏好类型的数量，热门候选只从这些类型中选取
+HYBRID_GENRES = 3
+
+# 热门度的贝叶斯平均：评分人数较少的电影向全局平均分收缩
+POPULARITY_MIN_VOTES = 1000
+# 每个类型保存的热门电影数量
+POPULARITY_TOP_N = 200
+
+SOURCE_LABELS = {
+    'content': '与您喜欢的电影内容相似',
+    'collaborative': '喜欢相同电影的用户也喜欢',
+    'popularity': '您喜欢的类型中的高分电影'
+}
+
+
+class GenrePopularity:
+    """各类型的热门电影榜
+
+    由 flask publish-artifacts 离线构建并发布到模型文件库，请求时只读取内存映射的数组。
+    数组按类型ID排序，offsets[i]:offsets[i + 1] 为第 i 个类型的电影，已按热门度从高到低排列。
+    """
+
+    def __init__(self, type_ids, offsets, movie_ids, scores):
+        self.type_ids = type_ids
+        self.offsets = offsets
+        self.movie_ids = movie_ids
+        self.scores = scores
+
+    @classmethod
+    def build(cls, top_n=POPULARITY_TOP_N):
+        """扫描全部电影的类型和评分，计算每个类型的前 top_n 部电影"""
+        start = time.perf_counter()
+        rows = db.session.query(
+            movie_type_association.c.type_id, Movie.id, Movie.rating, Movie.rating_count
+        ).join(
+            Movie, Movie.id == movie_type_association.c.movie_id
+        ).filter(Movie.rating.isnot(None)).all()
+
+        ratings = np.array([row.rating for row in rows], dtype=np.float64)
+        votes = np.array([row.rating_count or 0 for row in rows], dtype=np.float64)
+        mean_rating = ratings.mean() if len(ratings) else 0
+        scores = (votes * ratings + POPULARITY_MIN_VOTES * mean_rating) / (votes + POPULARITY_MIN_VOTES) / 10
+
+        by_type = defaultdict(list)
+        for row, score in zip(rows, scores):
+            by_type[row.type_id].append((row.id, float(score)))
+
+        type_ids = sorted(by_type)
+        offsets, movie_ids, movie_scores = [0], [], []
+        for type_id in type_ids:
+            ranked = sorted(by_type[type_id], key=lambda item: (-item[1], item[0]))[:top_n]
+            movie_ids.extend(movie_id for movie_id, _ in ranked)
+            movie_scores.extend(score for _, score in ranked)
+            offsets.append(len(movie_ids))
+
+        popularity = cls(
+            type_ids=np.array(type_ids, dtype=np.int64),
+            offsets=np.array(offsets, dtype=np.int64),
+            movie_ids=np.array(movie_ids, dtype=np.int64),
+            scores=np.array(movie_scores, dtype=np.float64)
+        )
+        logger.info(f"类型热门榜构建完成: {len(type_ids)} 个类型, 耗时 {time.perf_counter() - start:.1f}s")
+        return popularity
+
+    def to_artifact(self):
+        return dict(type_ids=self.type_ids, offsets=self.offsets, movie_ids=self.movie_ids, scores=self.scores), {}
+
+    @classmethod
+    def from_artifact(cls, arrays, meta):
+        return cls(arrays['type_ids'], arrays['offsets'], arrays['movie_ids'], arrays['scores'])
+
+    def top(self, type_id, limit):
+        """类型的前 limit 部热门电影，返回 [(电影ID, 得分), ...]"""
+        i = int(np.searchsorted(self.type_ids, type_id))
+        if i == len(self.type_ids) or self.type_ids[i] != type_id:
+            return []
+        start = self.offsets[i]
+        end = min(self.offsets[i + 1], start + limit)
+        return [(int(movie_id), float(score)) for movie_id, score in
+                zip(self.movie_ids[start:end], self.scores[start:end])]
+
+
+class HybridRecommender:
+    """混合推荐流水线
+
+    1. 候选生成：从相似电影索引（内容）、物品协同过滤的相似列表、用户偏好类型的热门榜
+       三个来源各取少量候选，都只访问用户交互过的电影相关的数据；
+    2. 去重合并：同一电影来自多个来源时合并各来源得分；
+    3. 重排序：各来源得分按候选集内最大值归一化后加权求和。
+
+    请求时只对几百部候选打分，不扫描全部电影。内容来源依赖 flask build-neighbors 建立的索引，
+    协同过滤和热门来源依赖 flask publish-artifacts 发布的模型和类型热门榜；
+    没有候选的来源在重排序时跳过，不占权重。
+    """
+
+    def __init__(self, recommender, weights=None, candidates=HYBRID_CANDIDATES,
+                 seeds=HYBRID_SEEDS, genres=HYBRID_GENRES):
+        self.recommender = recommender
+        self.weights = dict(HYBRID_WEIGHTS, **(weights or {}))
+        self.candidates = candidates
+        self.seeds = seeds
+        self.genres = genres
+
+    def content_candidates(self, seed_ids, seed_weights):
+        """相似电影索引中种子电影的相似电影，得分为种子权重加权的平均相似度"""
+        scores = defaultdict(float)
+        weight_by_seed = dict(zip(seed_ids, seed_weights))
+        for neighbor in db.session.query(
+                MovieNeighbor.movie_id, MovieNeighbor.neighbor_id, MovieNeighbor.similarity
+        ).filter(MovieNeighbor.movie_id.in_(seed_ids)):
+            scores[neighbor.neighbor_id] += weight_by_seed[neighbor.movie_id] * neighbor.similarity / 100
+        total_weight = sum(seed_weights) or 1
+        ranked = sorted(scores.items(), key=lambda item: -item[1])[:self.candidates]
+        return {movie_id: score / total_weight for movie_id, score in ranked}
+
+    def collaborative_candidates(self, movie_ids, values):
+        """物品协同过滤的候选，只在交互电影的相似列表中取，模型未发布时不提供候选"""
+        model = self.recommender.get_cf_model()
+        if model is None:
+            return {}
+        return dict(model.recommend(movie_ids, values, limit=self.candidates))
+
+    def popularity_candidates(self, seed_ids, seed_weights):
+        """用户偏好类型中的高分电影，热门榜未发布时不提供候选"""
+        popularity = self.recommender.get_genre_popularity()
+        if popularity is None:
+            return {}
+
+        # 种子电影的类型按主键读取，只涉及少量电影
+        weight_by_seed = dict(zip(seed_ids, seed_weights))
+        genre_weights = defaultdict(float)
+        for movie_id, type_id in db.session.query(
+                movie_type_association.c.movie_id, movie_type_association.c.type_id
+        ).filter(movie_type_association.c.movie_id.in_(seed_ids)):
+            genre_weights[type_id] += weight_by_seed[movie_id]
+
+        top_genres = sorted(genre_weights, key=lambda type_id: (-genre_weights[type_id], type_id))[:self.genres]
+        if not top_genres:
+            return {}
+
+        per_genre = max(1, self.candidates // len(top_genres))
+        scores = {}
+        for type_id in top_genres:
+            for movie_id, score in popularity.top(type_id, per_genre):
+                scores[movie_id] = max(scores.get(movie_id, 0), score)
+        return scores
+
+    def rerank(self, candidates, exclude, limit):
+        """合并各来源候选并按加权归一化得分排序，返回 [(电影ID, 得分, 来源列表), ...]"""
+        blended = defaultdict(float)
+        sources = defaultdict(list)
+        for source, scores in candidates.items():
+            weight = self.weights.get(source, 0)
+            top_score = max(scores.values(), default=0)
+            if weight <= 0 or top_score <= 0:
+                continue
+            for movie_id, score in scores.items():
+                if movie_id in exclude:
+                    continue
+                blended[movie_id] += weight * score / top_score
+                sources[movie_id].append(source)
+
+        ranked = sorted(blended.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [(movie_id, score, sources[movie_id]) for movie_id, score in ranked]
+
+    def recommend(self, user_id, limit=12):
+        """返回 (推荐列表, 各阶段耗时毫秒数)"""
+        timings = {}
+        stage_start = time.perf_counter()
+
+        def lap(stage):
+            nonlocal stage_start
+            now = time.perf_counter()
+            timings[stage] = round((now - stage_start) * 1000, 2)
+            stage_start = now
+
+        movie_ids, values = self.recommender.get_user_profile(user_id)
+        if not movie_ids:
+            return [], timings
+        merged = defaultdict(float)
+        for movie_id, value in zip(movie_ids, values):
+            merged[movie_id] += value
+        seeds = sorted(merged.items(), key=lambda item: -item[1])[:self.seeds]
+        seed_ids = [movie_id for movie_id, _ in seeds]
+        seed_weights = [weight for _, weight in seeds]
+        lap('profile')
+
+        candidates = {}
+        for source, generate in (
+                ('content', lambda: self.content_candidates(seed_ids, seed_weights)),
+                ('collaborative', lambda: self.collaborative_candidates(movie_ids, values)),
+                ('popularity', lambda: self.popularity_candidates(seed_ids, seed_weights))):
+            if self.weights.get(source, 0) <= 0:
+                continue
+            try:
+                candidates[source] = generate()
+            except Exception as e:
+                logger.error(f"混合推荐候选来源 {source} 失败: {str(e)}")
+            lap(source)
+
+        ranked = self.rerank(candidates, set(merged), limit)
+        lap('rerank')
+
+        summaries = load_movie_summaries([movie_id for movie_id, _, _ in ranked])
+        recommendations = []
+        for movie_id, score, movie_sources in ranked:
+            if movie_id in summaries:
+                movie = dict(summaries[movie_id])
+                movie['score'] = round(score, 2)
+                movie['sources'] = movie_sources
+                movie['reasons'] = [SOURCE_LABELS[source] for source in movie_sources]
+                recommendations.append(movie)
+        lap('hydrate')
+
+        timings['total'] = round(sum(timings.values()), 2)
+        timings['candidates'] = {source: len(scores) for source, scores in candidates.items()}
+        logger.info(f"用户 {user_id} 混合推荐耗时(ms): {timings}")
+        return recommendations, timings
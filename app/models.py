@@ -1,5 +1,7 @@
 from datetime import datetime
 from flask_login import UserMixin
+from sqlalchemy.dialects import mysql
+from sqlalchemy.orm import selectinload, undefer
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db, login_manager
 
@@ -28,7 +30,9 @@ class User(UserMixin, db.Model):
 # 电影与类型的关联表
 movie_type_association = db.Table('movie_type_association',
     db.Column('movie_id', db.Integer, db.ForeignKey('movies.id'), primary_key=True),
-    db.Column('type_id', db.Integer, db.ForeignKey('movie_types.id'), primary_key=True)
+    db.Column('type_id', db.Integer, db.ForeignKey('movie_types.id'), primary_key=True),
+    # 主键是 (movie_id, type_id)，按类型查电影需要反向索引
+    db.Index('ix_movie_type_association_type_movie', 'type_id', 'movie_id')
 )
 
 # 电影类型表
@@ -54,27 +58,76 @@ class Movie(db.Model):
     runtime = db.Column(db.Integer)        # 片长（分钟）
     rating = db.Column(db.Float)           # 豆瓣评分
     rating_count = db.Column(db.Integer)   # 评分人数
-    summary = db.Column(db.Text)           # 简介
+    summary = db.deferred(db.Column(db.Text))  # 简介，默认延迟加载
     poster_url = db.Column(db.String(500)) # 海报URL
-    poster_data = db.Column(db.LargeBinary)  # 海报数据
+    poster_data = db.deferred(db.Column(db.LargeBinary))  # 海报数据，默认延迟加载，海报由文件库提供
     poster_mimetype = db.Column(db.String(50))  # 海报MIME类型
+    poster_digest = db.Column(db.String(64))  # 海报文件的 SHA-256 摘要，文件保存在海报文件库中
     tags = db.Column(db.String(500))       # 标签
+    # 用户评分的总和与人数，评分时在同一事务中更新，flask reconcile-ratings 可按 ratings 表重算
+    user_rating_sum = db.Column(db.Float, nullable=False, default=0, server_default='0')
+    user_rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (
+        # 按年份统计数量和平均分
+        db.Index('ix_movies_year_rating', 'year', 'rating'),
+        # 按评分筛选和排序，热门度计算同时需要评分人数
+        db.Index('ix_movies_rating', 'rating', 'rating_count'),
+    )
     
     types = db.relationship('MovieType', secondary='movie_type_association', back_populates='movies')
     ratings = db.relationship('Rating', backref='movie', lazy=True)
     favorites = db.relationship('Favorite', backref='movie', lazy=True)  # 添加收藏关系
+    # 导演、编剧、演员，directors/writers/actors 字符串保留用于显示和搜索
+    people = db.relationship('MoviePerson', back_populates='movie', cascade='all, delete-orphan',
+                             order_by='(MoviePerson.role, MoviePerson.position)')
 
     @property
     def user_rating_avg(self):
-        """计算用户的平均评分"""
-        if not self.ratings:
+        """用户的平均评分"""
+        if not self.user_rating_count:
             return self.rating or 0  # 如果没有用户评分，返回豆瓣评分或0
-        return sum(r.rating for r in self.ratings) / len(self.ratings)
+        return self.user_rating_sum / self.user_rating_count
 
-    @property
-    def user_rating_count(self):
-        """获取用户评分数量"""
-        return len(self.ratings)
+class Person(db.Model):
+    """导演、编剧、演员，同名的人视为同一人"""
+    __tablename__ = 'people'
+    id = db.Column(db.Integer, primary_key=True)
+    # MySQL 上按二进制比较，大小写或重音不同的名字是不同的人，唯一约束与按名字查找的结果一致
+    name = db.Column(db.String(100).with_variant(mysql.VARCHAR(100, collation='utf8mb4_bin'), 'mysql'),
+                     unique=True, nullable=False)
+    movies = db.relationship('MoviePerson', back_populates='person')
+
+class MoviePerson(db.Model):
+    """电影与人物的关联，role 为 director、writer 或 actor"""
+    __tablename__ = 'movie_people'
+    movie_id = db.Column(db.Integer, db.ForeignKey('movies.id'), primary_key=True)
+    person_id = db.Column(db.Integer, db.ForeignKey('people.id'), primary_key=True)
+    role = db.Column(db.String(20), primary_key=True)
+    position = db.Column(db.Integer, nullable=False, default=0)  # 在原字段中的顺序，演员即番位
+
+    __table_args__ = (
+        # 按角色统计人物（如导演排行），以及某人担任某角色的电影
+        db.Index('ix_movie_people_role_person', 'role', 'person_id', 'movie_id'),
+        # 某人参与的全部电影
+        db.Index('ix_movie_people_person_movie', 'person_id', 'movie_id'),
+    )
+
+    movie = db.relationship('Movie', back_populates='people')
+    person = db.relationship('Person', back_populates='movies')
+
+def movie_load_options(profile):
+    """Movie 查询在不同场景下的加载选项
+
+    poster_data 和 summary 在映射上默认延迟加载，只有需要的场景显式加载：
+    - list: 列表、搜索、类型页和推荐结果，批量加载类型，避免每部电影单独查询一次
+    - detail: 详情页，加载简介
+    """
+    if profile == 'list':
+        return (selectinload(Movie.types),)
+    if profile == 'detail':
+        return (undefer(Movie.summary),)
+    raise ValueError(f'未知的加载选项: {profile}')
 
 class Rating(db.Model):
     __tablename__ = 'ratings'
@@ -84,9 +137,17 @@ class Rating(db.Model):
     rating = db.Column(db.Float, nullable=False)
     comment = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # 创建唯一索引确保每个用户对每部电影只有一个评分
-    __table_args__ = (db.UniqueConstraint('user_id', 'movie_id', name='unique_user_movie'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'movie_id', name='unique_user_movie'),
+        db.Index('ix_ratings_updated_at', 'updated_at'),
+        # 我的评分页按用户筛选、按时间倒序
+        db.Index('ix_ratings_user_created', 'user_id', 'created_at'),
+        # 活动热力图按时间范围筛选，离线评估按时间切分
+        db.Index('ix_ratings_created_at', 'created_at'),
+    )
 
 class UserSimilarity(db.Model):
     __tablename__ = 'user_similarities'
@@ -94,7 +155,12 @@ class UserSimilarity(db.Model):
     user_id1 = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     user_id2 = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     similarity = db.Column(db.Float, nullable=False)  # 相似度分数
-    created_at = db.Column(db.DateTime, default=datetime.utcnow) 
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_user_similarities_user_similarity', 'user_id1', 'similarity'),
+        db.Index('ix_user_similarities_user2', 'user_id2'),
+    )
 
 class Favorite(db.Model):
     """用户收藏"""
@@ -106,4 +172,29 @@ class Favorite(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint('user_id', 'movie_id', name='unique_user_movie_favorite'),
-    ) 
\ No newline at end of file
+        # 收藏页按用户筛选、按时间倒序
+        db.Index('ix_favorites_user_created', 'user_id', 'created_at'),
+        # 离线评估按时间切分
+        db.Index('ix_favorites_created_at', 'created_at'),
+    )
+
+class MovieNeighbor(db.Model):
+    """预计算的相似电影（每部电影保留相似度最高的K部）"""
+    __tablename__ = 'movie_neighbors'
+    id = db.Column(db.Integer, primary_key=True)
+    movie_id = db.Column(db.Integer, db.ForeignKey('movies.id'), nullable=False)
+    neighbor_id = db.Column(db.Integer, db.ForeignKey('movies.id'), nullable=False)
+    similarity = db.Column(db.Float, nullable=False)  # 总相似度
+    type_similarity = db.Column(db.Float)
+    year_similarity = db.Column(db.Float)
+    rating_similarity = db.Column(db.Float)
+    duration_similarity = db.Column(db.Float)
+    language_similarity = db.Column(db.Float)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('movie_id', 'neighbor_id', name='unique_movie_neighbor'),
+        db.Index('ix_movie_neighbors_movie_similarity', 'movie_id', 'similarity'),
+        # 新电影入库时按 neighbor_id 删除它在其他电影列表中的旧记录
+        db.Index('ix_movie_neighbors_neighbor', 'neighbor_id'),
+    )
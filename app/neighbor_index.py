@@ -0,0 +1,201 @@
+import time
+import logging
+from datetime import datetime
+import numpy as np
+from sqlalchemy import func
+from app.models import MovieNeighbor, db
+from app.feature_store import MovieFeatureStore, load_movie_summaries
+
+logger = logging.getLogger(__name__)
+
+# 每部电影保存的相似电影数量
+NEIGHBOR_COUNT = 20
+
+DETAIL_COLUMNS = {
+    'type': 'type_similarity',
+    'year': 'year_similarity',
+    'rating': 'rating_similarity',
+    'duration': 'duration_similarity',
+    'language': 'language_similarity'
+}
+
+
+def _top_neighbors(scores, k, exclude):
+    """从一行相似度中选出相似度大于0的前k个位置"""
+    scores = scores.copy()
+    scores[exclude] = 0
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+    return candidates
+
+
+class MovieNeighborIndex:
+    """相似电影索引
+
+    离线为每部电影计算前K部相似电影写入 movie_neighbors 表，页面只需按主键查表；
+    新电影入库时只对新电影重新打分，并更新受影响电影的相似列表。
+    """
+
+    def __init__(self, k=NEIGHBOR_COUNT):
+        self.k = k
+        self.store = None
+
+    def get_feature_store(self):
+        if self.store is None:
+            self.store = MovieFeatureStore.load()
+        else:
+            self.store = self.store.refresh(check_interval=0)
+        return self.store
+
+    def _neighbor_rows(self, store, i, scores, details, neighbors, now):
+        return [
+            dict(
+                movie_id=int(store.movie_ids[i]),
+                neighbor_id=int(store.movie_ids[j]),
+                similarity=float(scores[j]),
+                created_at=now,
+                **{column: float(details[name][j]) for name, column in DETAIL_COLUMNS.items()}
+            )
+            for j in neighbors
+        ]
+
+    def _insert(self, rows, batch_size=5000):
+        for start in range(0, len(rows), batch_size):
+            db.session.execute(MovieNeighbor.__table__.insert(), rows[start:start + batch_size])
+
+    def _thresholds(self, movie_ids, batch_size=500):
+        """返回 {电影ID: (相似电影数, 最低相似度)}，没有索引记录的电影不在结果中"""
+        thresholds = {}
+        for start in range(0, len(movie_ids), batch_size):
+            thresholds.update(
+                (row.movie_id, (row.count, row.min_similarity))
+                for row in db.session.query(
+                    MovieNeighbor.movie_id,
+                    func.count(MovieNeighbor.id).label('count'),
+                    func.min(MovieNeighbor.similarity).label('min_similarity')
+                ).filter(
+                    MovieNeighbor.movie_id.in_(movie_ids[start:start + batch_size])
+                ).group_by(MovieNeighbor.movie_id)
+            )
+        return thresholds
+
+    def build(self, block_size=512):
+        """重建全部电影的相似电影索引"""
+        start = time.perf_counter()
+        store = self.get_feature_store()
+        now = datetime.utcnow()
+
+        MovieNeighbor.query.delete()
+        total = 0
+        for block_start in range(0, len(store), block_size):
+            rows = np.arange(block_start, min(block_start + block_size, len(store)))
+            scores, details = store.similarity(rows)
+
+            neighbor_rows = []
+            for offset, i in enumerate(rows):
+                row_details = {name: values[offset] for name, values in details.items()}
+                neighbors = _top_neighbors(scores[offset], self.k, i)
+                neighbor_rows.extend(self._neighbor_rows(store, i, scores[offset], row_details, neighbors, now))
+
+            self._insert(neighbor_rows)
+            total += len(neighbor_rows)
+            db.session.commit()
+            logger.info(f"相似电影索引: 已处理 {rows[-1] + 1}/{len(store)} 部电影")
+
+        logger.info(f"相似电影索引构建完成: {total} 条记录, 耗时 {time.perf_counter() - start:.1f}s")
+        return total
+
+    def add_movie(self, movie_id):
+        """新电影入库后增量更新索引
+
+        新电影与全部电影打分一次：写入它自己的前K部相似电影，
+        同时把它插入到相似度超过原有第K名的其他电影的列表中。
+        """
+        store = self.get_feature_store()
+        i = store.index.get(movie_id)
+        if i is None:
+            logger.warning(f"特征库中找不到电影 {movie_id}，跳过相似电影索引更新")
+            return 0
+
+        scores, details = store.similarity([i])
+        scores, details = scores[0], {name: values[0] for name, values in details.items()}
+        scores[i] = 0
+        now = datetime.utcnow()
+
+        # 新电影自身的相似列表
+        MovieNeighbor.query.filter_by(movie_id=movie_id).delete()
+        self._insert(self._neighbor_rows(store, i, scores, details, _top_neighbors(scores, self.k, i), now))
+
+        # 相似度是对称的，新电影对其他电影的得分就是其他电影对新电影的得分，
+        # 只有得分大于0的电影可能受影响，只查这些电影当前的第K名
+        candidates = np.flatnonzero(scores > 0)
+        thresholds = self._thresholds([int(store.movie_ids[j]) for j in candidates])
+        # 尚未建立索引的电影会回退到实时计算，不能只写入一条不完整的记录
+        affected = []
+        for j in candidates:
+            other_id = int(store.movie_ids[j])
+            if other_id not in thresholds:
+                continue
+            count, min_similarity = thresholds[other_id]
+            if count < self.k or scores[j] > min_similarity:
+                affected.append(j)
+
+        reverse_rows = [
+            dict(
+                movie_id=int(store.movie_ids[j]),
+                neighbor_id=movie_id,
+                similarity=float(scores[j]),
+                created_at=now,
+                **{column: float(details[name][j]) for name, column in DETAIL_COLUMNS.items()}
+            )
+            for j in affected
+        ]
+        MovieNeighbor.query.filter_by(neighbor_id=movie_id).delete()
+        self._insert(reverse_rows)
+
+        # 超出K部的列表删除相似度最低的记录
+        for j in affected:
+            other_id = int(store.movie_ids[j])
+            if thresholds[other_id][0] < self.k:
+                continue
+            stale_ids = [
+                row.id for row in db.session.query(MovieNeighbor.id)
+                .filter(MovieNeighbor.movie_id == other_id)
+                .order_by(MovieNeighbor.similarity.desc(), MovieNeighbor.id)
+                .offset(self.k)
+            ]
+            if stale_ids:
+                MovieNeighbor.query.filter(MovieNeighbor.id.in_(stale_ids)).delete(synchronize_session=False)
+
+        db.session.commit()
+        logger.info(f"相似电影索引已更新: 电影 {movie_id}, 影响 {len(affected)} 部电影的相似列表")
+        return len(affected)
+
+
+def get_indexed_neighbors(movie_id, limit=6):
+    """从相似电影索引中读取结果，格式与 MovieRecommender.get_similar_movies 相同
+
+    索引中没有该电影时返回 None，由调用方回退到实时计算。
+    """
+    neighbors = MovieNeighbor.query.filter_by(
+        movie_id=movie_id
+    ).order_by(
+        MovieNeighbor.similarity.desc()
+    ).limit(limit).all()
+    if not neighbors:
+        return None
+
+    summaries = load_movie_summaries([neighbor.neighbor_id for neighbor in neighbors])
+    similar_movies = []
+    for neighbor in neighbors:
+        if neighbor.neighbor_id not in summaries:
+            continue
+        movie = dict(summaries[neighbor.neighbor_id])
+        movie['similarity_score'] = round(neighbor.similarity, 1)
+        movie['similarity_details'] = {
+            name: round(getattr(neighbor, column) or 0, 1)
+            for name, column in DETAIL_COLUMNS.items()
+        }
+        similar_movies.append(movie)
+    return similar_movies
@@ -0,0 +1,167 @@
+import time
+import logging
+from datetime import datetime
+from flask import current_app
+from itsdangerous import URLSafeSerializer, BadSignature
+from sqlalchemy import and_, or_, func, text
+
+logger = logging.getLogger(__name__)
+
+CURSOR_SALT = 'keyset-pagination'
+
+# 不支持统计值的数据库上 COUNT(*) 结果的缓存时间（秒）
+ROW_COUNT_TTL = 300
+
+
+class KeysetPage:
+    """一页键集分页结果，模板中的用法与 paginate() 返回的对象相近
+
+    next_cursor/prev_cursor 为不透明的游标字符串，没有下一页/上一页时为 None。
+    total 为总数（可能是估算值），不需要时为 None。
+    """
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None, total_is_estimate=False):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+        self.total_is_estimate = total_is_estimate
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt=CURSOR_SALT)
+
+
+def _dump_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _load_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(key, values, direction):
+    """把排序键的值编码成游标，key 区分不同的排序方式，避免游标被用在别的排序上"""
+    return _serializer().dumps({'k': key, 'v': [_dump_value(value) for value in values], 'd': direction})
+
+
+def decode_cursor(cursor, key, length):
+    """解码游标，返回 (排序键的值, 方向)；游标无效时返回 (None, 'next')，从第一页开始"""
+    if not cursor:
+        return None, 'next'
+    try:
+        data = _serializer().loads(cursor)
+    except BadSignature:
+        logger.warning(f"无效的分页游标: {cursor[:50]}")
+        return None, 'next'
+    if data.get('k') != key or len(data.get('v', [])) != length or data.get('d') not in ('next', 'prev'):
+        return None, 'next'
+    return [_load_value(value) for value in data['v']], data['d']
+
+
+def _after(order, values):
+    """排序键严格位于 values 之后的条件：(a > x) OR (a = x AND b > y) ...，每列可以有不同的方向"""
+    clauses = []
+    for i, ((column, descending), value) in enumerate(zip(order, values)):
+        equal = [prefix_column == prefix_value for (prefix_column, _), prefix_value in zip(order[:i], values[:i])]
+        clauses.append(and_(*equal, column < value if descending else column > value))
+    return or_(*clauses)
+
+
+def keyset_paginate(query, order, key, cursor=None, per_page=20, total=None, total_is_estimate=False):
+    """键集分页
+
+    按 order 中的列排序，用上一页最后一行的排序键作为条件取下一页，不使用 OFFSET 和 COUNT，
+    任意一页的代价都和第一页相同。排序列应有索引，最后一列必须唯一（通常为主键），
+    排序列的值不能为 NULL。
+
+    Args:
+        query: 未排序的查询
+        order: [(列, 是否倒序)]
+        key: 排序方式的名称，写入游标
+        cursor: 请求中的游标
+        total: 总数，可以为估算值，None 表示不显示
+    """
+    values, direction = decode_cursor(cursor, key, len(order))
+    # 向前翻页时反向排序取数据，再把结果倒回来
+    query_order = order if direction == 'next' else [(column, not descending) for column, descending in order]
+    if values is not None:
+        query = query.filter(_after(query_order, values))
+    query = query.order_by(*[column.desc() if descending else column.asc() for column, descending in query_order])
+    items = query.limit(per_page + 1).all()
+
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    if direction == 'prev':
+        items.reverse()
+
+    def cursor_for(item, item_direction):
+        return encode_cursor(key, [getattr(item, column.key) for column, _ in order], item_direction)
+
+    if direction == 'next':
+        has_next, has_prev = has_more, values is not None
+    else:
+        # 从后面的页面翻回来，后面一定还有数据
+        has_next, has_prev = True, has_more
+
+    next_cursor = prev_cursor = None
+    if items:
+        if has_next:
+            next_cursor = cursor_for(items[-1], 'next')
+        if has_prev:
+            prev_cursor = cursor_for(items[0], 'prev')
+    return KeysetPage(items, per_page, next_cursor, prev_cursor, total, total_is_estimate)
+
+
+def estimate_row_count(session, table):
+    """表的估算行数
+
+    MySQL 直接读取 information_schema 中的统计值，不扫描表；其他数据库执行 COUNT(*)，
+    结果在应用内缓存 ROW_COUNT_TTL 秒，不会每次请求都扫描一遍表。
+    返回 (行数, 是否为估算值)。
+    """
+    if session.get_bind().dialect.name == 'mysql':
+        count = session.execute(text(
+            'SELECT TABLE_ROWS FROM information_schema.TABLES '
+            'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table'
+        ), {'table': table.name}).scalar()
+        if count is not None:
+            return int(count), True
+
+    if not hasattr(current_app, 'row_count_cache'):
+        current_app.row_count_cache = {}
+    cached = current_app.row_count_cache.get(table.name)
+    if cached is not None and cached[0] > time.time():
+        return cached[1], True
+    count = session.query(func.count()).select_from(table).scalar()
+    ttl = current_app.config.get('ROW_COUNT_TTL', ROW_COUNT_TTL)
+    current_app.row_count_cache[table.name] = (time.time() + ttl, count)
+    return count, False
+
+
+def offset_page(items, key, offset, per_page, total):
+    """按名次翻页的结果（如搜索结果），游标中保存偏移量，与键集分页共用模板"""
+    next_cursor = encode_cursor(key, [offset + per_page], 'next') if offset + per_page < total else None
+    prev_cursor = encode_cursor(key, [max(offset - per_page, 0)], 'prev') if offset > 0 else None
+    return KeysetPage(items, per_page, next_cursor, prev_cursor, total)
+
+
+def decode_offset(cursor, key):
+    """解码 offset_page 生成的游标，无效时返回 0"""
+    values, _ = decode_cursor(cursor, key, 1)
+    if not values or not isinstance(values[0], int) or values[0] < 0:
+        return 0
+    return values[0]
@@ -0,0 +1,171 @@
+import re
+import logging
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from app.models import Movie, Person, MoviePerson, db
+
+logger = logging.getLogger(__name__)
+
+# 角色 -> Movie 上对应的字符串字段
+ROLE_FIELDS = {
+    'director': 'directors',
+    'writer': 'writers',
+    'actor': 'actors'
+}
+
+# 回填时每批处理的电影ID范围
+BACKFILL_BATCH_SIZE = 2000
+
+# 豆瓣页面 #info 中用斜杠分隔，其他来源可能用逗号或顿号
+_NAME_SEPARATOR = re.compile(r'\s*[,/，、]\s*')
+_NAME_LENGTH = Person.__table__.c.name.type.length
+
+
+def split_names(text):
+    """拆分导演、编剧、演员字段，去掉空名和重复的名字，保持原顺序"""
+    names = (name[:_NAME_LENGTH].strip() for name in _NAME_SEPARATOR.split((text or '').strip()))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def parse_credits(movie):
+    """从 Movie 对象或爬虫返回的电影字典中解析出 {角色: [人名, ...]}"""
+    credits = {}
+    for role, field in ROLE_FIELDS.items():
+        text = movie.get(field) if isinstance(movie, dict) else getattr(movie, field)
+        credits[role] = split_names(text)
+    return credits
+
+
+def _person_ids(names):
+    """按名字查人物ID，返回 {名字: ID}，不存在的名字不在结果中"""
+    names = list(names)
+    found = {}
+    for start in range(0, len(names), 500):
+        found.update(db.session.query(Person.name, Person.id).filter(Person.name.in_(names[start:start + 500])))
+    return found
+
+
+def _insert_people(names):
+    """在保存点中插入人物，有名字已存在时整批回滚并返回 False"""
+    try:
+        with db.session.begin_nested():
+            db.session.execute(Person.__table__.insert(), [{'name': name} for name in names])
+        return True
+    except IntegrityError:
+        return False
+
+
+def resolve_people(names):
+    """返回 {名字: 人物ID}，不存在的人物在当前事务中创建
+
+    其他进程可能同时创建同名人物，批量插入冲突时重新查询，再逐个插入仍然缺少的名字。
+    无法创建的名字不在结果中，由调用方跳过。
+    """
+    names = list(dict.fromkeys(names))
+    ids = _person_ids(names)
+    missing = [name for name in names if name not in ids]
+    if not missing:
+        return ids
+    if not _insert_people(missing):
+        logger.info("创建人物时名字冲突，重新查询后逐个创建")
+        ids.update(_person_ids(missing))
+        for name in missing:
+            if name not in ids:
+                _insert_people([name])
+    ids.update(_person_ids(missing))
+
+    unresolved = [name for name in missing if name not in ids]
+    if unresolved:
+        logger.warning(f"无法创建人物，跳过: {', '.join(unresolved[:10])}")
+    return ids
+
+
+def set_movie_people(movie, credits):
+    """设置电影的导演、编剧、演员，替换原有的关联
+
+    Args:
+        movie: Movie 对象，可以尚未写入数据库
+        credits: parse_credits 的返回值
+    """
+    ids = resolve_people(name for names in credits.values() for name in names)
+    if movie.id is not None and movie.people:
+        # 先删除旧关联，新旧关联的主键可能相同
+        movie.people = []
+        db.session.flush()
+    movie.people = [
+        MoviePerson(person_id=ids[name], role=role, position=position)
+        for role, names in credits.items()
+        for position, name in enumerate(names)
+        if name in ids
+    ]
+
+
+def backfill_movie_people(batch_size=BACKFILL_BATCH_SIZE):
+    """按电影上的 directors/writers/actors 字符串重建 movie_people 表
+
+    按电影ID分批处理，每批先删除这些电影已有的关联再批量插入，可以重复运行。
+
+    Returns:
+        {'movies': 处理的电影数, 'people': 人物总数, 'credits': 写入的关联数}
+    """
+    max_id = db.session.query(func.max(Movie.id)).scalar() or 0
+    person_ids = {}
+    movies = credits = 0
+    for start in range(0, max_id + 1, batch_size):
+        end = start + batch_size
+        rows = db.session.query(Movie.id, Movie.directors, Movie.writers, Movie.actors).filter(
+            Movie.id >= start, Movie.id < end
+        ).all()
+        if not rows:
+            continue
+
+        parsed = [(row.id, parse_credits(row)) for row in rows]
+        names = {name for _, movie_credits in parsed for names in movie_credits.values() for name in names}
+        new_names = [name for name in names if name not in person_ids]
+        if new_names:
+            person_ids.update(resolve_people(new_names))
+
+        values = [
+            {'movie_id': movie_id, 'person_id': person_ids[name], 'role': role, 'position': position}
+            for movie_id, movie_credits in parsed
+            for role, names in movie_credits.items()
+            for position, name in enumerate(names)
+            if name in person_ids
+        ]
+        db.session.query(MoviePerson).filter(
+            MoviePerson.movie_id >= start, MoviePerson.movie_id < end
+        ).delete(synchronize_session=False)
+        if values:
+            db.session.execute(MoviePerson.__table__.insert(), values)
+        db.session.commit()
+
+        movies += len(rows)
+        credits += len(values)
+        logger.info(f"人物回填: 电影ID {start}-{end - 1} 共 {len(rows)} 部, 写入 {len(values)} 条关联")
+    return {'movies': movies, 'people': db.session.query(func.count(Person.id)).scalar(), 'credits': credits}
+
+
+def top_people_query(role, min_movies=3):
+    """按角色统计人物的电影数和平均豆瓣评分，按平均分从高到低排序
+
+    先在 movie_people 的 (role, person_id) 索引上按人物分组，再按主键关联人物表取名字。
+    """
+    movie_count = func.count(MoviePerson.movie_id)
+    stats = db.session.query(
+        MoviePerson.person_id,
+        movie_count.label('movie_count'),
+        func.avg(Movie.rating).label('avg_rating')
+    ).join(
+        Movie, Movie.id == MoviePerson.movie_id
+    ).filter(
+        MoviePerson.role == role
+    ).group_by(
+        MoviePerson.person_id
+    ).having(
+        movie_count >= min_movies
+    ).subquery()
+    return db.session.query(
+        Person.id, Person.name, stats.c.movie_count, stats.c.avg_rating
+    ).join(
+        stats, stats.c.person_id == Person.id
+    ).order_by(stats.c.avg_rating.desc(), Person.id)
@@ -0,0 +1,237 @@
+import os
+import hashlib
+import logging
+import tempfile
+from io import BytesIO
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+from flask import current_app, send_file, make_response, url_for
+
+logger = logging.getLogger(__name__)
+
+# MIME 类型对应的文件扩展名，未知类型按 jpg 处理
+POSTER_EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/jpg': '.jpg',
+    'image/png': '.png',
+    'image/webp': '.webp',
+    'image/gif': '.gif'
+}
+
+# 海报 URL 中版本参数的长度，取摘要前缀
+POSTER_VERSION_LENGTH = 16
+# 带版本参数的海报 URL 内容不会改变，缓存一年；不带版本的 URL 缓存时间较短，过期后用 ETag 重新验证
+POSTER_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+POSTER_MAX_AGE = 3600
+# 缩略图尚未生成、暂时发送原图时的缓存时间，缩略图生成后很快就能换上
+POSTER_FALLBACK_MAX_AGE = 60
+
+# 入库时生成的海报尺寸（最大宽高，保持原图比例），每种尺寸同时保存 WebP 和 JPEG
+POSTER_SIZES = {
+    'thumb': (100, 150),
+    'card': (300, 450),
+    'full': (600, 900)
+}
+POSTER_VARIANT_FORMATS = {
+    'image/webp': 'WEBP',
+    'image/jpeg': 'JPEG'
+}
+POSTER_VARIANT_QUALITY = 82
+
+
+def _extension(mimetype):
+    return POSTER_EXTENSIONS.get((mimetype or '').split(';')[0].strip().lower(), '.jpg')
+
+
+class PosterStore:
+    """按内容哈希存放海报文件
+
+    原图路径为 <root>/<摘要前两位>/<sha256 摘要><扩展名>，相同内容只保存一份；
+    缩略图保存在同一目录下，文件名为 <摘要>-<尺寸><扩展名>。
+    数据库中只保存摘要和 MIME 类型，海报请求不再读取 BLOB 列。
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def relative_path(self, digest, mimetype, size=None):
+        suffix = f'-{size}' if size else ''
+        return f'{digest[:2]}/{digest}{suffix}{_extension(mimetype)}'
+
+    def path(self, digest, mimetype, size=None):
+        return os.path.join(self.root, self.relative_path(digest, mimetype, size))
+
+    def exists(self, digest, mimetype, size=None):
+        return os.path.exists(self.path(digest, mimetype, size))
+
+    def last_modified(self, digest, mimetype, size=None):
+        """海报文件的修改时间，文件不存在时返回 None"""
+        try:
+            mtime = os.stat(self.path(digest, mimetype, size)).st_mtime
+        except OSError:
+            return None
+        return datetime.fromtimestamp(int(mtime), timezone.utc)
+
+    def save(self, data, mimetype):
+        """写入海报，返回摘要；文件已存在时不重复写入"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest, mimetype)
+        if not os.path.exists(path):
+            self._write(path, data)
+        return digest
+
+    def save_variants(self, digest, mimetype, data=None, force=False):
+        """生成各尺寸的 WebP 和 JPEG 缩略图，返回新写入的文件数
+
+        data 为空时从文件库读取原图。
+        """
+        targets = [
+            (size, variant_mimetype)
+            for size in POSTER_SIZES
+            for variant_mimetype in POSTER_VARIANT_FORMATS
+            if force or not self.exists(digest, variant_mimetype, size)
+        ]
+        if not targets:
+            return 0
+
+        if data is None:
+            with open(self.path(digest, mimetype), 'rb') as f:
+                data = f.read()
+        with Image.open(BytesIO(data)) as image:
+            image = image.convert('RGB')
+        for size, variant_mimetype in targets:
+            variant = image.copy()
+            variant.thumbnail(POSTER_SIZES[size], Image.LANCZOS)
+            buffer = BytesIO()
+            variant.save(buffer, POSTER_VARIANT_FORMATS[variant_mimetype], quality=POSTER_VARIANT_QUALITY)
+            self._write(self.path(digest, variant_mimetype, size), buffer.getvalue())
+        return len(targets)
+
+    def _write(self, path, data):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # 先写临时文件再重命名，并发写入同一海报或读进程都不会看到不完整的文件
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def send(self, digest, mimetype, size=None):
+        """返回海报文件的响应
+
+        配置了 POSTER_ACCEL_REDIRECT（如 '/protected-posters/'）时只返回 X-Accel-Redirect 头，
+        由 nginx 直接发送文件；否则用 send_file 发送，USE_X_SENDFILE 打开时 Flask 会改用 X-Sendfile。
+        """
+        accel_prefix = current_app.config.get('POSTER_ACCEL_REDIRECT')
+        if accel_prefix:
+            response = make_response('')
+            response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + self.relative_path(digest, mimetype, size)
+            response.headers['Content-Type'] = mimetype or 'image/jpeg'
+            return response
+        return send_file(self.path(digest, mimetype, size), mimetype=mimetype or 'image/jpeg', etag=False)
+
+
+def poster_version(digest):
+    return digest[:POSTER_VERSION_LENGTH] if digest else None
+
+
+def poster_src(movie, size=None):
+    """模板中使用的海报地址，有摘要时带上版本参数，浏览器可以长期缓存
+
+    size 为 POSTER_SIZES 中的尺寸名时返回对应的缩略图地址。
+    """
+    if isinstance(movie, dict):
+        movie_id, digest = movie.get('id'), movie.get('poster_digest')
+    else:
+        movie_id, digest = movie.id, getattr(movie, 'poster_digest', None)
+    params = {'size': size} if size else {}
+    version = poster_version(digest)
+    if version:
+        params['v'] = version
+    return url_for('movie.movie_poster', movie_id=movie_id, **params)
+
+
+def set_poster_cache_headers(response, etag=None, last_modified=None, immutable=False, fallback=False):
+    """设置海报响应的 ETag、Last-Modified 和 Cache-Control
+
+    fallback 表示请求的缩略图不存在、发送的是原图，此时只缓存很短的时间。
+    """
+    if etag:
+        response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    # send_file 默认带 no-cache，这里改为按 max-age 缓存
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    if fallback:
+        response.cache_control.max_age = current_app.config.get('POSTER_FALLBACK_MAX_AGE', POSTER_FALLBACK_MAX_AGE)
+    elif immutable:
+        response.cache_control.max_age = current_app.config.get('POSTER_IMMUTABLE_MAX_AGE', POSTER_IMMUTABLE_MAX_AGE)
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.max_age = current_app.config.get('POSTER_MAX_AGE', POSTER_MAX_AGE)
+    return response
+
+
+def get_poster_store():
+    """应用配置的海报文件库，默认位于 app/static/posters/store"""
+    root = current_app.config.get('POSTER_STORE_DIR', os.path.join(current_app.static_folder, 'posters', 'store'))
+    return PosterStore(root)
+
+
+def store_poster(movie, data, mimetype):
+    """把海报写入文件库并记录到电影上，没有海报数据时不做任何修改"""
+    if not data:
+        return None
+    try:
+        store = get_poster_store()
+        movie.poster_digest = store.save(data, mimetype)
+        movie.poster_mimetype = mimetype
+    except OSError as e:
+        # 文件库不可写时退回到保存在数据库中
+        logger.error(f"保存海报文件失败，改为写入数据库: {str(e)}")
+        movie.poster_data = data
+        movie.poster_mimetype = mimetype
+        return None
+    try:
+        store.save_variants(movie.poster_digest, mimetype, data=data)
+    except Exception as e:
+        # 缩略图生成失败不影响入库，之后可以用 flask build-poster-variants 补齐
+        logger.warning(f"生成海报缩略图失败 {movie.poster_digest}: {str(e)}")
+    return movie.poster_digest
+
+
+def _build_variants(root, digest, mimetype, force):
+    try:
+        return digest, PosterStore(root).save_variants(digest, mimetype, force=force), None
+    except Exception as e:
+        return digest, 0, str(e)
+
+
+def build_poster_variants(posters, workers=None, force=False):
+    """用进程池为已有海报生成缩略图
+
+    Args:
+        posters: [(摘要, MIME 类型)]
+        workers: 进程数，默认为 CPU 核数
+
+    Returns:
+        (生成的文件数, 失败的海报数)
+    """
+    root = get_poster_store().root
+    written, failed = 0, 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_build_variants, root, digest, mimetype, force) for digest, mimetype in posters]
+        for future in futures:
+            digest, count, error = future.result()
+            if error:
+                failed += 1
+                logger.warning(f"生成海报缩略图失败 {digest}: {error}")
+            written += count
+    return written, failed
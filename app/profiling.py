@@ -0,0 +1,59 @@
+import time
+from contextlib import contextmanager
+import logging
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCounter:
+    """统计一段代码执行的 SQL 语句数量和耗时
+
+    用法:
+        with QueryCounter(db.engine) as counter:
+            ...
+        counter.count, counter.statements
+    """
+
+    def __init__(self, engine, keep_statements=True):
+        self.engine = engine
+        self.keep_statements = keep_statements
+        self.count = 0
+        self.statements = []
+        self.seconds = 0.0
+        self._started = {}
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        if self.keep_statements:
+            self.statements.append(statement)
+        self._started[id(cursor)] = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started = self._started.pop(id(cursor), None)
+        if started is not None:
+            self.seconds += time.perf_counter() - started
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before)
+        event.listen(self.engine, 'after_cursor_execute', self._after)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._before)
+        event.remove(self.engine, 'after_cursor_execute', self._after)
+        return False
+
+@contextmanager
+def assert_max_queries(engine, limit):
+    """断言代码块执行的 SQL 语句不超过 limit 条，超出时列出所有语句
+
+    用法:
+        with assert_max_queries(db.engine, 5):
+            client.get('/movies/')
+    """
+    with QueryCounter(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        statements = '\n'.join(f'  {statement}' for statement in counter.statements)
+        raise AssertionError(f'执行了 {counter.count} 条 SQL，超过上限 {limit}:\n{statements}')
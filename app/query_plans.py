@@ -0,0 +1,190 @@
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from app.models import (Movie, Rating, Favorite, MovieType, MovieNeighbor, UserSimilarity,
+                        movie_type_association, movie_load_options, db)
+from app.people import top_people_query
+
+logger = logging.getLogger(__name__)
+
+# 页面大小与路由中保持一致
+PAGE_SIZE = 20
+
+
+def _movie_list(sample):
+    return Movie.query.options(*movie_load_options('list')).order_by(Movie.id).limit(PAGE_SIZE)
+
+
+def _movie_list_by_rating(sample):
+    return Movie.query.filter(Movie.rating.isnot(None), Movie.rating_count.isnot(None)).order_by(
+        Movie.rating.desc(), Movie.rating_count.desc(), Movie.id.desc()
+    ).limit(PAGE_SIZE)
+
+
+def _movie_list_by_type(sample):
+    return Movie.query.join(
+        movie_type_association, movie_type_association.c.movie_id == Movie.id
+    ).filter(movie_type_association.c.type_id == sample['type_id']).order_by(Movie.id).limit(PAGE_SIZE)
+
+
+def _user_ratings(sample):
+    return Rating.query.filter_by(user_id=sample['user_id']).order_by(
+        Rating.created_at.desc(), Rating.id.desc()
+    ).limit(12)
+
+
+def _favorites(sample):
+    return Favorite.query.filter_by(user_id=sample['user_id']).order_by(
+        Favorite.created_at.desc(), Favorite.id.desc()
+    ).limit(12)
+
+
+def _user_rating_lookup(sample):
+    return Rating.query.filter_by(user_id=sample['user_id'], movie_id=sample['movie_id'])
+
+
+def _similar_movies(sample):
+    return db.session.query(MovieNeighbor.neighbor_id, MovieNeighbor.similarity).filter(
+        MovieNeighbor.movie_id == sample['movie_id']
+    ).order_by(MovieNeighbor.similarity.desc())
+
+
+def _similar_users(sample):
+    return db.session.query(UserSimilarity.user_id2, UserSimilarity.similarity).filter(
+        UserSimilarity.user_id1 == sample['user_id']
+    ).order_by(UserSimilarity.similarity.desc())
+
+
+def _activity_heatmap(sample):
+    end = datetime.now()
+    return db.session.query(func.count(Rating.id)).filter(Rating.created_at.between(end - timedelta(days=7), end))
+
+
+def _year_distribution(sample):
+    return db.session.query(Movie.year, func.count(Movie.id)).group_by(Movie.year).order_by(Movie.year)
+
+
+def _rating_trend(sample):
+    return db.session.query(Movie.year, func.avg(Movie.rating)).group_by(Movie.year).order_by(Movie.year)
+
+
+def _top_directors(sample):
+    return top_people_query('director')
+
+
+def _genre_popularity(sample):
+    return db.session.query(
+        movie_type_association.c.type_id, Movie.id, Movie.rating, Movie.rating_count
+    ).join(Movie, Movie.id == movie_type_association.c.movie_id).filter(Movie.rating.isnot(None))
+
+
+def _evaluation_split(sample):
+    return db.session.query(Rating.user_id, Rating.movie_id).filter(Rating.created_at >= sample['cutoff'])
+
+
+def _favorite_split(sample):
+    return db.session.query(Favorite.user_id, Favorite.movie_id).filter(Favorite.created_at >= sample['cutoff'])
+
+
+def _search(sample):
+    # 搜索由倒排索引完成，数据库只按主键读取本页的电影
+    return Movie.query.options(*movie_load_options('list')).filter(
+        Movie.id.in_(range(sample['movie_id'], sample['movie_id'] + PAGE_SIZE))
+    )
+
+
+# 名称 -> (构造查询的函数, 是否允许全表扫描)
+# 统计整个表的查询本来就要读全表，只列出执行计划，不标记为问题
+QUERY_PATTERNS = {
+    'movie_list': (_movie_list, True),
+    'movie_list_by_rating': (_movie_list_by_rating, False),
+    'movie_list_by_type': (_movie_list_by_type, False),
+    'user_ratings': (_user_ratings, False),
+    'favorites': (_favorites, False),
+    'user_rating_lookup': (_user_rating_lookup, False),
+    'similar_movies': (_similar_movies, False),
+    'similar_users': (_similar_users, False),
+    'activity_heatmap': (_activity_heatmap, False),
+    'year_distribution': (_year_distribution, True),
+    'rating_trend': (_rating_trend, True),
+    'top_directors': (_top_directors, False),
+    'genre_popularity': (_genre_popularity, True),
+    'evaluation_split': (_evaluation_split, False),
+    'favorite_split': (_favorite_split, False),
+    'search': (_search, False),
+}
+
+
+def _sample_values():
+    """从当前数据库中取查询参数，数据越接近生产规模，执行计划越有参考价值"""
+    movie = db.session.query(Movie.id).order_by(Movie.id).first()
+    latest = db.session.query(func.max(Rating.created_at)).scalar() or datetime.now()
+    return {
+        'user_id': db.session.query(Rating.user_id).order_by(Rating.id).limit(1).scalar() or 0,
+        'movie_id': movie.id if movie else 0,
+        'type_id': db.session.query(MovieType.id).order_by(MovieType.id).limit(1).scalar() or 0,
+        'cutoff': latest - timedelta(days=7)
+    }
+
+
+def _is_derived(table):
+    return (table or '').startswith(('anon_', '<derived'))
+
+
+def _explain(statement):
+    """返回 [(表名, 执行计划描述, 是否全表扫描)]
+
+    顺序读取整个索引（MySQL 的 type=index，SQLite 的 SCAN ... USING INDEX）也算作全表扫描。
+    读取子查询的结果（MySQL 的 <derivedN>，SQLite 的 anon_N）不算。
+    """
+    dialect = db.engine.dialect
+    compiled = statement.compile(dialect=dialect, compile_kwargs={'render_postcompile': True})
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+    connection = db.session.connection()
+
+    if dialect.name == 'mysql':
+        rows = connection.exec_driver_sql('EXPLAIN ' + str(compiled), params).mappings().all()
+        return [
+            (row['table'], f"type={row['type']} key={row['key']} rows={row['rows']} {row['Extra'] or ''}".strip(),
+             row['type'] in ('ALL', 'index') and not _is_derived(row['table']))
+            for row in rows
+        ]
+    if dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params).all()
+        plans = []
+        for row in rows:
+            detail = row[-1]
+            words = detail.split()
+            table = words[1] if len(words) > 1 and words[0] in ('SCAN', 'SEARCH') else ''
+            plans.append((table, detail, words[:1] == ['SCAN'] and not _is_derived(table)))
+        return plans
+    raise ValueError(f'不支持的数据库: {dialect.name}')
+
+
+def explain_queries(names=None):
+    """对登记的查询逐个执行 EXPLAIN
+
+    Returns:
+        [{'name': 名称, 'plan': [(表名, 描述, 是否全表扫描)], 'full_scan': 是否存在意外的全表扫描}]
+    """
+    sample = _sample_values()
+    reports = []
+    for name, (build, scan_allowed) in QUERY_PATTERNS.items():
+        if names and name not in names:
+            continue
+        try:
+            plan = _explain(build(sample).statement)
+        except Exception as e:
+            logger.error(f"查询 {name} 的执行计划获取失败: {str(e)}")
+            db.session.rollback()
+            reports.append({'name': name, 'plan': [], 'full_scan': False, 'error': str(e)})
+            continue
+        reports.append({
+            'name': name,
+            'plan': plan,
+            'full_scan': not scan_allowed and any(scan for _, _, scan in plan)
+        })
+    return reports
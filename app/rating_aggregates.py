@@ -0,0 +1,64 @@
+import logging
+from sqlalchemy import func, or_, update
+from app.models import Movie, Rating, db
+
+logger = logging.getLogger(__name__)
+
+# 对账时每批检查的电影ID范围
+RECONCILE_BATCH_SIZE = 5000
+
+
+def apply_rating_change(movie_id, old_rating, new_rating):
+    """在当前事务中更新电影的评分总和与人数
+
+    用 SET col = col + delta 原子更新，不需要先读出电影。old_rating 为 None 表示新增评分，
+    否则为修改评分，只调整总和。
+    """
+    values = {Movie.user_rating_sum: Movie.user_rating_sum + (new_rating - (old_rating or 0))}
+    if old_rating is None:
+        values[Movie.user_rating_count] = Movie.user_rating_count + 1
+    db.session.query(Movie).filter(Movie.id == movie_id).update(values, synchronize_session=False)
+
+
+def reconcile_rating_aggregates(batch_size=RECONCILE_BATCH_SIZE):
+    """按 ratings 表重新计算电影的评分总和与人数，只更新不一致的电影
+
+    批量写入评分（如合成数据）或直接修改数据库之后运行。
+
+    Returns:
+        修正的电影数
+    """
+    max_id = db.session.query(func.max(Movie.id)).scalar() or 0
+    fixed = 0
+    for start in range(0, max_id + 1, batch_size):
+        end = start + batch_size
+        stats = db.session.query(
+            Rating.movie_id,
+            func.sum(Rating.rating).label('total'),
+            func.count(Rating.id).label('count')
+        ).filter(
+            Rating.movie_id >= start, Rating.movie_id < end
+        ).group_by(Rating.movie_id).subquery()
+        total = func.coalesce(stats.c.total, 0)
+        count = func.coalesce(stats.c.count, 0)
+
+        rows = db.session.query(Movie.id, total, count).outerjoin(
+            stats, stats.c.movie_id == Movie.id
+        ).filter(
+            Movie.id >= start, Movie.id < end,
+            or_(
+                Movie.user_rating_sum.is_(None), Movie.user_rating_count.is_(None),
+                Movie.user_rating_sum != total, Movie.user_rating_count != count
+            )
+        ).all()
+        if not rows:
+            continue
+
+        db.session.execute(update(Movie), [
+            {'id': movie_id, 'user_rating_sum': float(movie_total), 'user_rating_count': int(movie_count)}
+            for movie_id, movie_total, movie_count in rows
+        ])
+        db.session.commit()
+        fixed += len(rows)
+        logger.info(f"评分汇总对账: 电影ID {start}-{end - 1} 修正 {len(rows)} 部")
+    return fixed
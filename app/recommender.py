@@ -1,7 +1,14 @@
 import numpy as np
 from scipy.sparse import csr_matrix
 from sklearn.metrics.pairwise import cosine_similarity
-from app.models import Movie, Rating, Favorite, User, UserSimilarity, db, MovieType
+from app.models import Movie, Rating, Favorite, User, UserSimilarity, db, MovieType, movie_load_options
+from app.feature_store import MovieFeatureStore, load_movie_summaries
+from app.collaborative import ItemBasedCF, FAVORITE_WEIGHT
+from app.neighbor_index import NEIGHBOR_COUNT, get_indexed_neighbors
+from app.als import ALSModel
+from app.artifacts import ArtifactReader, get_artifact_store
+from app.hybrid import HybridRecommender, GenrePopularity, HYBRID_CANDIDATES
+from flask import current_app
 import pandas as pd
 from collections import defaultdict, Counter
 import logging
@@ -10,11 +17,38 @@ from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# 可离线发布到模型文件库的模型，名称 -> 由 (arrays, meta) 构造对象的函数
+ARTIFACT_FACTORIES = {
+    'features': MovieFeatureStore.from_artifact,
+    'cf': ItemBasedCF.from_artifact,
+    'als': ALSModel.from_artifact,
+    'popularity': GenrePopularity.from_artifact
+}
+
+
+def _ranked_movies(ranked):
+    """把 [(电影ID, 得分), ...] 转换为推荐列表，保持得分顺序，已删除的电影跳过"""
+    summaries = load_movie_summaries([movie_id for movie_id, _ in ranked])
+    recommendations = []
+    for movie_id, score in ranked:
+        if movie_id in summaries:
+            movie = dict(summaries[movie_id])
+            movie['score'] = round(score, 2)
+            recommendations.append(movie)
+    return recommendations
+
+
 class MovieRecommender:
     def __init__(self):
         self.user_ratings = None
         self.similarity_matrix = None
         self.movie_indices = None
+        self.feature_store = None
+        self.published_features = None
+        self.artifact_readers = {}
+        # 离线评估等场景可以直接指定协同过滤模型和类型热门榜，Web 请求只读取已发布的版本
+        self.cf_model = None
+        self.genre_popularity = None
 
     def calculate_similarity(self, movie1, movie2):
         """计算两部电影的相似度"""
@@ -92,78 +126,213 @@ class MovieRecommender:
 
         return total_similarity, similarity_details
 
+    def get_artifact(self, name):
+        """读取模型文件库中已发布的模型，发布新版本后自动切换，未发布时返回 None"""
+        if name not in self.artifact_readers:
+            self.artifact_readers[name] = ArtifactReader(get_artifact_store(), name, ARTIFACT_FACTORIES[name])
+        return self.artifact_readers[name].get()
+
+    def get_feature_store(self):
+        """获取电影特征库
+
+        优先使用已发布的特征库（内存映射，多进程共享），否则首次调用时从数据库构建，
+        之后都按需增量追加新电影。
+        """
+        published = self.get_artifact('features')
+        if published is not None and published is not self.published_features:
+            self.published_features = published
+            self.feature_store = published
+
+        if self.feature_store is None:
+            self.feature_store = MovieFeatureStore.load()
+        elif self.published_features is not None:
+            # 已发布的特征库由离线任务定期重建，这里只追加新电影
+            self.feature_store = self.feature_store.refresh(max_age=None)
+        else:
+            self.feature_store = self.feature_store.refresh()
+        return self.feature_store
+
     def get_similar_movies(self, movie_id, limit=6):
-        """获取与指定电影相似的电影"""
-        target_movie = Movie.query.get(movie_id)
-        if not target_movie:
+        """获取与指定电影相似的电影，优先读取预计算的相似电影索引"""
+        if limit <= NEIGHBOR_COUNT:
+            similar_movies = get_indexed_neighbors(movie_id, limit)
+            if similar_movies is not None:
+                return similar_movies
+        return self.compute_similar_movies(movie_id, limit)
+
+    def compute_similar_movies(self, movie_id, limit=6):
+        """基于特征库实时计算相似电影"""
+        store = self.get_feature_store()
+        target = store.index.get(movie_id)
+        if target is None:
             return []
 
-        all_movies = Movie.query.filter(Movie.id != movie_id).all()
+        scores, details = store.similarity([target])
+        scores, details = scores[0], {name: values[0] for name, values in details.items()}
+        scores[target] = 0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        rounded = np.round(scores[candidates], 1)
+        candidates = candidates[np.lexsort((candidates, -rounded))]
 
         similar_movies = []
-        for movie in all_movies:
-            similarity_score, details = self.calculate_similarity(target_movie, movie)
-            if similarity_score > 0:
-                similar_movies.append({
-                    'id': movie.id,
-                    'title': movie.title,
-                    'year': movie.year,
-                    'rating': movie.rating,
-                    'types': [t.name for t in movie.types],
-                    'similarity_score': round(similarity_score, 1),
-                    'similarity_details': {
-                        'type': round(details['type_similarity'], 1),
-                        'year': round(details['year_similarity'], 1),
-                        'rating': round(details['rating_similarity'], 1),
-                        'duration': round(details['duration_similarity'], 1),
-                        'language': round(details['language_similarity'], 1)
-                    }
-                })
-
-        similar_movies.sort(key=lambda x: x['similarity_score'], reverse=True)
-        return similar_movies[:limit]
+        for i in candidates:
+            movie = store.movie_summary(i)
+            movie['similarity_score'] = round(float(scores[i]), 1)
+            movie['similarity_details'] = {
+                name: round(float(values[i]), 1) for name, values in details.items()
+            }
+            similar_movies.append(movie)
+        return similar_movies
+
+    def rank_by_profile(self, store, profile, limit, exclude=None, block_size=2048):
+        """以一组电影为画像，批量计算全部电影与画像中每部电影的相似度
+
+        按块计算 候选 × 画像 的相似度矩阵，逐行取最大值作为候选得分，
+        再用部分排序选出前 limit 个，避免对全部候选排序。
+
+        Args:
+            store: 电影特征库
+            profile: 画像电影在特征库中的行号数组
+            limit: 返回数量
+            exclude: 需要排除的行号数组，默认排除画像电影本身
+
+        Returns:
+            (candidates, scores, matches): 候选行号、得分以及最相似的画像电影行号
+        """
+        profile = np.asarray(profile, dtype=np.int64)
+        best_scores = np.zeros(len(store))
+        best_matches = np.zeros(len(store), dtype=np.int64)
+        for block_start in range(0, len(store), block_size):
+            rows = np.arange(block_start, min(block_start + block_size, len(store)))
+            scores, _ = store.similarity(rows, profile)
+            best = scores.argmax(axis=1)
+            best_matches[rows] = profile[best]
+            best_scores[rows] = scores[np.arange(len(rows)), best]
+
+        best_scores[profile if exclude is None else exclude] = 0
+        candidates = np.flatnonzero(best_scores > 0)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-best_scores[candidates], limit - 1)[:limit]]
+        rounded = np.round(best_scores[candidates], 1)
+        candidates = candidates[np.lexsort((candidates, -rounded))]
+        return candidates, best_scores[candidates], best_matches[candidates]
+
+    def get_user_favorites(self, user_id):
+        """用户收藏的电影ID，按收藏顺序排列"""
+        return [
+            row.movie_id for row in
+            db.session.query(Favorite.movie_id).filter(Favorite.user_id == user_id).order_by(Favorite.id)
+        ]
 
     def get_favorite_type_recommendations(self, user_id, limit=20):
         """基于用户收藏电影的特征，推荐相似电影"""
-        favorite_movies = Movie.query.join(Favorite).filter(Favorite.user_id == user_id).all()
-        
-        if not favorite_movies:
+        favorite_ids = self.get_user_favorites(user_id)
+        if not favorite_ids:
             return []
 
-        all_movies = Movie.query.outerjoin(
-            Favorite, 
-            db.and_(
-                Favorite.movie_id == Movie.id,
-                Favorite.user_id == user_id
-            )
-        ).filter(Favorite.id == None).all()
+        store = self.get_feature_store()
+        profile = [store.index[movie_id] for movie_id in favorite_ids if movie_id in store.index]
+        if not profile:
+            return []
+
+        candidates, scores, matches = self.rank_by_profile(store, profile, limit)
+        if not len(candidates):
+            return []
+        _, details = store.pair_similarity(candidates, matches)
+
+        movie_ids = [int(store.movie_ids[i]) for i in candidates]
+        movies = {
+            movie.id: movie for movie in
+            Movie.query.options(*movie_load_options('list')).filter(Movie.id.in_(movie_ids))
+        }
 
         recommendations = []
-        for movie in all_movies:
-            max_similarity = 0
-            most_similar_movie = None
-            best_similarity_details = None
-            
-            for fav_movie in favorite_movies:
-                similarity, details = self.calculate_similarity(movie, fav_movie)
-                if similarity > max_similarity:
-                    max_similarity = similarity
-                    most_similar_movie = fav_movie
-                    best_similarity_details = details
-
-            if max_similarity > 0:
-                recommendations.append({
-                    'movie': movie,
-                    'similarity_score': round(max_similarity, 1),
-                    'similar_movie': most_similar_movie.title,
-                    'similarity_details': {
-                        'type': round(best_similarity_details['type_similarity'], 1),
-                        'year': round(best_similarity_details['year_similarity'], 1),
-                        'rating': round(best_similarity_details['rating_similarity'], 1),
-                        'duration': round(best_similarity_details['duration_similarity'], 1),
-                        'language': round(best_similarity_details['language_similarity'], 1)
-                    }
-                })
-
-        recommendations.sort(key=lambda x: x['similarity_score'], reverse=True)
-        return recommendations[:limit] 
\ No newline at end of file
+        for n, (movie_id, score, match) in enumerate(zip(movie_ids, scores, matches)):
+            if movie_id not in movies:
+                continue
+            recommendations.append({
+                'movie': movies[movie_id],
+                'similarity_score': round(float(score), 1),
+                'similar_movie': store.titles[match],
+                'similarity_details': {
+                    name: round(float(values[n]), 1) for name, values in details.items()
+                }
+            })
+        return recommendations
+
+    def get_cf_model(self):
+        """获取 flask publish-artifacts 发布的协同过滤模型
+
+        请求中不训练模型，没有发布时返回 None（离线评估等场景可以直接指定 cf_model）。
+        """
+        published = self.get_artifact('cf')
+        return published if published is not None else self.cf_model
+
+    def get_user_profile(self, user_id):
+        """读取用户评分和收藏过的电影，返回 (电影ID列表, 权重列表)"""
+        movie_ids, values = [], []
+        for movie_id, rating in db.session.query(Rating.movie_id, Rating.rating).filter(Rating.user_id == user_id):
+            movie_ids.append(movie_id)
+            values.append(rating)
+        for (movie_id,) in db.session.query(Favorite.movie_id).filter(Favorite.user_id == user_id):
+            movie_ids.append(movie_id)
+            values.append(FAVORITE_WEIGHT)
+        return movie_ids, values
+
+    def get_personalized_recommendations(self, user_id, limit=12):
+        """基于物品协同过滤的个性化推荐，模型未发布时返回空列表"""
+        model = self.get_cf_model()
+        if model is None:
+            return []
+        movie_ids, values = self.get_user_profile(user_id)
+        if not movie_ids:
+            return []
+        return _ranked_movies(model.recommend(movie_ids, values, limit=limit))
+
+    def get_als_model(self):
+        """获取已发布的 ALS 模型，没有训练过时返回 None"""
+        return self.get_artifact('als')
+
+    def get_als_recommendations(self, user_id, limit=12):
+        """基于矩阵分解的个性化推荐，模型未训练时回退到物品协同过滤"""
+        model = self.get_als_model()
+        if model is None:
+            return self.get_personalized_recommendations(user_id, limit=limit)
+
+        movie_ids, values = self.get_user_profile(user_id)
+        if not movie_ids:
+            return []
+        return _ranked_movies(model.recommend(movie_ids, values, limit=limit))
+
+    def get_genre_popularity(self):
+        """获取已发布的各类型热门电影榜，没有发布时返回 None，不在请求中构建"""
+        published = self.get_artifact('popularity')
+        return published if published is not None else self.genre_popularity
+
+    def get_hybrid_recommendations(self, user_id, limit=12, with_timings=False):
+        """混合推荐：内容相似、协同过滤和类型热门三路候选合并后重排序
+
+        权重和每路候选数量可通过配置 HYBRID_WEIGHTS、HYBRID_CANDIDATES 调整。
+        with_timings 为 True 时返回 (推荐列表, 各阶段耗时)。
+        """
+        hybrid = HybridRecommender(
+            self,
+            weights=current_app.config.get('HYBRID_WEIGHTS'),
+            candidates=current_app.config.get('HYBRID_CANDIDATES', HYBRID_CANDIDATES)
+        )
+        recommendations, timings = hybrid.recommend(user_id, limit=limit)
+        return (recommendations, timings) if with_timings else recommendations
+
+    def get_similar_users(self, user_id, limit=10):
+        """从 user_similarities 表读取与用户最相似的用户，返回 [(用户ID, 相似度), ...]"""
+        rows = db.session.query(
+            UserSimilarity.user_id2, UserSimilarity.similarity
+        ).filter(
+            UserSimilarity.user_id1 == user_id
+        ).order_by(
+            UserSimilarity.similarity.desc()
+        ).limit(limit).all()
+        return [(row.user_id2, row.similarity) for row in rows]
@@ -0,0 +1,115 @@
+import time
+import logging
+import threading
+from collections import namedtuple
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from app.models import MovieType, db
+
+logger = logging.getLogger(__name__)
+
+# 多进程部署时，其他进程新建的类型最迟在这么多秒后可见
+REFERENCE_CHECK_INTERVAL = 60
+
+# 缓存中的类型只保存ID和名称，可以跨请求、跨会话使用
+TypeRef = namedtuple('TypeRef', ['id', 'name'])
+
+
+class MovieTypeCatalog:
+    """进程内的电影类型缓存
+
+    类型很少变化，页面和爬虫每次都查数据库没有必要。本进程新建类型时版本号加一，缓存立即失效；
+    其他进程新建的类型通过定期比较 (数量, 最大ID) 发现。
+    """
+
+    def __init__(self, check_interval=REFERENCE_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.version = 0
+        self._lock = threading.Lock()
+        self._loaded_version = None
+        self._signature = None
+        self._checked_at = 0
+        self._types = ()
+        self._by_name = {}
+
+    def _signature_from_db(self):
+        count, max_id = db.session.query(func.count(MovieType.id), func.max(MovieType.id)).one()
+        return count, max_id
+
+    def _snapshot(self):
+        now = time.time()
+        if self._loaded_version == self.version and now - self._checked_at < self.check_interval:
+            return self._types, self._by_name
+
+        with self._lock:
+            if self._loaded_version != self.version or now - self._checked_at >= self.check_interval:
+                signature = self._signature_from_db()
+                if self._loaded_version != self.version or signature != self._signature:
+                    types = tuple(
+                        TypeRef(row.id, row.name)
+                        for row in db.session.query(MovieType.id, MovieType.name).order_by(MovieType.id)
+                    )
+                    self._types = types
+                    self._by_name = {movie_type.name: movie_type for movie_type in types}
+                    self._signature = signature
+                    self._loaded_version = self.version
+                    logger.info(f"已加载 {len(types)} 个电影类型，版本 {self.version}")
+                self._checked_at = now
+        return self._types, self._by_name
+
+    def all(self):
+        """按ID排序的全部类型"""
+        return self._snapshot()[0]
+
+    def get(self, name):
+        """按名称查找类型，不存在时返回 None"""
+        return self._snapshot()[1].get(name)
+
+    def invalidate(self):
+        """使缓存失效，下次访问时重新加载"""
+        with self._lock:
+            self.version += 1
+
+    def get_or_create(self, name):
+        """返回类型，不存在时在当前事务中创建
+
+        其他进程可能同时创建同名类型，唯一约束冲突时回滚到保存点后重新查询。
+        """
+        movie_type = self.get(name)
+        if movie_type is not None:
+            return movie_type
+
+        row = db.session.query(MovieType.id, MovieType.name).filter_by(name=name).first()
+        if row is None:
+            try:
+                with db.session.begin_nested():
+                    created = MovieType(name=name)
+                    db.session.add(created)
+                logger.info(f"创建新的电影类型: {name}")
+                row = created
+            except IntegrityError:
+                row = db.session.query(MovieType.id, MovieType.name).filter_by(name=name).one()
+        self.invalidate()
+        return TypeRef(row.id, row.name)
+
+    def instance(self, name):
+        """当前会话中的 MovieType 对象，用于添加到 movie.types
+
+        对象已在会话中时不查询数据库。
+        """
+        movie_type = db.session.get(MovieType, self.get_or_create(name).id)
+        if movie_type is None:
+            # 缓存中的类型已被回滚或删除，重新加载后再取一次
+            self.invalidate()
+            movie_type = db.session.get(MovieType, self.get_or_create(name).id)
+        return movie_type
+
+
+def get_movie_type_catalog():
+    """获取当前应用的电影类型缓存"""
+    if not hasattr(current_app, 'movie_type_catalog'):
+        current_app.movie_type_catalog = MovieTypeCatalog(
+            current_app.config.get('REFERENCE_CHECK_INTERVAL', REFERENCE_CHECK_INTERVAL)
+        )
+    return current_app.movie_type_catalog
@@ -1,16 +1,34 @@
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, send_file, current_app
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, send_file, current_app, abort
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import is_resource_modified
 from flask_login import login_required, current_user
 from io import BytesIO
-from app.models import db, Movie, Rating, User, Favorite, MovieType
+from app.models import db, Movie, Rating, User, Favorite, MovieType, movie_type_association, movie_load_options
+from app.reference_data import get_movie_type_catalog
+from app.pagination import keyset_paginate, estimate_row_count, offset_page, decode_offset
+from app.search_index import get_movie_search
+from app.typeahead import get_movie_typeahead, TYPEAHEAD_LIMIT
 from app.recommender import MovieRecommender
+from app.cache import get_recommendation_cache, SIMILAR, FAVORITE_TYPE, PERSONALIZED
+from app.rating_aggregates import apply_rating_change
+from app.poster_store import get_poster_store, poster_version, set_poster_cache_headers, POSTER_SIZES
 from app.visualization import MovieVisualizer
 from app.douban_spider import DoubanSpider
 import logging
+import hashlib
 from datetime import datetime, timedelta
 from sqlalchemy import func
+from sqlalchemy.orm import joinedload
 
 logger = logging.getLogger(__name__)
 movie_bp = Blueprint('movie', __name__, url_prefix='/movies')
+
+# 电影列表的排序方式，最后一列为主键，保证排序唯一
+MOVIE_SORTS = {
+    'id': [(Movie.id, False)],
+    'rating': [(Movie.rating, True), (Movie.rating_count, True), (Movie.id, True)]
+}
+
 visualizer = MovieVisualizer(db)
 
 def get_recommender():
@@ -22,12 +40,23 @@ def get_recommender():
 @movie_bp.route('/')
 @login_required
 def movie_list():
-    page = request.args.get('page', 1, type=int)
-    per_page = 20
-    movies = Movie.query.paginate(page=page, per_page=per_page)
+    sort = request.args.get('sort', 'id')
+    if sort not in MOVIE_SORTS:
+        sort = 'id'
+    query = Movie.query.options(*movie_load_options('list'))
+    # 按评分排序时过滤掉了没有评分的电影，全表行数与结果不符，不显示总数
+    total, total_is_estimate = None, False
+    if sort == 'rating':
+        query = query.filter(Movie.rating.isnot(None), Movie.rating_count.isnot(None))
+    else:
+        total, total_is_estimate = estimate_row_count(db.session, Movie.__table__)
+    movies = keyset_paginate(
+        query, MOVIE_SORTS[sort], f'movies:{sort}', request.args.get('cursor'),
+        per_page=20, total=total, total_is_estimate=total_is_estimate
+    )
     
     # 获取所有电影类型
-    all_types = MovieType.query.all()
+    all_types = get_movie_type_catalog().all()
     
     # 获取用户收藏的电影ID列表
     favorite_movie_ids = {f.movie_id for f in current_user.favorites} if current_user.is_authenticated else set()
@@ -37,6 +66,7 @@ def movie_list():
                          favorite_movie_ids=favorite_movie_ids,
                          all_types=all_types,
                          current_type=None,
+                         sort=sort,
                          title="全部电影")
 
 @movie_bp.route('/data_analysis')
@@ -57,7 +87,8 @@ def data_analysis():
 @movie_bp.route('/<int:movie_id>')
 @login_required
 def movie_detail(movie_id):
-    movie = Movie.query.get_or_404(movie_id)
+    # 海报由海报地址单独提供，详情页不加载海报数据
+    movie = Movie.query.options(*movie_load_options('detail')).get_or_404(movie_id)
     user_rating = Rating.query.filter_by(
         user_id=current_user.id,
         movie_id=movie_id
@@ -69,7 +100,9 @@ def movie_detail(movie_id):
         movie_id=movie_id
     ).first() is not None
     
-    similar_movies = get_recommender().get_similar_movies(movie_id)
+    similar_movies = get_recommendation_cache().get_or_compute(
+        SIMILAR, movie_id, lambda: get_recommender().get_similar_movies(movie_id)
+    )
     return render_template(
         'movie/detail.html',
         movie=movie,
@@ -115,12 +148,14 @@ def rate_movie(movie_id):
         movie = Movie.query.get_or_404(movie_id)
         
         # 检查是否已经评分
+        # 锁定已有评分，并发修改同一评分时按顺序计算评分总和的变化
         existing_rating = Rating.query.filter_by(
             user_id=current_user.id, movie_id=movie_id
-        ).first()
+        ).with_for_update().first()
 
         if existing_rating:
             # 更新评分
+            apply_rating_change(movie_id, existing_rating.rating, rating)
             existing_rating.rating = rating
             existing_rating.updated_at = datetime.utcnow()
         else:
@@ -131,19 +166,21 @@ def rate_movie(movie_id):
                 rating=rating
             )
             db.session.add(new_rating)
+            apply_rating_change(movie_id, None, rating)
         
         db.session.commit()
+        get_recommendation_cache().invalidate_user(current_user.id)
 
-        # 计算新的平均分
-        avg_rating = db.session.query(func.avg(Rating.rating)).filter_by(movie_id=movie_id).scalar() or 0
-        rating_count = db.session.query(func.count(Rating.id)).filter_by(movie_id=movie_id).scalar() or 0
+        # 读取更新后的评分总和与人数
+        db.session.refresh(movie, ['user_rating_sum', 'user_rating_count'])
+        avg_rating = movie.user_rating_sum / movie.user_rating_count if movie.user_rating_count else 0
 
         return jsonify({
             "success": True,
             "message": "评分成功",
             "data": {
                 "avg_rating": round(float(avg_rating), 1),
-                "rating_count": rating_count
+                "rating_count": movie.user_rating_count
             }
         })
 
@@ -160,29 +197,26 @@ def rate_movie(movie_id):
 @login_required
 def recommendations():
     """获取个性化推荐"""
-    recommender = get_recommender()
-    recommendations = recommender.get_personalized_recommendations(current_user.id)
+    recommendations = get_recommendation_cache().get_or_compute(
+        PERSONALIZED, current_user.id,
+        lambda: get_recommender().get_hybrid_recommendations(current_user.id)
+    )
     return render_template('movie/recommendations.html', recommendations=recommendations)
 
 @movie_bp.route('/movie/<int:movie_id>/similar')
 @login_required
 def similar_movies(movie_id):
     """获取相似电影推荐"""
-    recommender = get_recommender()
-    similar_movies = recommender.get_similar_movies(movie_id)
+    similar_movies = get_recommendation_cache().get_or_compute(
+        SIMILAR, movie_id, lambda: get_recommender().get_similar_movies(movie_id)
+    )
     return render_template('movie/similar_movies.html', 
                          similar_movies=similar_movies,
                          current_movie=Movie.query.get_or_404(movie_id))
 
-@movie_bp.route('/recommendations/favorite-types')
-@login_required
-def favorite_type_recommendations():
-    """基于用户收藏类型的推荐"""
-    recommender = get_recommender()
-    recommendations = recommender.get_favorite_type_recommendations(current_user.id)
-    
-    # 获取用户收藏的电影ID列表
-    favorite_movie_ids = {f.movie_id for f in current_user.favorites}
+def build_favorite_type_recommendations(user_id):
+    """计算基于收藏类型的推荐，转换为可缓存的字典列表"""
+    recommendations = get_recommender().get_favorite_type_recommendations(user_id)
     
     # 处理推荐结果，确保每个电影对象包含所需的所有属性
     movies = []
@@ -198,6 +232,17 @@ def favorite_type_recommendations():
             'similar_movie': rec['similar_movie'],
             'similarity_details': rec['similarity_details']
         })
+    return movies
+
+@movie_bp.route('/recommendations/favorite-types')
+@login_required
+def favorite_type_recommendations():
+    """基于用户收藏类型的推荐"""
+    # 获取用户收藏的电影ID列表
+    favorite_movie_ids = {f.movie_id for f in current_user.favorites}
+    movies = get_recommendation_cache().get_or_compute(
+        FAVORITE_TYPE, current_user.id, lambda: build_favorite_type_recommendations(current_user.id)
+    )
     
     return render_template(
         'movie/favorite_type_recommendations.html',
@@ -210,15 +255,13 @@ def favorite_type_recommendations():
 @login_required
 def user_ratings():
     """用户评分记录"""
-    page = request.args.get('page', 1, type=int)
-    per_page = 12
-    
-    # 获取用户的所有评分记录
-    ratings = Rating.query.filter_by(
-        user_id=current_user.id
-    ).order_by(
-        Rating.created_at.desc()
-    ).paginate(page=page, per_page=per_page, error_out=False)
+    # 获取用户的评分记录，按评分时间倒序
+    query = Rating.query.options(joinedload(Rating.movie)).filter_by(user_id=current_user.id)
+    ratings = keyset_paginate(
+        query, [(Rating.created_at, True), (Rating.id, True)], 'ratings', request.args.get('cursor'),
+        per_page=12,
+        total=db.session.query(func.count(Rating.id)).filter(Rating.user_id == current_user.id).scalar()
+    )
     
     return render_template(
         'movie/user_ratings.html',
@@ -229,32 +272,95 @@ def user_ratings():
 @movie_bp.route('/search')
 @login_required
 def search_movies():
-    query = request.args.get('q', '')
+    query = request.args.get('q', '').strip()
     if not query:
         return redirect(url_for('movie.movie_list'))
-        
-    movies = Movie.query.filter(
-        Movie.title.ilike(f'%{query}%') |
-        Movie.directors.ilike(f'%{query}%') |
-        Movie.actors.ilike(f'%{query}%')
-    ).all()
-    
+
+    # 倒排索引返回按相关度排序的电影ID，只从数据库读取本页的电影
+    per_page = 20
+    key = f'search:{query}'
+    offset = decode_offset(request.args.get('cursor'), key)
+    result = get_movie_search().search(query, offset, per_page)
+    # 进程内的索引还在后台构建时先提示稍后再试
+    building = result is None
+    movie_ids, total = result or ([], 0)
+    movies = []
+    if movie_ids:
+        loaded = {movie.id: movie for movie in Movie.query.options(*movie_load_options('list')).filter(
+            Movie.id.in_(movie_ids)
+        )}
+        movies = [loaded[movie_id] for movie_id in movie_ids if movie_id in loaded]
+
     return render_template('movie/search_results.html',
                          movies=movies,
-                         query=query)
+                         page=offset_page(movies, key, offset, per_page, total),
+                         query=query,
+                         building=building)
+
+@movie_bp.route('/api/typeahead')
+def typeahead():
+    """搜索框自动补全，每次输入都会请求，只查询进程内的索引，不访问数据库，新电影由后台线程追加
+
+    只返回公开的标题和人名，不要求登录，也就不需要加载当前用户。
+    """
+    limit = max(1, min(request.args.get('limit', TYPEAHEAD_LIMIT, type=int), 20))
+    suggestions = get_movie_typeahead().suggest(request.args.get('q', ''), limit)
+    for suggestion in suggestions:
+        if suggestion['type'] == 'movie':
+            suggestion['url'] = url_for('movie.movie_detail', movie_id=suggestion['movie_id'])
+        else:
+            suggestion['url'] = url_for('movie.search_movies', q=suggestion['text'])
+    return jsonify({'query': request.args.get('q', ''), 'suggestions': suggestions})
 
 @movie_bp.route('/poster/<int:movie_id>')
 def movie_poster(movie_id):
-    """从数据库中提供电影海报"""
+    """提供电影海报，优先从海报文件库发送文件，不读取数据库中的海报数据
+
+    ETag 为海报内容的摘要，浏览器带 If-None-Match/If-Modified-Since 重新验证时直接返回 304；
+    URL 中的版本参数 v 与当前海报一致时返回 immutable 的长期缓存头。
+    size 参数可取 thumb、card、full，返回入库时生成的缩略图。
+    """
     try:
-        movie = Movie.query.get_or_404(movie_id)
-        
-        # 如果数据库中有海报数据，直接返回
-        if movie.poster_data:
-            return send_file(
-                BytesIO(movie.poster_data),
-                mimetype=movie.poster_mimetype or 'image/jpeg'
+        movie = db.session.query(
+            Movie.poster_digest, Movie.poster_mimetype, Movie.poster_url
+        ).filter(Movie.id == movie_id).first()
+        if movie is None:
+            abort(404)
+
+        if movie.poster_digest:
+            store = get_poster_store()
+            digest, mimetype, size = movie.poster_digest, movie.poster_mimetype, None
+            # 请求缩略图时按 Accept 选择 WebP 或 JPEG，缩略图还没生成时发送原图
+            if request.args.get('size') in POSTER_SIZES:
+                variant_mimetype = 'image/webp' if 'image/webp' in request.headers.get('Accept', '') else 'image/jpeg'
+                if store.exists(digest, variant_mimetype, request.args['size']):
+                    mimetype, size = variant_mimetype, request.args['size']
+            etag = f"{digest}-{size}-{mimetype.split('/')[-1]}" if size else digest
+
+            last_modified = store.last_modified(digest, mimetype, size)
+            if last_modified is not None:
+                # 只有实际发送了所请求的版本才能长期缓存，回退到原图时缩略图生成后要能换上
+                fallback = 'size' in request.args and size is None
+                immutable = request.args.get('v') == poster_version(digest) and not fallback
+                if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                    response = store.send(digest, mimetype, size)
+                else:
+                    response = current_app.response_class(status=304)
+                if 'size' in request.args:
+                    response.vary.add('Accept')
+                return set_poster_cache_headers(response, etag, last_modified, immutable, fallback)
+            logger.warning(f"电影 {movie_id} 的海报文件不存在: {digest}")
+
+        # 尚未迁移到文件库的海报仍从数据库读取
+        poster_data = db.session.query(Movie.poster_data).filter(Movie.id == movie_id).scalar()
+        if poster_data:
+            response = send_file(
+                BytesIO(poster_data),
+                mimetype=movie.poster_mimetype or 'image/jpeg',
+                etag=False
             )
+            set_poster_cache_headers(response, hashlib.sha256(poster_data).hexdigest())
+            return response.make_conditional(request)
         
         # 如果有海报URL，重定向到URL
         if movie.poster_url:
@@ -266,6 +372,8 @@ def movie_poster(movie_id):
             mimetype='image/jpeg'
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error serving poster for movie {movie_id}: {str(e)}")
         # 出错时返回默认海报
@@ -300,6 +408,7 @@ def toggle_favorite(movie_id):
             is_favorite = True
 
         db.session.commit()
+        get_recommendation_cache().invalidate_user(current_user.id)
         logger.info(f"Successfully processed favorite toggle: {message}")
         
         return jsonify({
@@ -320,14 +429,12 @@ def toggle_favorite(movie_id):
 @login_required
 def favorites():
     """显示用户收藏的电影列表"""
-    page = request.args.get('page', 1, type=int)
-    per_page = 12
-    
-    favorites = Favorite.query.filter_by(
-        user_id=current_user.id
-    ).order_by(
-        Favorite.created_at.desc()
-    ).paginate(page=page, per_page=per_page, error_out=False)
+    query = Favorite.query.options(joinedload(Favorite.movie)).filter_by(user_id=current_user.id)
+    favorites = keyset_paginate(
+        query, [(Favorite.created_at, True), (Favorite.id, True)], 'favorites', request.args.get('cursor'),
+        per_page=12,
+        total=db.session.query(func.count(Favorite.id)).filter(Favorite.user_id == current_user.id).scalar()
+    )
     
     return render_template(
         'movie/favorites.html',
@@ -430,17 +537,24 @@ def rating_heatmap():
 @movie_bp.route('/type/<type_name>')
 @login_required
 def movie_list_by_type(type_name):
-    page = request.args.get('page', 1, type=int)
-    per_page = 20
-    
     # 获取指定类型
-    movie_type = MovieType.query.filter_by(name=type_name).first_or_404()
+    movie_type = get_movie_type_catalog().get(type_name)
+    if movie_type is None:
+        abort(404)
     
-    # 获取该类型的所有电影
-    movies = Movie.query.filter(Movie.types.contains(movie_type)).paginate(page=page, per_page=per_page)
+    # 获取该类型的电影，关联表上的 (type_id, movie_id) 索引同时用于筛选和排序
+    query = Movie.query.options(*movie_load_options('list')).join(
+        movie_type_association, movie_type_association.c.movie_id == Movie.id
+    ).filter(movie_type_association.c.type_id == movie_type.id)
+    total = db.session.query(func.count()).select_from(movie_type_association).filter(
+        movie_type_association.c.type_id == movie_type.id
+    ).scalar()
+    movies = keyset_paginate(
+        query, MOVIE_SORTS['id'], f'type:{movie_type.id}', request.args.get('cursor'), per_page=20, total=total
+    )
     
     # 获取所有电影类型
-    all_types = MovieType.query.all()
+    all_types = get_movie_type_catalog().all()
     
     # 获取用户收藏的电影ID列表
     favorite_movie_ids = {f.movie_id for f in current_user.favorites} if current_user.is_authenticated else set()
@@ -450,8 +564,15 @@ def movie_list_by_type(type_name):
                          favorite_movie_ids=favorite_movie_ids,
                          all_types=all_types,
                          current_type=movie_type,
+                         sort='id',
                          title=f"{type_name}电影")
 
+@movie_bp.route('/api/recommendation-cache/stats')
+@login_required
+def recommendation_cache_stats():
+    """推荐缓存的命中、未命中和淘汰次数，用于评估缓存容量"""
+    return jsonify(get_recommendation_cache().stats())
+
 # 数据可视化API
 @movie_bp.route('/api/visualizations/rating-distribution')
 @login_required
@@ -0,0 +1,405 @@
+import re
+import time
+import logging
+import threading
+import unicodedata
+import numpy as np
+from scipy.sparse import csr_matrix
+from flask import current_app
+from sqlalchemy import func
+from app.models import Movie, db
+from app.artifacts import ArtifactReader, get_artifact_store, csr_arrays, csr_from_arrays
+
+logger = logging.getLogger(__name__)
+
+# 各字段的权重，词在标题中出现比在演员中出现更重要
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'directors': 2.0,
+    'actors': 1.0
+}
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 检查新电影的最小间隔和未发布索引时完整重建的间隔（秒）
+SEARCH_CHECK_INTERVAL = 5
+SEARCH_MAX_AGE = 3600
+
+# 中日文字符连续出现的片段切成二元组，其余按字母数字组成的词切分
+_CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_TOKEN_PATTERN = re.compile(f'([{_CJK}]+)|([^\\W_{_CJK}]+)')
+
+
+def _runs(text):
+    """规范化（全角转半角、小写）后切出 (片段, 是否为中日文)"""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    for cjk, word in _TOKEN_PATTERN.findall(text):
+        if cjk:
+            yield cjk, True
+        else:
+            yield word, False
+
+
+def document_terms(text):
+    """文档的词项：单词，以及中日文的单字和二元组；单字只用于只有一个字的查询"""
+    for run, cjk in _runs(text):
+        if not cjk:
+            yield run
+            continue
+        yield from run
+        for i in range(len(run) - 1):
+            yield run[i:i + 2]
+
+
+def query_terms(text):
+    """查询的词项，去重后保持顺序；中日文片段只有一个字时按单字查询"""
+    terms = []
+    for run, cjk in _runs(text):
+        if cjk and len(run) > 1:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            terms.append(run)
+    return list(dict.fromkeys(terms))
+
+
+def _movie_fields(row):
+    return {
+        'title': ' '.join(filter(None, [row.title, row.original_title])),
+        'directors': row.directors,
+        'actors': row.actors
+    }
+
+
+class MovieSearchIndex:
+    """电影全文检索倒排索引
+
+    对标题（含原名）、导演和演员建立倒排表，中文按二元组切分，英文按单词切分，
+    用 BM25 打分，字段按 FIELD_WEIGHTS 加权。查询时只读取查询词的倒排表，
+    求交集后只对候选电影打分，耗时与电影总数基本无关。
+
+    倒排表保存为 词项 × 文档 的 CSR 矩阵，词项按字典序排列，用二分查找定位；
+    可以发布到模型文件库，多个进程内存映射共享。新入库的电影追加到进程内的增量表，
+    不修改已有数组。
+    """
+
+    def __init__(self, movie_ids, terms, postings, doc_lengths, popularity):
+        self.movie_ids = movie_ids
+        self.terms = terms
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.popularity = popularity
+
+        self.base_size = len(movie_ids)
+        # 增量表：词项 -> ([文档序号], [词频])，文档序号从 base_size 开始递增
+        self._delta = {}
+        self._delta_positions = {}
+        self._deleted = set()
+        self._lock = threading.Lock()
+        self._update_totals()
+
+        self.built_at = time.time()
+        self.checked_at = self.built_at
+
+    def __len__(self):
+        return len(self.movie_ids) - len(self._deleted)
+
+    @property
+    def max_movie_id(self):
+        return int(self.movie_ids.max()) if len(self.movie_ids) else 0
+
+    def _update_totals(self):
+        live = len(self)
+        total_length = float(self.doc_lengths.sum())
+        if self._deleted:
+            total_length -= float(self.doc_lengths[list(self._deleted)].sum())
+        self.avg_doc_length = total_length / live if live else 0.0
+
+    @staticmethod
+    def _query_movies(min_id=None, movie_ids=None):
+        query = db.session.query(
+            Movie.id, Movie.title, Movie.original_title, Movie.directors, Movie.actors, Movie.rating_count
+        )
+        if min_id is not None:
+            query = query.filter(Movie.id > min_id)
+        if movie_ids is not None:
+            query = query.filter(Movie.id.in_(movie_ids))
+        return query.order_by(Movie.id)
+
+    @staticmethod
+    def _tokenize(rows):
+        """逐部电影切词，生成 (电影ID, 评分人数, {词项: 加权词频}, 文档长度)"""
+        for row in rows:
+            frequencies = {}
+            for field, text in _movie_fields(row).items():
+                weight = FIELD_WEIGHTS[field]
+                for term in document_terms(text):
+                    frequencies[term] = frequencies.get(term, 0.0) + weight
+            yield row.id, row.rating_count or 0, frequencies, sum(frequencies.values())
+
+    @classmethod
+    def load(cls, batch_size=10000):
+        """从数据库构建索引"""
+        start = time.perf_counter()
+        vocabulary = {}
+        term_ids, doc_ids, frequencies = [], [], []
+        movie_ids, popularity, doc_lengths = [], [], []
+
+        for document in cls._tokenize(cls._query_movies().yield_per(batch_size)):
+            movie_id, count, terms, length = document
+            position = len(movie_ids)
+            for term, frequency in terms.items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                doc_ids.append(position)
+                frequencies.append(frequency)
+            movie_ids.append(movie_id)
+            popularity.append(count)
+            doc_lengths.append(length)
+
+        # 词项按字典序重新编号，查询时用二分查找
+        terms = np.array(sorted(vocabulary), dtype=str)
+        order = np.empty(len(vocabulary), dtype=np.int64)
+        order[[vocabulary[term] for term in terms]] = np.arange(len(terms))
+        postings = csr_matrix(
+            (np.array(frequencies, dtype=np.float32),
+             (order[np.array(term_ids, dtype=np.int64)], np.array(doc_ids, dtype=np.int64))),
+            shape=(len(terms), len(movie_ids))
+        )
+        postings.sum_duplicates()
+        postings.sort_indices()
+
+        index = cls(
+            movie_ids=np.array(movie_ids, dtype=np.int64),
+            terms=terms,
+            postings=postings,
+            doc_lengths=np.array(doc_lengths, dtype=np.float32),
+            popularity=np.array(popularity, dtype=np.int64)
+        )
+        logger.info(f"搜索索引构建完成: {len(index)} 部电影, {len(terms)} 个词项, "
+                    f"耗时 {time.perf_counter() - start:.3f}s")
+        return index
+
+    def to_artifact(self):
+        """转换为 (数组字典, meta)，用于 ArtifactStore.publish；只包含构建时的电影，不包含增量"""
+        arrays = dict(
+            movie_ids=self.movie_ids[:self.base_size],
+            terms=self.terms,
+            doc_lengths=self.doc_lengths[:self.base_size],
+            popularity=self.popularity[:self.base_size],
+            **csr_arrays('postings', self.postings)
+        )
+        return arrays, {'shape': list(self.postings.shape)}
+
+    @classmethod
+    def from_artifact(cls, arrays, meta):
+        """由内存映射的数组构建索引，倒排表不复制，多个进程共享"""
+        return cls(
+            movie_ids=arrays['movie_ids'],
+            terms=arrays['terms'],
+            postings=csr_from_arrays(arrays, 'postings', meta['shape']),
+            doc_lengths=arrays['doc_lengths'],
+            popularity=arrays['popularity']
+        )
+
+    def _position(self, movie_id):
+        """电影在索引中的文档序号，不存在时返回 None"""
+        position = self._delta_positions.get(movie_id)
+        if position is not None:
+            return position
+        i = int(np.searchsorted(self.movie_ids[:self.base_size], movie_id))
+        if i < self.base_size and self.movie_ids[i] == movie_id and i not in self._deleted:
+            return i
+        return None
+
+    def add(self, rows):
+        """追加或更新电影，rows 为包含 id、title、original_title、directors、actors、rating_count 的行"""
+        documents = list(self._tokenize(rows))
+        if not documents:
+            return
+        with self._lock:
+            position = len(self.movie_ids)
+            for movie_id, _, terms, _ in documents:
+                old = self._position(movie_id)
+                if old is not None:
+                    self._deleted.add(old)
+                self._delta_positions[movie_id] = position
+                for term, frequency in terms.items():
+                    docs, frequencies = self._delta.setdefault(term, ([], []))
+                    docs.append(position)
+                    frequencies.append(frequency)
+                position += 1
+
+            self.movie_ids = np.concatenate([self.movie_ids, [document[0] for document in documents]])
+            self.popularity = np.concatenate([self.popularity, [document[1] for document in documents]])
+            self.doc_lengths = np.concatenate([
+                self.doc_lengths, np.array([document[3] for document in documents], dtype=np.float32)
+            ])
+            self._update_totals()
+
+    def refresh(self, check_interval=SEARCH_CHECK_INTERVAL, max_age=SEARCH_MAX_AGE):
+        """检查电影表的变化，必要时返回更新后的索引
+
+        只新增了电影时把新电影追加到增量表；有删除或索引过旧时完整重建。
+        max_age 为 None 时不重建，已删除的电影在读取电影时过滤掉。
+        """
+        now = time.time()
+        if now - self.checked_at < check_interval:
+            return self
+        self.checked_at = now
+
+        if max_age is not None and now - self.built_at > max_age:
+            return self.load()
+
+        count, max_id = db.session.query(func.count(Movie.id), func.max(Movie.id)).one()
+        max_id = max_id or 0
+        if max_id > self.max_movie_id:
+            rows = self._query_movies(min_id=self.max_movie_id).all()
+            self.add(rows)
+            logger.info(f"搜索索引追加 {len(rows)} 部新电影")
+        if count != len(self) and max_age is not None:
+            return self.load()
+        return self
+
+    def _term_postings(self, term):
+        """词项的 (文档序号数组, 词频数组)，包含增量表"""
+        docs = np.empty(0, dtype=np.int64)
+        frequencies = np.empty(0, dtype=np.float32)
+        i = int(np.searchsorted(self.terms, term))
+        if i < len(self.terms) and self.terms[i] == term:
+            start, end = self.postings.indptr[i], self.postings.indptr[i + 1]
+            docs = self.postings.indices[start:end]
+            frequencies = self.postings.data[start:end]
+        delta = self._delta.get(term)
+        if delta is not None:
+            docs = np.concatenate([docs, np.array(delta[0], dtype=docs.dtype)])
+            frequencies = np.concatenate([frequencies, np.array(delta[1], dtype=np.float32)])
+        return docs, frequencies
+
+    def search(self, query, offset=0, limit=20):
+        """搜索电影，所有查询词都出现的电影才算匹配
+
+        按 BM25 得分排序，得分相同时评分人数多的在前。
+
+        Returns:
+            (本页的电影ID列表, 匹配总数)
+        """
+        terms = query_terms(query)
+        if not terms:
+            return [], 0
+        # 与 add() 互斥，避免读到只追加了一半的增量表
+        with self._lock:
+            return self._search(terms, offset, limit)
+
+    def _search(self, terms, offset, limit):
+        postings = [self._term_postings(term) for term in terms]
+        if any(len(docs) == 0 for docs, _ in postings):
+            return [], 0
+        # 从最短的倒排表开始求交集
+        postings.sort(key=lambda item: len(item[0]))
+        candidates = postings[0][0]
+        for docs, _ in postings[1:]:
+            candidates = np.intersect1d(candidates, docs, assume_unique=True)
+            if len(candidates) == 0:
+                return [], 0
+        if self._deleted:
+            candidates = candidates[~np.isin(candidates, np.fromiter(self._deleted, dtype=np.int64))]
+
+        total = len(candidates)
+        end = min(offset + limit, total)
+        if offset >= end:
+            return [], total
+
+        document_count = len(self)
+        norms = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[candidates] / (self.avg_doc_length or 1.0))
+        scores = np.zeros(total, dtype=np.float64)
+        for docs, frequencies in postings:
+            idf = np.log(1 + (document_count - len(docs) + 0.5) / (len(docs) + 0.5))
+            tf = frequencies[np.searchsorted(docs, candidates)]
+            scores += idf * tf * (BM25_K1 + 1) / (tf + norms)
+
+        # 只对可能进入本页的候选排序；与第 end 名同分的全部保留，保证翻页时顺序一致
+        if end < total:
+            threshold = np.partition(-scores, end - 1)[end - 1]
+            top = np.flatnonzero(-scores <= threshold)
+        else:
+            top = np.arange(total)
+        top = top[np.lexsort((candidates[top], -self.popularity[candidates[top]], -scores[top]))]
+        return [int(movie_id) for movie_id in self.movie_ids[candidates[top[offset:end]]]], total
+
+
+class MovieSearch:
+    """管理当前进程使用的搜索索引
+
+    优先使用 flask build-search-index 发布的索引，否则首次搜索时在后台线程中从数据库构建，
+    构建完成前搜索返回 None。之后每隔 SEARCH_CHECK_INTERVAL 在后台检查并追加新电影，
+    需要完整重建时同样在后台进行，完成前继续使用旧索引；请求中只查询内存中的索引。
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.reader = ArtifactReader(get_artifact_store(), 'search', MovieSearchIndex.from_artifact)
+        self.published = None
+        self.index = None
+        self.worker = None
+        self.lock = threading.Lock()
+
+    def _update(self, base):
+        """后台线程：构建索引，或检查 base 之后的变化"""
+        with self.app.app_context():
+            try:
+                if base is None:
+                    index = MovieSearchIndex.load()
+                else:
+                    # 已发布的索引由离线任务定期重建，这里只追加新电影
+                    max_age = None if base is self.published else SEARCH_MAX_AGE
+                    index = base.refresh(check_interval=0, max_age=max_age)
+            except Exception as e:
+                logger.error(f"更新搜索索引失败: {str(e)}")
+                index = None
+        with self.lock:
+            # 期间加载了新发布的版本时丢弃本次结果
+            if index is not None and self.index is base:
+                self.index = index
+            self.worker = None
+
+    def get_index(self, wait=False):
+        """返回索引，还没有构建完成时返回 None；wait 为 True 时等待后台任务完成"""
+        with self.lock:
+            published = self.reader.get()
+            if published is not None and published is not self.published:
+                self.published = published
+                self.index = published
+            index = self.index
+            if self.worker is None and (index is None or time.time() - index.checked_at >= SEARCH_CHECK_INTERVAL):
+                if index is not None:
+                    # 先更新检查时间，后台任务完成前的请求不再重复检查
+                    index.checked_at = time.time()
+                self.worker = threading.Thread(target=self._update, args=(index,), name='search-index', daemon=True)
+                self.worker.start()
+            worker = self.worker
+        if worker is not None and wait:
+            worker.join()
+            with self.lock:
+                return self.index
+        return index
+
+    def search(self, query, offset=0, limit=20):
+        """返回 (本页的电影ID列表, 匹配总数)，索引还没有构建完成时返回 None"""
+        index = self.get_index()
+        return index.search(query, offset, limit) if index is not None else None
+
+    def movie_saved(self, movie_id):
+        """电影入库或修改后更新索引；本进程还没有加载索引时不做任何事，首次搜索时会读到新数据"""
+        if self.index is None:
+            return
+        rows = MovieSearchIndex._query_movies(movie_ids=[movie_id]).all()
+        with self.lock:
+            self.index.add(rows)
+
+
+def get_movie_search():
+    """获取当前应用的搜索索引"""
+    if not hasattr(current_app, 'movie_search'):
+        current_app.movie_search = MovieSearch(current_app._get_current_object())
+    return current_app.movie_search
@@ -43,8 +43,106 @@ document.addEventListener("DOMContentLoaded", function () {
       )}`;
     });
   }
+
+  // 搜索框自动补全
+  const searchInput = document.querySelector("#search-input");
+  const suggestionMenu = document.querySelector("#search-suggestions");
+  if (searchInput && suggestionMenu && searchInput.dataset.typeaheadUrl) {
+    setupTypeahead(searchInput, suggestionMenu);
+  }
 });
 
+// 输入停顿后再请求，已返回的结果按输入缓存，新请求发出时取消还未返回的旧请求
+function setupTypeahead(input, menu) {
+  const cache = new Map();
+  let timer = null;
+  let controller = null;
+  let active = -1;
+
+  function hide() {
+    menu.classList.remove("show");
+    active = -1;
+  }
+
+  function render(suggestions) {
+    menu.innerHTML = "";
+    active = -1;
+    suggestions.forEach((item) => {
+      const link = document.createElement("a");
+      link.className = "dropdown-item text-truncate";
+      link.href = item.url;
+      const icon = document.createElement("i");
+      icon.className =
+        item.type === "movie" ? "fas fa-film me-2" : "fas fa-user me-2";
+      link.appendChild(icon);
+      link.appendChild(document.createTextNode(item.text));
+      if (item.year) {
+        const year = document.createElement("small");
+        year.className = "text-muted ms-1";
+        year.textContent = `(${item.year})`;
+        link.appendChild(year);
+      }
+      menu.appendChild(link);
+    });
+    menu.classList.toggle("show", suggestions.length > 0);
+  }
+
+  function highlight(index) {
+    const items = menu.querySelectorAll(".dropdown-item");
+    if (!items.length) return;
+    active = (index + items.length) % items.length;
+    items.forEach((item, i) => item.classList.toggle("active", i === active));
+  }
+
+  async function fetchSuggestions(query) {
+    if (cache.has(query)) {
+      render(cache.get(query));
+      return;
+    }
+    if (controller) controller.abort();
+    controller = new AbortController();
+    try {
+      const response = await fetch(
+        `${input.dataset.typeaheadUrl}?q=${encodeURIComponent(query)}`,
+        { signal: controller.signal }
+      );
+      if (!response.ok) return;
+      const data = await response.json();
+      cache.set(query, data.suggestions);
+      // 返回时输入可能已经变化，只显示与当前输入一致的结果
+      if (input.value.trim() === query) render(data.suggestions);
+    } catch (error) {
+      if (error.name !== "AbortError") console.error("Error:", error);
+    }
+  }
+
+  input.addEventListener("input", function () {
+    clearTimeout(timer);
+    const query = input.value.trim();
+    if (!query) {
+      hide();
+      return;
+    }
+    timer = setTimeout(() => fetchSuggestions(query), 150);
+  });
+
+  input.addEventListener("keydown", function (e) {
+    if (!menu.classList.contains("show")) return;
+    if (e.key === "ArrowDown" || e.key === "ArrowUp") {
+      e.preventDefault();
+      highlight(active + (e.key === "ArrowDown" ? 1 : -1));
+    } else if (e.key === "Enter" && active >= 0) {
+      e.preventDefault();
+      window.location.href = menu.querySelectorAll(".dropdown-item")[active].href;
+    } else if (e.key === "Escape") {
+      hide();
+    }
+  });
+
+  // 延迟隐藏，保证点击建议时链接先收到点击事件
+  input.addEventListener("blur", () => setTimeout(hide, 200));
+}
+
 // 图片加载错误处理
 document.addEventListener("DOMContentLoaded", function () {
   const images = document.querySelectorAll("img");
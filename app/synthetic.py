@@ -0,0 +1,268 @@
+import io
+import time
+import logging
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+import numpy as np
+from PIL import Image
+from werkzeug.security import generate_password_hash
+from app.models import Movie, MovieType, User, Rating, Favorite, movie_type_association, db
+from app.douban_spider import MOVIE_TYPES
+from app.rating_aggregates import reconcile_rating_aggregates
+from app.people import backfill_movie_people
+from app.reference_data import get_movie_type_catalog
+from app.poster_store import store_poster
+
+logger = logging.getLogger(__name__)
+
+# 生成数据的默认规模
+SYNTHETIC_MOVIES = 10000
+SYNTHETIC_USERS = 1000
+SYNTHETIC_RATINGS_PER_USER = 50
+# 用户评分过且评分不低于4分的电影中被收藏的比例
+SYNTHETIC_FAVORITE_RATE = 0.2
+# 电影热度服从 Zipf 分布的指数，越大评分越集中在少数热门电影上
+SYNTHETIC_ZIPF = 1.0
+# 评分时间分布在最近多少天内
+SYNTHETIC_DAYS = 365
+SYNTHETIC_BATCH_SIZE = 5000
+# 所有合成用户的登录密码
+SYNTHETIC_PASSWORD = 'synthetic'
+
+GENRES = [name for name in MOVIE_TYPES if name != '总榜']
+LANGUAGES = ['汉语普通话', '英语', '日语', '韩语', '法语', '粤语', '德语', '西班牙语', '意大利语', '俄语']
+LANGUAGE_WEIGHTS = [0.30, 0.30, 0.10, 0.08, 0.06, 0.05, 0.04, 0.03, 0.02, 0.02]
+COUNTRIES = ['中国大陆', '美国', '日本', '韩国', '法国', '中国香港', '英国', '德国', '西班牙', '意大利']
+SURNAMES = '王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗'
+GIVEN_NAMES = '伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚'
+
+
+def _poster_palette(count=32):
+    """生成一组不同颜色的小 JPEG 作为假海报，按电影编号循环使用"""
+    rng = np.random.default_rng(0)
+    palette = []
+    for _ in range(count):
+        image = Image.new('RGB', (27, 40), tuple(int(c) for c in rng.integers(0, 256, 3)))
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=70)
+        palette.append(buffer.getvalue())
+    return palette
+
+
+def _poster_columns():
+    """把假海报写入海报文件库，返回每张海报对应的电影字段，与爬虫入库走同一条路径"""
+    columns = []
+    for data in _poster_palette():
+        poster = SimpleNamespace(poster_digest=None, poster_data=None, poster_mimetype=None)
+        store_poster(poster, data, 'image/jpeg')
+        columns.append(vars(poster))
+    return columns
+
+
+class SyntheticDataGenerator:
+    """合成电影、用户、评分和收藏数据，用于压测和性能分析
+
+    电影热度服从 Zipf 分布（评分人数越多的电影越容易被评分），用户活跃度服从对数正态分布，
+    评分值围绕电影的豆瓣评分波动，时间戳分布在最近 days 天内且晚于用户注册时间。
+    所有数据用批量 INSERT 写入，SQLite 和 MySQL 都适用；同一个 seed 生成的数据分布完全相同，
+    时间戳相对于运行时刻。
+    """
+
+    def __init__(self, movies=SYNTHETIC_MOVIES, users=SYNTHETIC_USERS,
+                 ratings_per_user=SYNTHETIC_RATINGS_PER_USER, favorite_rate=SYNTHETIC_FAVORITE_RATE,
+                 zipf=SYNTHETIC_ZIPF, days=SYNTHETIC_DAYS, posters=True, seed=0,
+                 batch_size=SYNTHETIC_BATCH_SIZE, prefix=None):
+        self.movies = movies
+        self.users = users
+        self.ratings_per_user = ratings_per_user
+        self.favorite_rate = favorite_rate
+        self.zipf = zipf
+        self.days = days
+        self.posters = posters
+        self.rng = np.random.default_rng(seed)
+        self.batch_size = batch_size
+        self.end = datetime.utcnow().replace(microsecond=0)
+        self.start = self.end - timedelta(days=days)
+        # 豆瓣ID和用户名的前缀，默认每次运行不同，避免与已有数据的唯一键冲突
+        self.prefix = prefix or f's{np.base_repr(int(time.time()), 36).lower()}'
+
+    def _insert(self, table, rows):
+        for start in range(0, len(rows), self.batch_size):
+            db.session.execute(table.insert(), rows[start:start + self.batch_size])
+        db.session.commit()
+
+    def _name(self):
+        surname = SURNAMES[self.rng.integers(len(SURNAMES))]
+        given = ''.join(GIVEN_NAMES[i] for i in self.rng.integers(len(GIVEN_NAMES), size=self.rng.integers(1, 3)))
+        return surname + given
+
+    def generate_types(self):
+        """确保所有类型存在，返回 [类型ID, ...]，顺序与 GENRES 相同"""
+        existing = {row.name: row.id for row in db.session.query(MovieType.id, MovieType.name)}
+        missing = [{'name': name} for name in GENRES if name not in existing]
+        if missing:
+            self._insert(MovieType.__table__, missing)
+            existing = {row.name: row.id for row in db.session.query(MovieType.id, MovieType.name)}
+            get_movie_type_catalog().invalidate()
+        return [existing[name] for name in GENRES]
+
+    def generate_movies(self, type_ids):
+        """生成电影及其类型，返回 (电影ID数组, 豆瓣评分数组, 评分人数数组)"""
+        start = time.perf_counter()
+        n = self.movies
+        posters = _poster_columns() if self.posters else [{}]
+
+        years = np.clip(np.round(2024 - self.rng.exponential(15, n)), 1930, 2024).astype(int)
+        runtimes = np.clip(np.round(self.rng.normal(110, 20, n)), 60, 240).astype(int)
+        ratings = np.clip(np.round(self.rng.normal(7.0, 1.0, n), 1), 2.0, 9.8)
+        rating_counts = np.round(self.rng.lognormal(8, 1.8, n)).astype(int)
+        language_choices = self.rng.choice(len(LANGUAGES), size=(n, 2), p=LANGUAGE_WEIGHTS)
+        language_counts = self.rng.choice([1, 2], size=n, p=[0.75, 0.25])
+
+        for batch_start in range(0, n, self.batch_size):
+            rows = []
+            for i in range(batch_start, min(batch_start + self.batch_size, n)):
+                languages = list(dict.fromkeys(LANGUAGES[j] for j in language_choices[i][:language_counts[i]]))
+                rows.append({
+                    'douban_id': f'{self.prefix}-{i}',
+                    'title': f'合成电影{self.prefix}-{i}',
+                    'year': int(years[i]),
+                    'directors': self._name(),
+                    'writers': self._name(),
+                    'actors': ' / '.join(self._name() for _ in range(3)),
+                    'countries': COUNTRIES[self.rng.integers(len(COUNTRIES))],
+                    'languages': ' / '.join(languages),
+                    'release_date': f'{years[i]}-{self.rng.integers(1, 13):02d}-{self.rng.integers(1, 29):02d}',
+                    'runtime': int(runtimes[i]),
+                    'rating': float(ratings[i]),
+                    'rating_count': int(rating_counts[i]),
+                    'summary': '这是一部用于性能测试的合成电影。',
+                    'poster_digest': None,
+                    'poster_data': None,
+                    'poster_mimetype': None,
+                    'tags': '',
+                    **posters[i % len(posters)]
+                })
+            self._insert(Movie.__table__, rows)
+            logger.info(f"合成电影: 已写入 {len(rows) + batch_start}/{n}")
+
+        # 按生成顺序读回自增ID
+        id_by_index = {
+            int(douban_id.rsplit('-', 1)[1]): movie_id
+            for movie_id, douban_id in db.session.query(Movie.id, Movie.douban_id).filter(
+                Movie.douban_id.like(f'{self.prefix}-%'))
+        }
+        movie_ids = np.array([id_by_index[i] for i in range(n)], dtype=np.int64)
+
+        # 每部电影 1-4 个类型，类型本身的热度也不均匀
+        genre_weights = 1 / np.arange(1, len(type_ids) + 1) ** 0.7
+        genre_weights /= genre_weights.sum()
+        association = []
+        total_association = 0
+        for i, movie_id in enumerate(movie_ids):
+            count = int(self.rng.integers(1, 5))
+            for j in self.rng.choice(len(type_ids), size=count, replace=False, p=genre_weights):
+                association.append({'movie_id': int(movie_id), 'type_id': type_ids[j]})
+            if len(association) >= self.batch_size or i == len(movie_ids) - 1:
+                self._insert(movie_type_association, association)
+                total_association += len(association)
+                association = []
+
+        logger.info(f"合成电影完成: {n} 部, {total_association} 条类型关联, 耗时 {time.perf_counter() - start:.1f}s")
+        return movie_ids, ratings, rating_counts
+
+    def generate_users(self):
+        """生成用户，返回 (用户ID数组, 注册时间数组)"""
+        start = time.perf_counter()
+        # 密码哈希计算很慢，所有合成用户共用同一个
+        password_hash = generate_password_hash(SYNTHETIC_PASSWORD)
+        offsets = self.rng.uniform(0, self.days * 0.8, self.users)
+        created = [self.start + timedelta(days=float(offset)) for offset in offsets]
+        rows = [
+            {
+                'username': f'{self.prefix}_user{i}',
+                'email': f'{self.prefix}_user{i}@example.com',
+                'password_hash': password_hash,
+                'created_at': created[i]
+            }
+            for i in range(self.users)
+        ]
+        self._insert(User.__table__, rows)
+
+        id_by_index = {
+            int(username.rsplit('user', 1)[1]): user_id
+            for user_id, username in db.session.query(User.id, User.username).filter(
+                User.username.like(f'{self.prefix}_user%'))
+        }
+        user_ids = np.array([id_by_index[i] for i in range(self.users)], dtype=np.int64)
+        logger.info(f"合成用户完成: {self.users} 个, 耗时 {time.perf_counter() - start:.1f}s")
+        return user_ids, created
+
+    def generate_activity(self, movie_ids, movie_ratings, rating_counts, user_ids, user_created):
+        """生成评分和收藏，返回 (评分数, 收藏数)"""
+        start = time.perf_counter()
+        # 豆瓣评分人数越多的电影热度排名越靠前，热度按排名服从 Zipf 分布
+        order = np.argsort(-rating_counts, kind='stable')
+        popularity = np.empty(len(movie_ids))
+        popularity[order] = 1 / np.arange(1, len(movie_ids) + 1) ** self.zipf
+        cdf = np.cumsum(popularity / popularity.sum())
+
+        # 用户活跃度服从对数正态分布，均值约为 ratings_per_user
+        sigma = 1.0
+        activity = self.rng.lognormal(np.log(self.ratings_per_user) - sigma ** 2 / 2, sigma, len(user_ids))
+        activity = np.clip(np.round(activity), 1, len(movie_ids)).astype(int)
+
+        rating_rows, favorite_rows = [], []
+        total_ratings = total_favorites = 0
+        for user_id, created, count in zip(user_ids, user_created, activity):
+            # 有放回抽样后去重，比按概率无放回抽样快得多，代价是实际数量略少于 count
+            picks = np.unique(np.searchsorted(cdf, self.rng.random(int(count * 1.2) + 1), side='right'))
+            picks = picks[picks < len(movie_ids)][:count]
+            scores = np.clip(np.round(movie_ratings[picks] / 2 + self.rng.normal(0, 0.8, len(picks))), 1, 5)
+
+            span = max((self.end - created).total_seconds(), 1)
+            # 活动时间偏向注册后不久，幂分布比均匀分布更接近真实情况
+            seconds = span * self.rng.power(0.7, len(picks))
+            for pick, score, second in zip(picks, scores, seconds):
+                rated_at = created + timedelta(seconds=float(second))
+                rating_rows.append({
+                    'user_id': int(user_id),
+                    'movie_id': int(movie_ids[pick]),
+                    'rating': float(score),
+                    'created_at': rated_at,
+                    'updated_at': rated_at
+                })
+                if score >= 4 and self.rng.random() < self.favorite_rate:
+                    favorite_rows.append({
+                        'user_id': int(user_id),
+                        'movie_id': int(movie_ids[pick]),
+                        'created_at': min(rated_at + timedelta(minutes=float(self.rng.exponential(60))), self.end)
+                    })
+
+            if len(rating_rows) >= self.batch_size:
+                self._insert(Rating.__table__, rating_rows)
+                self._insert(Favorite.__table__, favorite_rows)
+                total_ratings += len(rating_rows)
+                total_favorites += len(favorite_rows)
+                rating_rows, favorite_rows = [], []
+                logger.info(f"合成评分: 已写入 {total_ratings} 条")
+
+        self._insert(Rating.__table__, rating_rows)
+        self._insert(Favorite.__table__, favorite_rows)
+        total_ratings += len(rating_rows)
+        total_favorites += len(favorite_rows)
+        logger.info(f"合成评分完成: {total_ratings} 条评分, {total_favorites} 条收藏, "
+                    f"耗时 {time.perf_counter() - start:.1f}s")
+        return total_ratings, total_favorites
+
+    def run(self):
+        """生成全部数据，返回各表写入的行数"""
+        type_ids = self.generate_types()
+        movie_ids, movie_ratings, rating_counts = self.generate_movies(type_ids)
+        user_ids, user_created = self.generate_users()
+        ratings, favorites = self.generate_activity(movie_ids, movie_ratings, rating_counts, user_ids, user_created)
+        # 评分是批量插入的，没有经过评分接口，需要重算电影的评分汇总
+        reconcile_rating_aggregates()
+        # 电影是批量插入的，人物表按导演、编剧、演员字段回填
+        backfill_movie_people()
+        return {'movies': len(movie_ids), 'users': len(user_ids), 'ratings': ratings, 'favorites': favorites}
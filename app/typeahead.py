@@ -0,0 +1,334 @@
+import re
+import time
+import logging
+import threading
+import unicodedata
+import numpy as np
+from flask import current_app
+from sqlalchemy import func
+from app.models import Movie, db
+from app.people import split_names
+
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:
+    lazy_pinyin = None
+
+logger = logging.getLogger(__name__)
+
+# 每次返回的建议数量
+TYPEAHEAD_LIMIT = 8
+# 前缀最多比较的字符数，更长的输入截断后匹配
+TYPEAHEAD_KEY_LENGTH = 12
+# 不超过该长度的前缀，匹配的词条超过 TYPEAHEAD_SCAN_LIMIT 条时预先算好前几名
+TYPEAHEAD_PRECOMPUTE_LENGTH = 3
+TYPEAHEAD_SCAN_LIMIT = 2000
+# 增量词条超过该数量时与已有词条合并
+TYPEAHEAD_DELTA_LIMIT = 5000
+# 检查新电影的最小间隔（秒）
+TYPEAHEAD_CHECK_INTERVAL = 5
+
+# 建议的类型：电影（标题、原名）和人物（导演、演员）
+MOVIE = 0
+PERSON = 1
+
+_CJK = re.compile('[\u3400-\u4dbf\u4e00-\u9fff]')
+
+
+def normalize(text):
+    """全角转半角、小写、合并空白"""
+    return ' '.join(unicodedata.normalize('NFKC', text or '').lower().split())
+
+
+def _pinyin_initials(text):
+    """中文的拼音首字母，如 星际穿越 -> xjcy；未安装 pypinyin 或不含中文时返回 None"""
+    if lazy_pinyin is None or not _CJK.search(text):
+        return None
+    return ''.join(lazy_pinyin(text, style=Style.FIRST_LETTER, errors='ignore')) or None
+
+
+def _keys(text, pinyin_cache):
+    """一个标题或人名对应的全部前缀词条
+
+    除完整文本外，英文标题从每个单词开始、外国人名从间隔号后开始也能匹配，
+    如 "the dark knight" 可由 "dark" 匹配，"克里斯托弗·诺兰" 可由 "诺兰" 匹配。
+    """
+    text = normalize(text)
+    if not text:
+        return set()
+    keys = {text}
+    for match in re.finditer(r'[ ·・.]+', text):
+        if match.end() < len(text):
+            keys.add(text[match.end():])
+    if text not in pinyin_cache:
+        pinyin_cache[text] = _pinyin_initials(text)
+    if pinyin_cache[text]:
+        keys.add(pinyin_cache[text])
+    return {key[:TYPEAHEAD_KEY_LENGTH] for key in keys}
+
+
+def _upper_bound(prefix):
+    """字典序中所有以 prefix 开头的字符串都小于返回值"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _top(positions, limit, kinds, targets, scores):
+    """从词条位置中按分数选出前几个不重复的建议"""
+    if len(positions) > limit * 4:
+        positions = positions[np.argpartition(-scores[positions], limit * 4 - 1)[:limit * 4]]
+    positions = positions[np.lexsort((positions, -scores[positions]))]
+    result, seen = [], set()
+    for i in positions:
+        item = (int(kinds[i]), int(targets[i]))
+        if item not in seen:
+            seen.add(item)
+            result.append(i)
+            if len(result) == limit:
+                break
+    return np.array(result, dtype=np.int64)
+
+
+def _popular_prefixes(keys, kinds, targets, scores):
+    """为词条很多的短前缀预先选出前 TYPEAHEAD_LIMIT 个建议，返回 {前缀: 词条位置数组}"""
+    popular = {}
+    if len(keys) == 0:
+        return popular
+    for length in range(1, TYPEAHEAD_PRECOMPUTE_LENGTH + 1):
+        # 截断到 length 个字符后仍然有序，相同前缀的词条连续
+        prefixes = keys.astype(f'<U{length}')
+        starts = np.flatnonzero(np.r_[True, prefixes[1:] != prefixes[:-1]])
+        ends = np.r_[starts[1:], len(prefixes)]
+        for group in np.flatnonzero(ends - starts > TYPEAHEAD_SCAN_LIMIT):
+            start, end = starts[group], ends[group]
+            popular[str(prefixes[start])] = _top(np.arange(start, end), TYPEAHEAD_LIMIT, kinds, targets, scores)
+    return popular
+
+
+class TypeaheadIndex:
+    """搜索框自动补全索引
+
+    把标题、原名、导演、演员（及其拼音首字母）切成词条，按字典序排成数组，
+    相当于把前缀树压平：同一前缀的词条在数组中连续，用两次二分查找定位，
+    再按评分人数取前几名。很短的热门前缀匹配的词条很多，构建时预先算好结果。
+    新电影的词条先放在增量表里，查询时一起扫描，积累到一定数量后合并。
+    """
+
+    def __init__(self, keys, kinds, targets, scores, titles, years, movie_ids, people):
+        self.keys = keys
+        self.kinds = kinds
+        self.targets = targets
+        self.scores = scores
+        self.titles = titles
+        self.years = years
+        self.movie_ids = movie_ids
+        self.people = people
+        self.person_index = {name: i for i, name in enumerate(people)}
+
+        self._delta = []
+        # _lock 保护查询读取的数组和增量表，只在替换时短暂持有；_write_lock 让追加和合并依次进行
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._popular = _popular_prefixes(keys, kinds, targets, scores)
+
+        self.checked_at = time.time()
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    @property
+    def max_movie_id(self):
+        # 电影按ID递增的顺序加入
+        return self.movie_ids[-1] if self.movie_ids else 0
+
+    @classmethod
+    def load(cls, batch_size=10000):
+        """从数据库构建索引"""
+        start = time.perf_counter()
+        index = cls(np.array([], dtype=f'<U{TYPEAHEAD_KEY_LENGTH}'), np.array([], dtype=np.int8),
+                    np.array([], dtype=np.int64), np.array([], dtype=np.int64), [], [], [], [])
+        index._merge(index._entries(cls._query_movies().yield_per(batch_size)), 0)
+        logger.info(f"自动补全索引构建完成: {len(index)} 部电影, {len(index.keys)} 个词条, "
+                    f"耗时 {time.perf_counter() - start:.3f}s")
+        return index
+
+    @staticmethod
+    def _query_movies(min_id=None, movie_ids=None):
+        query = db.session.query(
+            Movie.id, Movie.title, Movie.original_title, Movie.year,
+            Movie.directors, Movie.actors, Movie.rating_count
+        )
+        if min_id is not None:
+            query = query.filter(Movie.id > min_id)
+        if movie_ids is not None:
+            query = query.filter(Movie.id.in_(movie_ids))
+        return query.order_by(Movie.id)
+
+    def _entries(self, rows):
+        """把电影加入标题表和人物表，返回新词条 [(词条, 类型, 目标序号, 分数)]
+
+        人物的分数为其全部电影的评分人数之和，只在本次加入的电影范围内累加。
+        """
+        entries = []
+        person_scores = {}
+        pinyin_cache = {}
+        for row in rows:
+            position = len(self.movie_ids)
+            self.movie_ids.append(row.id)
+            self.titles.append(row.title)
+            self.years.append(row.year)
+            score = row.rating_count or 0
+            for key in _keys(row.title, pinyin_cache) | _keys(row.original_title, pinyin_cache):
+                entries.append((key, MOVIE, position, score))
+            for name in set(split_names(row.directors) + split_names(row.actors)):
+                person = self.person_index.get(name)
+                if person is None:
+                    person = self.person_index[name] = len(self.people)
+                    self.people.append(name)
+                person_scores[person] = person_scores.get(person, 0) + score
+
+        for person, score in person_scores.items():
+            for key in _keys(self.people[person], pinyin_cache):
+                entries.append((key, PERSON, person, score))
+        return entries
+
+    def _merge(self, entries, merged_delta):
+        """把词条合并进有序数组并重新计算热门前缀
+
+        排序在锁外进行，期间查询继续使用旧数组，完成后一次替换；
+        merged_delta 为本次已合并的增量词条数，替换时从增量表中移除。
+        """
+        if not entries:
+            return
+        keys = np.concatenate([self.keys, np.array([entry[0] for entry in entries], dtype=self.keys.dtype)])
+        kinds = np.concatenate([self.kinds, np.array([entry[1] for entry in entries], dtype=np.int8)])
+        targets = np.concatenate([self.targets, np.array([entry[2] for entry in entries], dtype=np.int64)])
+        scores = np.concatenate([self.scores, np.array([entry[3] for entry in entries], dtype=np.int64)])
+        order = np.argsort(keys, kind='stable')
+        keys, kinds, targets, scores = keys[order], kinds[order], targets[order], scores[order]
+        popular = _popular_prefixes(keys, kinds, targets, scores)
+        with self._lock:
+            self.keys, self.kinds, self.targets, self.scores = keys, kinds, targets, scores
+            self._popular = popular
+            self._delta = self._delta[merged_delta:]
+
+    def add(self, rows):
+        """追加新电影，词条先放入增量表，积累到 TYPEAHEAD_DELTA_LIMIT 条时合并
+
+        rows 按电影ID递增，已经加入过的电影跳过。
+        """
+        with self._write_lock:
+            max_movie_id = self.max_movie_id
+            entries = self._entries(row for row in rows if row.id > max_movie_id)
+            with self._lock:
+                self._delta = self._delta + entries
+                delta = self._delta
+            if len(delta) > TYPEAHEAD_DELTA_LIMIT:
+                self._merge(delta, len(delta))
+
+    def _suggestion(self, kind, target):
+        if kind == MOVIE:
+            return {'type': 'movie', 'text': self.titles[target], 'year': self.years[target],
+                    'movie_id': self.movie_ids[target]}
+        return {'type': 'person', 'text': self.people[target]}
+
+    def suggest(self, prefix, limit=TYPEAHEAD_LIMIT):
+        """返回以 prefix 开头的建议，电影和人物按评分人数混合排序"""
+        prefix = normalize(prefix)[:TYPEAHEAD_KEY_LENGTH]
+        if not prefix:
+            return []
+        # 只在取出当前数组时持锁，合并在锁外排序，完成后整体替换
+        with self._lock:
+            keys, kinds, targets, scores = self.keys, self.kinds, self.targets, self.scores
+            popular, delta = self._popular, self._delta
+        positions = popular.get(prefix) if limit <= TYPEAHEAD_LIMIT else None
+        if positions is None:
+            start = int(np.searchsorted(keys, prefix, side='left'))
+            end = int(np.searchsorted(keys, _upper_bound(prefix), side='left'))
+            positions = _top(np.arange(start, end), limit, kinds, targets, scores)
+        candidates = [(int(scores[i]), int(kinds[i]), int(targets[i])) for i in positions]
+        candidates.extend(
+            (score, kind, target) for key, kind, target, score in delta if key.startswith(prefix)
+        )
+
+        candidates.sort(key=lambda item: -item[0])
+        suggestions, seen = [], set()
+        for _, kind, target in candidates:
+            if (kind, target) not in seen:
+                seen.add((kind, target))
+                suggestions.append(self._suggestion(kind, target))
+                if len(suggestions) == limit:
+                    break
+        return suggestions
+
+    def refresh(self):
+        """检查并追加新电影，已删除的电影在重启前仍会出现在建议中"""
+        self.checked_at = time.time()
+        max_id = db.session.query(func.max(Movie.id)).scalar() or 0
+        if max_id > self.max_movie_id:
+            rows = self._query_movies(min_id=self.max_movie_id).all()
+            self.add(rows)
+            logger.info(f"自动补全索引追加 {len(rows)} 部新电影")
+        return self
+
+
+class MovieTypeahead:
+    """管理当前进程使用的自动补全索引
+
+    电影很多时构建需要几分钟，首次请求时在后台线程中构建，构建完成前返回空的建议。
+    之后每隔 TYPEAHEAD_CHECK_INTERVAL 在后台线程中检查并追加新电影，请求中只做数组查找，不访问数据库。
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.index = None
+        self.worker = None
+        self.lock = threading.Lock()
+
+    def _update(self, index):
+        """后台线程：构建索引，或向已有索引追加新电影"""
+        with self.app.app_context():
+            try:
+                if index is None:
+                    index = TypeaheadIndex.load()
+                else:
+                    index.refresh()
+            except Exception as e:
+                logger.error(f"更新自动补全索引失败: {str(e)}")
+        with self.lock:
+            if self.index is None:
+                self.index = index
+            self.worker = None
+
+    def get_index(self, wait=False):
+        """返回索引，还没有构建完成时返回 None；wait 为 True 时等待后台任务完成"""
+        with self.lock:
+            index = self.index
+            if self.worker is None and (index is None or time.time() - index.checked_at >= TYPEAHEAD_CHECK_INTERVAL):
+                if index is not None:
+                    # 先更新检查时间，后台任务完成前的请求不再重复检查
+                    index.checked_at = time.time()
+                self.worker = threading.Thread(target=self._update, args=(index,), name='typeahead', daemon=True)
+                self.worker.start()
+            worker = self.worker
+        if worker is not None and wait:
+            worker.join()
+            with self.lock:
+                return self.index
+        return index
+
+    def suggest(self, prefix, limit=TYPEAHEAD_LIMIT):
+        index = self.get_index()
+        return index.suggest(prefix, limit) if index is not None else []
+
+    def movie_saved(self, movie_id):
+        """新电影入库后加入索引；本进程还没有加载索引时不做任何事"""
+        if self.index is None:
+            return
+        self.index.add(TypeaheadIndex._query_movies(movie_ids=[movie_id]).all())
+
+
+def get_movie_typeahead():
+    """获取当前应用的自动补全索引"""
+    if not hasattr(current_app, 'movie_typeahead'):
+        current_app.movie_typeahead = MovieTypeahead(current_app._get_current_object())
+    return current_app.movie_typeahead
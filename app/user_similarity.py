@@ -0,0 +1,277 @@
+import time
+import logging
+from datetime import datetime
+import numpy as np
+from scipy.sparse import csr_matrix, diags
+from sklearn.preprocessing import normalize
+from sqlalchemy import func
+from app.models import Rating, UserSimilarity, db
+
+logger = logging.getLogger(__name__)
+
+# 每个用户保存的相似用户数量
+USER_NEIGHBORS = 20
+
+# IN 查询每批的ID数量
+IN_BATCH = 1000
+
+
+def _rating_matrix():
+    """读取评分数据，返回 (用户ID数组, 按行归一化的 用户×电影 稀疏矩阵)"""
+    rows = np.array(
+        db.session.query(Rating.user_id, Rating.movie_id, Rating.rating).all(),
+        dtype=np.float64
+    ).reshape(-1, 3)
+    user_ids, user_positions = np.unique(rows[:, 0].astype(np.int64), return_inverse=True)
+    _, movie_positions = np.unique(rows[:, 1].astype(np.int64), return_inverse=True)
+    matrix = csr_matrix(
+        (rows[:, 2].astype(np.float32), (user_positions, movie_positions)),
+        shape=(len(user_ids), int(movie_positions.max()) + 1 if len(rows) else 0)
+    )
+    return user_ids, normalize(matrix, norm='l2', axis=1)
+
+
+def _rating_version():
+    """评分表中最新的评分或修改时间，作为本次计算的版本
+
+    只用评分表自己的时间戳与下一次运行比较，不混用应用服务器和数据库服务器的时钟。
+    """
+    times = [
+        db.session.query(func.max(Rating.updated_at)).scalar(),
+        db.session.query(func.max(Rating.created_at)).scalar()
+    ]
+    return max((t for t in times if t is not None), default=None)
+
+
+def _changed_users(since):
+    """返回 (上次计算之后评分有变化的用户, 相似列表中包含这些用户的用户)"""
+    changed = {
+        row.user_id for row in db.session.query(Rating.user_id).filter(
+            func.coalesce(Rating.updated_at, Rating.created_at) >= since
+        ).distinct()
+    }
+    # 这些用户的评分变化会改变他们出现在别人列表中的相似度
+    affected = set()
+    changed_list = list(changed)
+    for start in range(0, len(changed_list), IN_BATCH):
+        affected.update(
+            row.user_id1 for row in db.session.query(UserSimilarity.user_id1).filter(
+                UserSimilarity.user_id2.in_(changed_list[start:start + IN_BATCH])
+            ).distinct()
+        )
+    return changed, affected - changed
+
+
+def _ratings_by(column, values):
+    """按用户或电影分批读取评分，返回 (用户ID, 电影ID, 评分) 数组"""
+    values = [int(v) for v in values]
+    rows = []
+    for start in range(0, len(values), IN_BATCH):
+        rows.extend(
+            db.session.query(Rating.user_id, Rating.movie_id, Rating.rating)
+            .filter(column.in_(values[start:start + IN_BATCH])).all()
+        )
+    return np.array(rows, dtype=np.float64).reshape(-1, 3)
+
+
+def _rating_norms(user_ids):
+    """用户评分向量的 L2 范数，与 user_ids 顺序一致"""
+    squares = {}
+    for start in range(0, len(user_ids), IN_BATCH):
+        squares.update(
+            db.session.query(Rating.user_id, func.sum(Rating.rating * Rating.rating))
+            .filter(Rating.user_id.in_([int(u) for u in user_ids[start:start + IN_BATCH]]))
+            .group_by(Rating.user_id).all()
+        )
+    return np.sqrt(np.array([float(squares.get(int(u)) or 0) for u in user_ids]))
+
+
+def _sparse(rows, row_ids, column_ids):
+    """评分数组转成 行ID×电影ID 稀疏矩阵，row_ids、column_ids 均为有序数组"""
+    return csr_matrix(
+        (
+            rows[:, 2],
+            (np.searchsorted(row_ids, rows[:, 0].astype(np.int64)),
+             np.searchsorted(column_ids, rows[:, 1].astype(np.int64)))
+        ),
+        shape=(len(row_ids), len(column_ids))
+    )
+
+
+def _inverse(norms):
+    inverse = np.zeros_like(norms)
+    np.divide(1.0, norms, out=inverse, where=norms > 0)
+    return diags(inverse)
+
+
+def _similarity_thresholds(user_ids):
+    """返回 {用户ID: (相似用户数, 最低相似度)}，没有相似记录的用户不在结果中"""
+    thresholds = {}
+    for start in range(0, len(user_ids), IN_BATCH):
+        thresholds.update(
+            (row.user_id1, (row.count, row.min_similarity))
+            for row in db.session.query(
+                UserSimilarity.user_id1,
+                func.count(UserSimilarity.id).label('count'),
+                func.min(UserSimilarity.similarity).label('min_similarity')
+            ).filter(
+                UserSimilarity.user_id1.in_(user_ids[start:start + IN_BATCH])
+            ).group_by(UserSimilarity.user_id1)
+        )
+    return thresholds
+
+
+def _top_rows(similarities, row_ids, column_ids, top_k, version):
+    """从相似度矩阵的每一行选出前 top_k 个相似度大于0的其他用户，返回待写入的记录"""
+    records = []
+    for offset, user_id in enumerate(row_ids):
+        row_start, row_end = similarities.indptr[offset], similarities.indptr[offset + 1]
+        others = similarities.indices[row_start:row_end]
+        scores = similarities.data[row_start:row_end]
+        keep = (column_ids[others] != user_id) & (scores > 0)
+        others, scores = others[keep], scores[keep]
+        if len(scores) > top_k:
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+            others, scores = others[top], scores[top]
+        records.extend(
+            dict(
+                user_id1=int(user_id),
+                user_id2=int(column_ids[j]),
+                similarity=float(score),
+                created_at=version
+            )
+            for j, score in zip(others, scores)
+        )
+    return records
+
+
+def _insert(records, batch_size=5000):
+    for start in range(0, len(records), batch_size):
+        db.session.execute(UserSimilarity.__table__.insert(), records[start:start + batch_size])
+
+
+def _compute_all(top_k, block_size, version):
+    """重新计算全部用户的相似列表"""
+    user_ids, matrix = _rating_matrix()
+    transposed = matrix.T.tocsr()
+    logger.info(f"用户相似度: 完整计算 {len(user_ids)} 个用户")
+
+    UserSimilarity.query.delete()
+    written = 0
+    for block_start in range(0, len(user_ids), block_size):
+        block = slice(block_start, block_start + block_size)
+        records = _top_rows((matrix[block] @ transposed).tocsr(), user_ids[block], user_ids, top_k, version)
+        _insert(records)
+        db.session.commit()
+        written += len(records)
+    return {'users': len(user_ids), 'records': written}
+
+
+def _compute_changed(since, top_k, block_size, version):
+    """只更新上次计算之后受评分变化影响的相似列表
+
+    变化用户和列表中包含他们的用户整行重新计算；其他用户的列表中只可能新加入变化用户，
+    相似度是对称的，用变化用户的新得分与这些用户当前的第K名比较后插入并淘汰末位，
+    做法与 MovieNeighborIndex.add_movie 相同。只读取这些用户和与他们评过同一部电影的用户的评分。
+    """
+    changed, affected = _changed_users(since)
+    refresh_ids = np.array(sorted(changed | affected), dtype=np.int64)
+    if not len(refresh_ids):
+        logger.info("用户相似度: 评分没有变化")
+        return {'users': 0, 'records': 0}
+
+    own = _ratings_by(Rating.user_id, refresh_ids)
+    movie_ids = np.unique(own[:, 1].astype(np.int64))
+    shared = _ratings_by(Rating.movie_id, movie_ids)
+    other_ids = np.unique(shared[:, 0].astype(np.int64))
+    logger.info(
+        f"用户相似度: 重新计算 {len(refresh_ids)} 个用户, 涉及 {len(movie_ids)} 部电影、{len(other_ids)} 个共同评分用户"
+    )
+
+    # 余弦相似度 = 共同电影上的点积 / 双方全部评分的范数之积
+    left = _sparse(own, refresh_ids, movie_ids)
+    left = _inverse(np.sqrt(np.asarray(left.multiply(left).sum(axis=1)).ravel())) @ left
+    right = (_inverse(_rating_norms(other_ids)) @ _sparse(shared, other_ids, movie_ids)).T.tocsr()
+
+    written = 0
+    reverse = {}
+    for block_start in range(0, len(refresh_ids), block_size):
+        block_ids = refresh_ids[block_start:block_start + block_size]
+        similarities = (left[block_start:block_start + block_size] @ right).tocsr()
+        records = _top_rows(similarities, block_ids, other_ids, top_k, version)
+
+        # 记下变化用户对其他用户的得分，即其他用户对变化用户的得分
+        for offset, user_id in enumerate(block_ids):
+            if user_id not in changed:
+                continue
+            row_start, row_end = similarities.indptr[offset], similarities.indptr[offset + 1]
+            for j, score in zip(similarities.indices[row_start:row_end], similarities.data[row_start:row_end]):
+                other_id = int(other_ids[j])
+                if score > 0 and other_id not in changed and other_id not in affected:
+                    reverse.setdefault(other_id, []).append((int(user_id), float(score)))
+
+        # 先删除这些用户原有的记录再批量插入，相当于按用户整体 upsert
+        UserSimilarity.query.filter(
+            UserSimilarity.user_id1.in_([int(u) for u in block_ids])
+        ).delete(synchronize_session=False)
+        _insert(records)
+        db.session.commit()
+        written += len(records)
+
+    # 其他用户的列表里没有变化用户，只需判断变化用户能否进入前K名
+    thresholds = _similarity_thresholds(list(reverse))
+    records, overflow = [], []
+    for other_id, entries in reverse.items():
+        count, min_similarity = thresholds.get(other_id, (0, None))
+        entries = sorted(entries, key=lambda entry: -entry[1])[:top_k]
+        if count >= top_k:
+            entries = [entry for entry in entries if entry[1] > min_similarity]
+        if not entries:
+            continue
+        records.extend(
+            dict(user_id1=other_id, user_id2=user_id, similarity=score, created_at=version)
+            for user_id, score in entries
+        )
+        if count + len(entries) > top_k:
+            overflow.append(other_id)
+    _insert(records)
+
+    # 超出K个的列表删除相似度最低的记录
+    for other_id in overflow:
+        stale_ids = [
+            row.id for row in db.session.query(UserSimilarity.id)
+            .filter(UserSimilarity.user_id1 == other_id)
+            .order_by(UserSimilarity.similarity.desc(), UserSimilarity.id)
+            .offset(top_k)
+        ]
+        if stale_ids:
+            UserSimilarity.query.filter(UserSimilarity.id.in_(stale_ids)).delete(synchronize_session=False)
+    db.session.commit()
+    written += len(records)
+    logger.info(f"用户相似度: 变化用户进入 {len({r['user_id1'] for r in records})} 个其他用户的相似列表")
+    return {'users': len(refresh_ids), 'records': written}
+
+
+def compute_user_similarities(top_k=USER_NEIGHBORS, block_size=1000, full=False):
+    """计算用户之间的相似度并写入 user_similarities 表
+
+    以分块的稀疏矩阵乘法计算余弦相似度，每个用户只保留最相似的 top_k 个用户。
+    默认只更新上次运行之后受评分变化影响的相似列表，结果与完整计算相同；
+    没有历史结果或 full=True 时重新计算全部用户。
+
+    Returns:
+        dict: 本次重新计算的用户数和写入的记录数
+    """
+    start = time.perf_counter()
+    # 以读取评分前评分表的最新时间作为本次的版本，写入 created_at；
+    # 计算期间产生的新评分时间不早于该版本，会在下一次运行时处理
+    version = _rating_version() or datetime.utcnow()
+    last_run = None if full else db.session.query(func.max(UserSimilarity.created_at)).scalar()
+
+    if last_run is None:
+        result = _compute_all(top_k, block_size, version)
+    else:
+        result = _compute_changed(last_run, top_k, block_size, version)
+
+    logger.info(f"用户相似度计算完成: 写入 {result['records']} 条记录, 耗时 {time.perf_counter() - start:.1f}s")
+    return result
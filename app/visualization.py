@@ -2,6 +2,7 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from app.models import Movie, Rating, User, MovieType
+from app.people import top_people_query
 import json
 from datetime import datetime, timedelta
 from sqlalchemy import func, extract, and_, text
@@ -67,20 +68,11 @@ class MovieVisualizer:
         return [self._row_to_dict(row) for row in results]
 
     def get_top_directors(self, limit=10):
-        """获取评分最高的导演统计"""
-        results = self.db.session.query(
-            Movie.directors,
-            func.count(Movie.id).label('movie_count'),
-            func.avg(Movie.rating).label('avg_rating')
-        ).filter(Movie.directors != '')\
-         .group_by(Movie.directors)\
-         .having(func.count(Movie.id) >= 3)\
-         .order_by(func.avg(Movie.rating).desc())\
-         .limit(limit)\
-         .all()
+        """获取评分最高的导演统计，每位导演单独统计，至少3部电影"""
+        results = top_people_query('director', min_movies=3).limit(limit).all()
         return [
             {
-                'directors': row.directors,
+                'directors': row.name,
                 'movie_count': row.movie_count,
                 'avg_rating': float(row.avg_rating) if row.avg_rating else 0
             }
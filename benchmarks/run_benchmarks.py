@@ -0,0 +1,229 @@
+"""推荐、可视化和热点路由的性能基准
+
+在不同规模的合成数据集上运行各项操作，记录耗时和 SQL 语句数量，结果保存为 JSON，
+便于比较不同提交之间的性能变化。
+
+用法:
+    python benchmarks/run_benchmarks.py --size small --size medium
+    python benchmarks/run_benchmarks.py --size small --compare benchmarks/results/small-<commit>.json
+
+数据集首次使用时由 flask generate-data 的生成器创建，保存在 benchmarks/data/<size>.db，之后重复使用。
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import statistics
+import subprocess
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flask_login import FlaskLoginClient
+from config import Config
+from app import create_app, db
+from app.models import Movie, User, Rating, Favorite
+from app.recommender import MovieRecommender
+from app.hybrid import GenrePopularity
+from app.collaborative import ItemBasedCF
+from app.visualization import MovieVisualizer
+from app.neighbor_index import MovieNeighborIndex
+from app.search_index import get_movie_search
+from app.typeahead import get_movie_typeahead
+from app.synthetic import SyntheticDataGenerator
+from app.profiling import QueryCounter
+from app.pagination import encode_cursor
+
+DATA_DIR = os.path.join(ROOT, 'benchmarks', 'data')
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+# 数据集规模：电影数、用户数、每用户平均评分数
+DATASETS = {
+    'small': {'movies': 1000, 'users': 200, 'ratings_per_user': 20},
+    'medium': {'movies': 10000, 'users': 2000, 'ratings_per_user': 50},
+    'large': {'movies': 50000, 'users': 10000, 'ratings_per_user': 50}
+}
+
+
+def make_config(size):
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(DATA_DIR, f'{size}.db')}"
+        SQLALCHEMY_ECHO = False
+        TESTING = True
+        ARTIFACT_DIR = os.path.join(DATA_DIR, f'{size}-artifacts')
+    return BenchmarkConfig
+
+
+def prepare_dataset(app, size):
+    """数据集不存在时生成数据并建立相似电影索引"""
+    with app.app_context():
+        db.create_all()
+        if Movie.query.first() is not None:
+            return
+        print(f"正在生成 {size} 数据集: {DATASETS[size]}")
+        SyntheticDataGenerator(seed=0, prefix='bench', **DATASETS[size]).run()
+        MovieNeighborIndex().build()
+
+
+def measure(func, engine, repeat):
+    """预热一次后重复执行 repeat 次，返回耗时统计和单次调用的 SQL 语句数量"""
+    func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    with QueryCounter(engine) as counter:
+        func()
+    return {
+        'min_ms': round(min(timings), 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'queries': counter.count,
+        'query_ms': round(counter.seconds * 1000, 3)
+    }
+
+
+def benchmark_cases(app):
+    """返回 {操作名: 无参函数}，函数在应用上下文中执行"""
+    recommender = MovieRecommender()
+    visualizer = MovieVisualizer(db)
+    # 协同过滤模型和混合推荐的类型热门榜由离线任务发布，没有发布时在这里构建
+    if recommender.get_cf_model() is None:
+        recommender.cf_model = ItemBasedCF.from_database()
+    if recommender.get_genre_popularity() is None:
+        recommender.genre_popularity = GenrePopularity.build()
+
+    # 选择评分和收藏都较多的用户，以及热门电影作为基准对象
+    user = User.query.join(Favorite).group_by(User.id).order_by(db.func.count(Favorite.id).desc()).first()
+    movie = Movie.query.order_by(Movie.rating_count.desc()).first()
+    client = app.test_client(user=user)
+    # 搜索和自动补全索引在后台构建，先等待构建完成
+    get_movie_search().get_index(wait=True)
+    get_movie_typeahead().get_index(wait=True)
+    # 列表页使用键集分页，第 10 页的游标由第 9 页最后一部电影生成
+    with app.test_request_context():
+        last_id = db.session.query(Movie.id).order_by(Movie.id).offset(20 * 9 - 1).limit(1).scalar()
+        page_10 = encode_cursor('movies:id', [last_id], 'next')
+
+    def get(url):
+        def request():
+            response = client.get(url)
+            if response.status_code >= 400:
+                raise RuntimeError(f'{url} 返回 {response.status_code}')
+        return request
+
+    cases = {
+        'recommender.get_similar_movies': lambda: recommender.get_similar_movies(movie.id),
+        'recommender.compute_similar_movies': lambda: recommender.compute_similar_movies(movie.id),
+        'recommender.get_favorite_type_recommendations':
+            lambda: recommender.get_favorite_type_recommendations(user.id),
+        'recommender.get_personalized_recommendations':
+            lambda: recommender.get_personalized_recommendations(user.id),
+        'recommender.get_hybrid_recommendations': lambda: recommender.get_hybrid_recommendations(user.id),
+        'search.search': lambda: get_movie_search().search(movie.title[:4]),
+        'typeahead.suggest': lambda: get_movie_typeahead().suggest(movie.title[:2]),
+    }
+    for name in sorted(dir(visualizer)):
+        if name.startswith('get_') and callable(getattr(visualizer, name)):
+            cases[f'visualizer.{name}'] = getattr(visualizer, name)
+    cases.update({
+        'route.rating_heatmap': get('/movies/api/visualizations/rating-heatmap'),
+        'route.movie_list': get('/movies/'),
+        'route.movie_list_page_10': get(f'/movies/?cursor={page_10}'),
+        'route.search_movies': get('/movies/search?q=' + movie.title[:4]),
+        'route.typeahead': get('/movies/api/typeahead?q=' + movie.title[:2]),
+        'route.movie_poster': get(f'/movies/poster/{movie.id}'),
+        'route.movie_detail': get(f'/movies/{movie.id}'),
+    })
+    return cases
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return 'unknown'
+
+
+def run(size, repeat, only=None):
+    app = create_app(make_config(size))
+    app.test_client_class = FlaskLoginClient
+    prepare_dataset(app, size)
+
+    results = {}
+    with app.app_context():
+        for name, func in benchmark_cases(app).items():
+            if only and not any(pattern in name for pattern in only):
+                continue
+            try:
+                results[name] = measure(func, db.engine, repeat)
+            except Exception as e:
+                db.session.rollback()
+                results[name] = {'error': str(e)}
+            print(f"  {name:<55} {format_result(results[name])}")
+        counts = {
+            'movies': Movie.query.count(),
+            'users': User.query.count(),
+            'ratings': Rating.query.count()
+        }
+
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'dataset': dict(name=size, **counts),
+        'repeat': repeat,
+        'results': results
+    }
+
+
+def format_result(result):
+    if 'error' in result:
+        return f"失败: {result['error'][:60]}"
+    return f"{result['median_ms']:>10.2f} ms {result['queries']:>6} 条SQL"
+
+
+def compare(report, baseline_path):
+    """与之前保存的结果比较，打印耗时比值和 SQL 数量变化"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\n与 {baseline['commit']} ({baseline_path}) 比较:")
+    for name, result in report['results'].items():
+        old = baseline['results'].get(name)
+        if not old or 'error' in old or 'error' in result:
+            continue
+        ratio = result['median_ms'] / old['median_ms'] if old['median_ms'] else float('inf')
+        print(f"  {name:<55} {old['median_ms']:>9.2f} -> {result['median_ms']:>9.2f} ms "
+              f"(x{ratio:.2f})  SQL {old['queries']} -> {result['queries']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='运行性能基准并保存 JSON 结果')
+    parser.add_argument('--size', action='append', choices=list(DATASETS), help='数据集规模，可重复指定，默认 small')
+    parser.add_argument('--repeat', type=int, default=5, help='每项操作重复次数')
+    parser.add_argument('--only', action='append', help='只运行名称包含该字符串的操作')
+    parser.add_argument('--compare', help='与之前保存的 JSON 结果比较')
+    parser.add_argument('--output-dir', default=RESULTS_DIR, help='结果保存目录')
+    args = parser.parse_args()
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    os.makedirs(args.output_dir, exist_ok=True)
+    for size in args.size or ['small']:
+        print(f"数据集 {size}:")
+        report = run(size, args.repeat, args.only)
+        path = os.path.join(args.output_dir, f"{size}-{report['commit']}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {path}")
+        if args.compare:
+            compare(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,2 @@
+-- 新电影入库时按 neighbor_id 删除它在其他电影列表中的旧记录
+CREATE INDEX ix_movie_neighbors_neighbor ON movie_neighbors (neighbor_id);
@@ -0,0 +1,17 @@
+-- 创建相似电影索引表
+CREATE TABLE IF NOT EXISTS movie_neighbors (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    movie_id INT NOT NULL,
+    neighbor_id INT NOT NULL,
+    similarity FLOAT NOT NULL,
+    type_similarity FLOAT,
+    year_similarity FLOAT,
+    rating_similarity FLOAT,
+    duration_similarity FLOAT,
+    language_similarity FLOAT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (movie_id) REFERENCES movies(id) ON DELETE CASCADE,
+    FOREIGN KEY (neighbor_id) REFERENCES movies(id) ON DELETE CASCADE,
+    UNIQUE KEY unique_movie_neighbor (movie_id, neighbor_id),
+    KEY ix_movie_neighbors_movie_similarity (movie_id, similarity)
+);
@@ -0,0 +1,14 @@
+-- 电影的用户评分总和与人数，评分时同步更新
+ALTER TABLE movies
+    ADD COLUMN user_rating_sum DOUBLE NOT NULL DEFAULT 0,
+    ADD COLUMN user_rating_count INT NOT NULL DEFAULT 0;
+
+-- 按已有评分初始化，之后可以用 flask reconcile-ratings 对账
+UPDATE movies m
+JOIN (
+    SELECT movie_id, SUM(rating) AS total, COUNT(*) AS cnt
+    FROM ratings
+    GROUP BY movie_id
+) r ON r.movie_id = m.id
+SET m.user_rating_sum = r.total,
+    m.user_rating_count = r.cnt;
@@ -0,0 +1,24 @@
+-- 导演、编剧、演员拆分为人物表和电影人物关联表，添加后运行 flask backfill-people 回填已有电影
+CREATE TABLE IF NOT EXISTS people (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    -- 二进制排序规则：大小写或重音不同的名字是不同的人，与应用中按名字查找的结果一致
+    name VARCHAR(100) COLLATE utf8mb4_bin NOT NULL,
+    UNIQUE KEY unique_person_name (name)
+);
+
+CREATE TABLE IF NOT EXISTS movie_people (
+    movie_id INT NOT NULL,
+    person_id INT NOT NULL,
+    role VARCHAR(20) NOT NULL,
+    position INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (movie_id, person_id, role),
+    FOREIGN KEY (movie_id) REFERENCES movies(id) ON DELETE CASCADE,
+    FOREIGN KEY (person_id) REFERENCES people(id) ON DELETE CASCADE,
+    -- 按角色统计人物（如导演排行），以及某人担任某角色的电影
+    KEY ix_movie_people_role_person (role, person_id, movie_id),
+    -- 某人参与的全部电影
+    KEY ix_movie_people_person_movie (person_id, movie_id)
+);
+
+-- 导演统计改为按人物分组，不再需要按整个导演字符串分组的索引
+DROP INDEX ix_movies_directors ON movies;
@@ -0,0 +1,2 @@
+-- 海报文件保存在文件库中，数据库只记录内容摘要
+ALTER TABLE movies ADD COLUMN poster_digest VARCHAR(64);
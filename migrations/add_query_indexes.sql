@@ -0,0 +1,21 @@
+-- 按页面和统计查询的筛选、排序条件添加索引，可用 flask explain-queries 检查执行计划
+
+-- 按年份统计数量和平均分
+CREATE INDEX ix_movies_year_rating ON movies (year, rating);
+-- 按评分筛选和排序，热门度计算同时需要评分人数
+CREATE INDEX ix_movies_rating ON movies (rating, rating_count);
+-- 导演统计
+CREATE INDEX ix_movies_directors ON movies (directors);
+
+-- 按类型查电影，主键 (movie_id, type_id) 只能按电影查类型
+CREATE INDEX ix_movie_type_association_type_movie ON movie_type_association (type_id, movie_id);
+
+-- 我的评分页按用户筛选、按时间倒序
+CREATE INDEX ix_ratings_user_created ON ratings (user_id, created_at);
+-- 活动热力图按时间范围筛选，离线评估按时间切分
+CREATE INDEX ix_ratings_created_at ON ratings (created_at);
+
+-- 收藏页按用户筛选、按时间倒序
+CREATE INDEX ix_favorites_user_created ON favorites (user_id, created_at);
+-- 离线评估按时间切分
+CREATE INDEX ix_favorites_created_at ON favorites (created_at);
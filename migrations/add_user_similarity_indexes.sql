@@ -0,0 +1,9 @@
+-- 用户相似度表的索引，按用户读取相似列表时使用
+CREATE INDEX ix_user_similarities_user_similarity ON user_similarities (user_id1, similarity);
+CREATE INDEX ix_user_similarities_user2 ON user_similarities (user_id2);
+
+-- 记录评分的修改时间，用于增量计算用户相似度
+-- 由应用写入（与 created_at 同为 UTC），不使用数据库时钟的默认值；已有记录为空，按 created_at 计算
+-- 由 init_tables.sql 创建的 ratings 表已包含该列，可跳过这一句
+ALTER TABLE ratings ADD COLUMN updated_at DATETIME NULL;
+CREATE INDEX ix_ratings_updated_at ON ratings (updated_at);
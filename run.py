@@ -1,6 +1,25 @@
 from app import create_app, db
 from app.models import User, Movie, MovieType, Rating, UserSimilarity
 from app.douban_spider import init_movies
+from app.neighbor_index import MovieNeighborIndex, NEIGHBOR_COUNT
+from app.user_similarity import compute_user_similarities, USER_NEIGHBORS
+from app.collaborative import ItemBasedCF, CF_NEIGHBORS, load_interactions
+from app.feature_store import MovieFeatureStore
+from app.hybrid import GenrePopularity
+from app.artifacts import get_artifact_store
+from app.rating_aggregates import reconcile_rating_aggregates, RECONCILE_BATCH_SIZE
+from app.query_plans import explain_queries, QUERY_PATTERNS
+from app.search_index import MovieSearchIndex
+from app.people import backfill_movie_people, BACKFILL_BATCH_SIZE
+from app.poster_store import get_poster_store, build_poster_variants
+from app.als import ALSModel, ALS_FACTORS, ALS_ITERATIONS, ALS_REGULARIZATION, ALS_ALPHA
+from app.evaluation import (evaluate as evaluate_recommenders, STRATEGIES,
+                            EVAL_K, EVAL_TEST_FRACTION, EVAL_MAX_USERS, EVAL_RELEVANT_RATING)
+from app.synthetic import (SyntheticDataGenerator, SYNTHETIC_MOVIES, SYNTHETIC_USERS, SYNTHETIC_RATINGS_PER_USER,
+                           SYNTHETIC_FAVORITE_RATE, SYNTHETIC_ZIPF, SYNTHETIC_DAYS, SYNTHETIC_BATCH_SIZE,
+                           SYNTHETIC_PASSWORD)
+import click
+import json
 
 app = create_app()
 
@@ -27,5 +46,190 @@ def make_shell_context():
         'init_movies': init_movies
     }
 
+@app.cli.command('build-neighbors')
+@click.option('--k', default=NEIGHBOR_COUNT, show_default=True, help='每部电影保存的相似电影数量')
+def build_neighbors(k):
+    """重建相似电影索引"""
+    total = MovieNeighborIndex(k=k).build()
+    click.echo(f"相似电影索引构建完成，共 {total} 条记录")
+
+@app.cli.command('compute-user-similarity')
+@click.option('--top-k', default=USER_NEIGHBORS, show_default=True, help='每个用户保存的相似用户数量')
+@click.option('--block-size', default=1000, show_default=True, help='每批计算的用户数')
+@click.option('--full', is_flag=True, help='重新计算全部用户，默认只计算评分有变化的用户')
+def compute_user_similarity(top_k, block_size, full):
+    """计算用户相似度并写入 user_similarities 表"""
+    result = compute_user_similarities(top_k=top_k, block_size=block_size, full=full)
+    click.echo(f"已计算 {result['users']} 个用户，写入 {result['records']} 条记录")
+
+@app.cli.command('publish-artifacts')
+@click.option('--cf-neighbors', default=CF_NEIGHBORS, show_default=True, help='协同过滤每部电影保留的相似电影数量')
+def publish_artifacts(cf_neighbors):
+    """构建电影特征库、协同过滤模型和类型热门榜并发布到模型文件库，运行中的进程会自动加载新版本"""
+    store = get_artifact_store()
+    version = store.publish('features', *MovieFeatureStore.load().to_artifact())
+    click.echo(f"电影特征库已发布，版本 {version}")
+    version = store.publish('cf', *ItemBasedCF.from_database(neighbors=cf_neighbors).to_artifact())
+    click.echo(f"协同过滤模型已发布，版本 {version}")
+    version = store.publish('popularity', *GenrePopularity.build().to_artifact())
+    click.echo(f"类型热门榜已发布，版本 {version}")
+
+@app.cli.command('train-als')
+@click.option('--factors', default=ALS_FACTORS, show_default=True, help='隐因子维数')
+@click.option('--iterations', default=ALS_ITERATIONS, show_default=True, help='迭代轮数')
+@click.option('--regularization', default=ALS_REGULARIZATION, show_default=True, help='正则化系数')
+@click.option('--alpha', default=ALS_ALPHA, show_default=True, help='隐式反馈的置信度系数')
+@click.option('--explicit', is_flag=True, help='只用评分按显式反馈训练，默认评分和收藏都作为隐式反馈')
+@click.option('--workers', default=None, type=int, help='并行求解的线程数，默认等于CPU核数')
+def train_als(factors, iterations, regularization, alpha, explicit, workers):
+    """离线训练 ALS 矩阵分解模型并发布到模型文件库"""
+    # 收藏没有评分，显式模式下只使用评分记录
+    user_ids, movie_ids, values = load_interactions(include_favorites=not explicit)
+    if len(values) == 0:
+        click.echo("没有评分或收藏记录，无法训练")
+        return
+    model = ALSModel(factors=factors, iterations=iterations, regularization=regularization,
+                     alpha=alpha, implicit=not explicit, workers=workers)
+    model.fit(user_ids, movie_ids, values)
+    version = get_artifact_store().publish('als', *model.to_artifact())
+    click.echo(f"ALS 模型已发布，版本 {version}，训练耗时 {model.metadata['training_seconds']}s")
+
+@app.cli.command('evaluate')
+@click.option('--k', default=EVAL_K, show_default=True, help='推荐列表长度')
+@click.option('--test-fraction', default=EVAL_TEST_FRACTION, show_default=True, help='按时间切分出的测试集比例')
+@click.option('--users', 'max_users', default=EVAL_MAX_USERS, show_default=True, help='最多评估的用户数，0 表示全部')
+@click.option('--relevant-rating', default=EVAL_RELEVANT_RATING, show_default=True, help='测试集中视为喜欢的最低评分')
+@click.option('--strategy', 'strategies', multiple=True, type=click.Choice(list(STRATEGIES)),
+              help='要评估的推荐策略，可重复指定，默认全部')
+@click.option('--output', type=click.Path(dir_okay=False), help='将结果保存为 JSON 文件')
+def evaluate(k, test_fraction, max_users, relevant_rating, strategies, output):
+    """离线评估推荐策略的准确率、覆盖率、延迟和内存"""
+    info, results = evaluate_recommenders(
+        strategies=strategies or None, k=k, test_fraction=test_fraction,
+        max_users=max_users, relevant_rating=relevant_rating
+    )
+    click.echo(f"切分时间 {info['cutoff']}，训练记录 {info['train_interactions']} 条，"
+               f"评估用户 {info['evaluated_users']}/{info['eligible_users']}")
+    columns = list(results[0]) if results else []
+    click.echo('  '.join(f'{column:>14}' for column in columns))
+    for result in results:
+        click.echo('  '.join(f'{str(result[column]):>14}' for column in columns))
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({'split': info, 'results': results}, f, ensure_ascii=False, indent=2)
+        click.echo(f"结果已保存到 {output}")
+
+@app.cli.command('generate-data')
+@click.option('--movies', default=SYNTHETIC_MOVIES, show_default=True, help='电影数量')
+@click.option('--users', default=SYNTHETIC_USERS, show_default=True, help='用户数量')
+@click.option('--ratings-per-user', default=SYNTHETIC_RATINGS_PER_USER, show_default=True, help='每个用户平均评分数')
+@click.option('--favorite-rate', default=SYNTHETIC_FAVORITE_RATE, show_default=True, help='高分电影被收藏的比例')
+@click.option('--zipf', default=SYNTHETIC_ZIPF, show_default=True, help='电影热度 Zipf 分布的指数')
+@click.option('--days', default=SYNTHETIC_DAYS, show_default=True, help='评分时间分布的天数')
+@click.option('--posters/--no-posters', default=True, show_default=True, help='是否生成假海报并写入海报文件库')
+@click.option('--seed', default=0, show_default=True, help='随机数种子')
+@click.option('--batch-size', default=SYNTHETIC_BATCH_SIZE, show_default=True, help='每批 INSERT 的行数')
+@click.option('--prefix', default=None, help='豆瓣ID和用户名前缀，默认按时间生成')
+def generate_data(movies, users, ratings_per_user, favorite_rate, zipf, days, posters, seed, batch_size, prefix):
+    """生成合成的电影、用户、评分和收藏数据，用于压测和性能分析"""
+    generator = SyntheticDataGenerator(
+        movies=movies, users=users, ratings_per_user=ratings_per_user, favorite_rate=favorite_rate,
+        zipf=zipf, days=days, posters=posters, seed=seed, batch_size=batch_size, prefix=prefix
+    )
+    counts = generator.run()
+    click.echo(f"已生成 {counts['movies']} 部电影、{counts['users']} 个用户、"
+               f"{counts['ratings']} 条评分、{counts['favorites']} 条收藏，前缀 {generator.prefix}，"
+               f"合成用户密码 {SYNTHETIC_PASSWORD}")
+
+@app.cli.command('migrate-posters')
+@click.option('--batch-size', default=200, show_default=True, help='每批迁移的电影数')
+@click.option('--clear-blobs', is_flag=True, help='迁移后清空数据库中的海报数据')
+def migrate_posters(batch_size, clear_blobs):
+    """把数据库中的海报数据迁移到海报文件库"""
+    store = get_poster_store()
+    last_id, migrated = 0, 0
+    while True:
+        rows = db.session.query(Movie.id, Movie.poster_data, Movie.poster_mimetype).filter(
+            Movie.id > last_id,
+            Movie.poster_data.isnot(None),
+            Movie.poster_digest.is_(None)
+        ).order_by(Movie.id).limit(batch_size).all()
+        if not rows:
+            break
+        for movie_id, poster_data, mimetype in rows:
+            values = {'poster_digest': store.save(poster_data, mimetype)}
+            if clear_blobs:
+                values['poster_data'] = None
+            Movie.query.filter_by(id=movie_id).update(values, synchronize_session=False)
+        db.session.commit()
+        last_id = rows[-1].id
+        migrated += len(rows)
+        click.echo(f"已迁移 {migrated} 张海报")
+    click.echo(f"迁移完成，共 {migrated} 张海报，文件库位于 {store.root}，"
+               f"可以运行 flask build-poster-variants 生成缩略图")
+
+@app.cli.command('build-poster-variants')
+@click.option('--workers', default=None, type=int, help='进程数，默认为 CPU 核数')
+@click.option('--batch-size', default=1000, show_default=True, help='每批提交给进程池的海报数')
+@click.option('--force', is_flag=True, help='重新生成已存在的缩略图')
+def build_poster_variants_command(workers, batch_size, force):
+    """为文件库中已有的海报生成各尺寸的 WebP 和 JPEG 缩略图"""
+    last_digest, total, written, failed = '', 0, 0, 0
+    while True:
+        rows = db.session.query(Movie.poster_digest, db.func.min(Movie.poster_mimetype)).filter(
+            Movie.poster_digest > last_digest
+        ).group_by(Movie.poster_digest).order_by(Movie.poster_digest).limit(batch_size).all()
+        if not rows:
+            break
+        batch_written, batch_failed = build_poster_variants(rows, workers=workers, force=force)
+        last_digest = rows[-1][0]
+        total += len(rows)
+        written += batch_written
+        failed += batch_failed
+        click.echo(f"已处理 {total} 张海报，生成 {written} 个缩略图，失败 {failed} 张")
+    click.echo(f"完成，共处理 {total} 张海报")
+
+@app.cli.command('reconcile-ratings')
+@click.option('--batch-size', default=RECONCILE_BATCH_SIZE, show_default=True, help='每批检查的电影ID范围')
+def reconcile_ratings(batch_size):
+    """按评分表重新计算电影的用户评分总和与人数"""
+    fixed = reconcile_rating_aggregates(batch_size=batch_size)
+    click.echo(f"对账完成，修正 {fixed} 部电影的评分汇总")
+
+@app.cli.command('explain-queries')
+@click.option('--query', 'names', multiple=True, type=click.Choice(list(QUERY_PATTERNS)), help='只检查指定的查询，可重复')
+def explain_queries_command(names):
+    """对页面和统计查询执行 EXPLAIN，标出意外的全表扫描
+
+    应在接近生产规模的数据上运行，例如先执行 flask generate-data。
+    """
+    reports = explain_queries(names)
+    for report in reports:
+        flag = '  <-- 全表扫描' if report['full_scan'] else ''
+        click.echo(f"{report['name']}{flag}")
+        if 'error' in report:
+            click.echo(f"    失败: {report['error']}")
+        for table, detail, _ in report['plan']:
+            click.echo(f"    {table:<24} {detail}")
+    full_scans = [report['name'] for report in reports if report['full_scan']]
+    if full_scans:
+        click.echo(f"\n{len(full_scans)} 个查询存在全表扫描: {', '.join(full_scans)}")
+        raise SystemExit(1)
+    click.echo(f"\n检查了 {len(reports)} 个查询，没有意外的全表扫描")
+
+@app.cli.command('build-search-index')
+def build_search_index():
+    """构建电影搜索索引并发布到模型文件库，运行中的进程会自动加载新版本"""
+    index = MovieSearchIndex.load()
+    version = get_artifact_store().publish('search', *index.to_artifact())
+    click.echo(f"搜索索引已发布，共 {len(index)} 部电影、{len(index.terms)} 个词项，版本 {version}")
+
+@app.cli.command('backfill-people')
+@click.option('--batch-size', default=BACKFILL_BATCH_SIZE, show_default=True, help='每批处理的电影ID范围')
+def backfill_people(batch_size):
+    """按电影的导演、编剧、演员字段填充人物表和电影人物关联表，可以重复运行"""
+    result = backfill_movie_people(batch_size=batch_size)
+    click.echo(f"已处理 {result['movies']} 部电影，写入 {result['credits']} 条关联，共 {result['people']} 位人物")
+
 if __name__ == '__main__':
-    app.run(debug=True) 
\ No newline at end of file
+    app.run(debug=True)
@@ -0,0 +1,50 @@
+from app import create_app, db
+from app.models import User, Favorite, MovieType
+from app.profiling import assert_max_queries
+from app.search_index import get_movie_search
+from flask_login import FlaskLoginClient
+
+# 各页面允许执行的 SQL 语句上限，与每页显示的电影数量无关
+# 包含 Flask-Login 加载当前用户的一条查询
+PAGE_QUERY_BUDGETS = {
+    '/movies/': 5,
+    '/movies/?sort=rating': 5,
+    '/movies/type/{type_name}': 5,
+    '/movies/favorites': 3,
+    '/movies/user_ratings': 3,
+    '/movies/search?q={title}': 3,
+    '/movies/{movie_id}': 5,
+}
+
+def test_query_counts():
+    """测试列表和推荐页面没有 N+1 查询"""
+    app = create_app()
+    app.test_client_class = FlaskLoginClient
+    with app.app_context():
+        # 选择收藏最多的用户，保证收藏页有足够多的电影
+        user = User.query.join(Favorite).group_by(User.id).order_by(db.func.count(Favorite.id).desc()).first()
+        if not user:
+            print("错误：没有收藏数据，请先运行 flask generate-data")
+            return
+        movie = Favorite.query.filter_by(user_id=user.id).first().movie
+        movie_type = MovieType.query.first()
+        params = {'type_name': movie_type.name if movie_type else '', 'title': movie.title, 'movie_id': movie.id}
+        # 搜索索引在后台构建，先等待构建完成
+        get_movie_search().get_index(wait=True)
+        engine = db.engine
+
+    # 每个请求使用自己的应用上下文和数据库会话，与实际运行时一致
+    client = app.test_client(user=user)
+    for url, budget in PAGE_QUERY_BUDGETS.items():
+        url = url.format(**params)
+        # 先请求一次，让推荐缓存等进程内缓存生效，只统计稳定状态下的查询
+        client.get(url)
+        with assert_max_queries(engine, budget) as counter:
+            response = client.get(url)
+        assert response.status_code == 200, f"{url} 返回 {response.status_code}"
+        print(f"- {url}: {counter.count} 条 SQL（上限 {budget}）")
+
+if __name__ == '__main__':
+    print("开始测试页面查询数量...")
+    test_query_counts()
+    print("\n页面查询数量测试完成！")